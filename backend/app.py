@@ -3,16 +3,33 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from config import Config
 from models import db
+from utils.db_pool import build_engine_options, install_transaction_statement_timeout
+from utils.db_routing import replica_binds
+from utils.metrics import init_metrics
+from utils.schema import upgrade_schema
+from services.events import check_broker
 from routes.auth import auth_bp
 from routes.users import users_bp
 from routes.bookings import bookings_bp
 from routes.subscriptions import subscriptions_bp
 from routes.admin import admin_bp
-from services.scheduler import start_scheduler
+from routes.health import health_bp
 
-def create_app():
+def create_app(scheduler_enabled: bool = None):
+    """
+    Build the app. Schema creation is left to init_db.py, and optional
+    subsystems (scheduler, Playwright, Stripe, SendGrid) are imported when
+    first used, so worker boot stays cheap.
+    """
+    if scheduler_enabled is None:
+        scheduler_enabled = Config.SCHEDULER_ENABLED
+    
     app = Flask(__name__)
     app.config.from_object(Config)
+    # The frontend calls collection routes without a trailing slash
+    app.url_map.strict_slashes = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(Config)
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(Config)
     
     # Initialize extensions
     # Configure CORS to allow frontend access
@@ -25,6 +42,11 @@ def create_app():
          expose_headers=["Content-Type", "Authorization"])
     db.init_app(app)
     JWTManager(app)
+    init_metrics(app)
+    
+    if Config.DB_PGBOUNCER_MODE and Config.DB_STATEMENT_TIMEOUT_MS:
+        with app.app_context():
+            install_transaction_statement_timeout(db.engine, Config.DB_STATEMENT_TIMEOUT_MS)
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -32,13 +54,15 @@ def create_app():
     app.register_blueprint(bookings_bp, url_prefix='/api/bookings')
     app.register_blueprint(subscriptions_bp, url_prefix='/api/subscriptions')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(health_bp, url_prefix='/health')
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Warn if SSE status events cannot cross worker processes
+    check_broker()
     
     # Start booking scheduler
-    start_scheduler(app)
+    if scheduler_enabled:
+        from services.scheduler import start_scheduler
+        start_scheduler(app)
     
     @app.route('/')
     def index():
@@ -59,6 +83,13 @@ def create_app():
     
     return app
 
+def init_db(app):
+    """Create missing tables and apply schema upgrades; run once per deploy (init_db.py), not in every worker"""
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine, db.metadata)
+
 if __name__ == '__main__':
     app = create_app()
+    init_db(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
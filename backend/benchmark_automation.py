@@ -0,0 +1,100 @@
+"""
+End-to-end latency benchmark for the booking automation.
+
+Runs BookingAutomation in dry-run mode (everything up to the confirm click)
+and reports per-step timings. With --har the target site is served from a
+recorded HAR file through Playwright routing, so runs are deterministic and
+need no network access; --record captures such a file from a live or
+staging site.
+
+Usage:
+  python benchmark_automation.py --record recordings/site.har --site-url https://staging.example.com --username u --password p
+  python benchmark_automation.py --har recordings/site.har --site-url https://staging.example.com --runs 20 [--max-p95-ms 8000]
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+from app import create_app
+from models import BookingRequest
+from services.booking_automation import BookingAutomation
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0
+
+def sample_booking(args) -> BookingRequest:
+    """Transient booking for the benchmark; it is never added to the session"""
+    return BookingRequest(
+        id=None,
+        user_id=None,
+        origin=args.origin,
+        destination=args.destination,
+        departure_date=date.today() + timedelta(days=args.days_ahead),
+        passengers=1,
+        attempt_count=1
+    )
+
+def run_once(app, args, record_har=None) -> dict:
+    automation = BookingAutomation(
+        sample_booking(args), app.app_context(),
+        replay_har=args.har, record_har=record_har, site_url=args.site_url
+    )
+    automation.tracer.artifact_mode = 'off'
+    return automation.rehearse(args.username, args.password)
+
+def summarize(results) -> dict:
+    """p50/p95 in ms for the whole run and for each step"""
+    totals = [result['trace']['duration_ms'] for result in results]
+    steps = {}
+    for result in results:
+        for step in result['trace']['steps']:
+            steps.setdefault(step['name'], []).append(step['duration_ms'])
+    
+    return {
+        'total': (percentile(totals, 0.5), percentile(totals, 0.95)),
+        'steps': {name: (percentile(values, 0.5), percentile(values, 0.95)) for name, values in steps.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the booking automation in dry-run mode')
+    parser.add_argument('--har', help='replay the site from this HAR file')
+    parser.add_argument('--record', help='record a HAR file from the live site instead of benchmarking')
+    parser.add_argument('--site-url', help='target site URL (defaults to TARGET_TRAVEL_SITE_URL)')
+    parser.add_argument('--username', default='benchmark')
+    parser.add_argument('--password', default='benchmark')
+    parser.add_argument('--origin', default='New York')
+    parser.add_argument('--destination', default='Tokyo')
+    parser.add_argument('--days-ahead', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-p95-ms', type=int, help='exit non-zero if total p95 exceeds this')
+    args = parser.parse_args()
+    
+    app = create_app(scheduler_enabled=False)
+    
+    if args.record:
+        result = run_once(app, args, record_har=args.record)
+        print(f"Recorded {args.record}: {result['message']}")
+        return 0 if result['success'] else 1
+    
+    results = []
+    for i in range(args.runs):
+        result = run_once(app, args)
+        if not result['success']:
+            print(f"Run {i + 1} failed: {result['message']}")
+            return 1
+        results.append(result)
+    
+    summary = summarize(results)
+    print(f"{'step':<12} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, (p50, p95) in summary['steps'].items():
+        print(f"{name:<12} {p50:>8} {p95:>8}")
+    p50, p95 = summary['total']
+    print(f"{'total':<12} {p50:>8} {p95:>8}")
+    
+    if args.max_p95_ms and p95 > args.max_p95_ms:
+        print(f"Total p95 {p95}ms exceeds budget of {args.max_p95_ms}ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
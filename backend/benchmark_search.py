@@ -0,0 +1,140 @@
+"""
+Admin booking search benchmark.
+
+Runs representative admin searches against the configured database, which
+is meant to be filled by generate_load_data.py (e.g. 10M bookings), and
+reports p50/p95 latency of each. It also checks every query plan: a
+sequential scan of booking_requests fails the run even when it is fast on
+a small table. Deep pages are measured by following next_cursor, so they
+exercise the keyset comparison rather than the first page only.
+tests/test_api.py runs the plan check as a regression test.
+
+Usage:
+  python generate_load_data.py --users 100000 --bookings 10000000
+  python benchmark_search.py [--runs 20] [--pages 50] [--max-p95-ms 100]
+  python benchmark_search.py --generate 100000   # fill the database first
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import text
+from app import create_app, init_db
+from generate_load_data import EMAIL_TEMPLATE, generate_bookings, generate_users
+from models import db
+from services.booking_search import build_query, encode_cursor, search_bookings
+
+DEFAULT_MAX_P95_MS = 100
+
+# Admin searches ops run; text filters use values the load generator produces
+QUERIES = {
+    'route_prefix': {'origin': 'los', 'destination': 'tok', 'status': 'failed'},
+    'route_contains': {'origin': 'angel', 'match': 'contains'},
+    'status': {'status': 'failed,canceled'},
+    'scheduled_range': {'scheduled_from': '2020-01-01', 'scheduled_to': '2040-01-01'},
+    'departure_range': {'departure_from': '2020-01-01', 'departure_to': '2040-01-01', 'status': 'pending'},
+    'result_message': {'result_message': 'no booking options'},
+    'email': {'email': EMAIL_TEMPLATE.format(0)},
+    'all': {},
+}
+
+def query_plan(args: dict, limit: int = 50) -> str:
+    """The database's plan for one page of a search"""
+    query = build_query(args, db.engine.dialect.name).limit(limit + 1)
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    return '\n'.join(str(row[-1]) for row in db.session.execute(text(prefix + sql)))
+
+def full_scans(plan: str) -> list:
+    """Plan lines that read the whole booking_requests table"""
+    return [
+        line for line in plan.splitlines()
+        if 'Seq Scan on booking_requests' in line
+        or (line.strip().startswith('SCAN booking_requests') and 'USING' not in line)
+    ]
+
+def check_plans(queries: dict = None) -> dict:
+    """name -> full-scan plan lines, for the queries that have any, first and deep pages alike"""
+    failures = {}
+    for name, args in (queries or QUERIES).items():
+        for page_args in (args, dict(args, cursor=_sample_cursor())):
+            scans = full_scans(query_plan(page_args))
+            if scans:
+                failures[name] = scans
+    return failures
+
+def _sample_cursor() -> str:
+    """A cursor past page one, so the keyset predicate is part of the plan"""
+    return encode_cursor(SimpleNamespace(scheduled_time=datetime(2030, 1, 1), id=10 ** 9))
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+def timed(args: dict) -> tuple:
+    """(elapsed ms, result) of one search"""
+    started = time.perf_counter()
+    result = search_bookings(args)
+    elapsed = 1000 * (time.perf_counter() - started)
+    db.session.rollback()
+    return elapsed, result
+
+def measure(args: dict, runs: int, pages: int) -> dict:
+    """p50/p95 ms of the first page, and of the deepest page reached by following next_cursor"""
+    first = [timed(args)[0] for _ in range(runs)]
+    
+    cursor, page = None, 1
+    while page < pages:
+        _, result = timed(dict(args, cursor=cursor) if cursor else args)
+        if not result['next_cursor']:
+            break
+        cursor = result['next_cursor']
+        page += 1
+    deep = [timed(dict(args, cursor=cursor))[0] for _ in range(runs)] if cursor else first
+    
+    return {
+        'first': (percentile(first, 0.5), percentile(first, 0.95)),
+        'deep': (percentile(deep, 0.5), percentile(deep, 0.95)),
+        'page': page
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark admin booking search latency and query plans')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=50, help='follow next_cursor this many pages for the deep-page timing')
+    parser.add_argument('--max-p95-ms', type=float, default=DEFAULT_MAX_P95_MS,
+                        help='exit non-zero if any p95 exceeds this')
+    parser.add_argument('--generate', type=int, metavar='BOOKINGS', help='generate this many load-test bookings first')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    app = create_app(scheduler_enabled=False)
+    init_db(app)
+    
+    with app.app_context():
+        if args.generate:
+            rng = random.Random(args.seed)
+            user_ids, timezones = generate_users(rng, max(args.generate // 100, 1), chunk_size=10000)
+            generate_bookings(rng, user_ids, timezones, args.generate, days=30, chunk_size=10000)
+        
+        failures = check_plans()
+        for name, scans in failures.items():
+            print(f"FAIL: {name} scans booking_requests: {'; '.join(scans)}")
+        
+        slow = []
+        print(f"{'query':<18} {'p50 ms':>8} {'p95 ms':>8} {'deep p50':>9} {'deep p95':>9} {'page':>5}")
+        for name, query in QUERIES.items():
+            result = measure(query, args.runs, args.pages)
+            (p50, p95), (deep50, deep95) = result['first'], result['deep']
+            print(f"{name:<18} {p50:>8.1f} {p95:>8.1f} {deep50:>9.1f} {deep95:>9.1f} {result['page']:>5}")
+            if max(p95, deep95) > args.max_p95_ms:
+                slow.append(name)
+    
+    if slow:
+        print(f"FAIL: p95 above {args.max_p95_ms:.0f} ms for {', '.join(slow)}")
+    return 1 if failures or slow else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Worker startup benchmark.
+
+Each run starts a fresh interpreter, as a new gunicorn worker would, and
+measures how long `import app` takes and the time to first response
+(import, create_app and one GET /health). It also checks that the optional
+subsystems that are imported on first use (Playwright, Stripe, SendGrid)
+were not pulled in during startup. tests/test_api.py checks the lazy
+imports only; the timing budget is enforced by running this script as its
+own CI step, since timings on a shared test runner are noise.
+
+Usage: python benchmark_startup.py [--runs 5] [--max-first-request-ms 2500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Packages that only the code paths using them may import
+LAZY_MODULES = ('playwright', 'stripe', 'sendgrid')
+
+DEFAULT_MAX_FIRST_REQUEST_MS = 2500
+
+CHILD = '''
+import json, os, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+status = flask_app.test_client().get('/health').status_code
+responded = time.perf_counter()
+print(json.dumps({
+    'import_ms': 1000 * (imported - started),
+    'first_request_ms': 1000 * (responded - started),
+    'status': status,
+    'modules': sorted({name.split('.')[0] for name in sys.modules})
+}), flush=True)
+# Skip interpreter teardown; background threads are not part of startup
+os._exit(0)
+'''
+
+def measure_once() -> dict:
+    """Startup timings of one fresh worker process"""
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True, timeout=120
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    modules = set(result.pop('modules'))
+    result['lazy_modules_loaded'] = [name for name in LAZY_MODULES if name in modules]
+    return result
+
+def measure(runs: int) -> dict:
+    results = [measure_once() for _ in range(runs)]
+    return {
+        'runs': runs,
+        'import_ms': round(statistics.median(r['import_ms'] for r in results), 1),
+        'first_request_ms': round(statistics.median(r['first_request_ms'] for r in results), 1),
+        'lazy_modules_loaded': sorted({name for r in results for name in r['lazy_modules_loaded']}),
+        'statuses': sorted({r['status'] for r in results})
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker import time and time to first request')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-first-request-ms', type=float, default=DEFAULT_MAX_FIRST_REQUEST_MS,
+                        help='exit non-zero if the median time to first request exceeds this')
+    args = parser.parse_args()
+    
+    result = measure(args.runs)
+    print(f"import app:         {result['import_ms']:.0f} ms (median of {args.runs})")
+    print(f"first request:      {result['first_request_ms']:.0f} ms")
+    print(f"lazy modules loaded: {', '.join(result['lazy_modules_loaded']) or 'none'}")
+    
+    if result['lazy_modules_loaded']:
+        print("FAIL: optional subsystems were imported during startup")
+        return 1
+    if result['first_request_ms'] > args.max_first_request_ms:
+        print(f"FAIL: first request took longer than {args.max_first_request_ms:.0f} ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,10 +12,40 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///midnight_travel.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))  # PostgreSQL only, 0 = off
+    # Set when DATABASE_URL points at PgBouncer in transaction pooling mode
+    DB_PGBOUNCER_MODE = os.getenv('DB_PGBOUNCER_MODE', 'false').lower() == 'true'
+    
+    # Read replicas for listing and stats endpoints (comma-separated URLs);
+    # a replica lagging more than REPLICA_MAX_LAG_SECONDS is skipped
+    DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS', '')
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 10))
+    
+    # Prometheus-style metrics at /metrics (per process)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # Readiness checks (/health/ready), cached for HEALTH_CACHE_SECONDS
+    HEALTH_CACHE_SECONDS = float(os.getenv('HEALTH_CACHE_SECONDS', 5))
+    HEALTH_DB_TIMEOUT_SECONDS = float(os.getenv('HEALTH_DB_TIMEOUT_SECONDS', 2))
+    # Only the database and executor decide readiness; the thresholds below
+    # set the reported ok of the informational checks
+    HEALTH_SCHEDULER_MAX_AGE_SECONDS = float(os.getenv('HEALTH_SCHEDULER_MAX_AGE_SECONDS', 150))
+    HEALTH_MAX_DUE_LAG_SECONDS = float(os.getenv('HEALTH_MAX_DUE_LAG_SECONDS', 120))
+    HEALTH_MAX_QUEUE_DEPTH = int(os.getenv('HEALTH_MAX_QUEUE_DEPTH', 500))
+    
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # EventSource cannot send headers, so the SSE stream also takes ?token=
+    JWT_QUERY_STRING_NAME = 'token'
     
     # Stripe
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
@@ -23,6 +53,53 @@ class Config:
     STRIPE_PRICE_BASIC = os.getenv('STRIPE_PRICE_BASIC')
     STRIPE_PRICE_STANDARD = os.getenv('STRIPE_PRICE_STANDARD')
     STRIPE_PRICE_PREMIUM = os.getenv('STRIPE_PRICE_PREMIUM')
+    SUBSCRIPTION_RECONCILE_HOUR = int(os.getenv('SUBSCRIPTION_RECONCILE_HOUR', 10))  # UTC
+    
+    # Cached subscription entitlements (invalidated by webhooks, TTL as a safety net)
+    ENTITLEMENT_CACHE_TTL_SECONDS = float(os.getenv('ENTITLEMENT_CACHE_TTL_SECONDS', 60))
+    
+    # Per-user dashboard summary cache (dropped on booking changes, TTL as a safety net)
+    DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv('DASHBOARD_CACHE_TTL_SECONDS', 60))
+    
+    # Target-site clock sync: bookings wait after login until the site's
+    # midnight minus half the RTT. Offsets come from HTTP Date headers unless
+    # CLOCK_SYNC_TIME_URL returns epoch seconds (plain or in a JSON field)
+    CLOCK_SYNC_ENABLED = os.getenv('CLOCK_SYNC_ENABLED', 'true').lower() == 'true'
+    CLOCK_SYNC_TIME_URL = os.getenv('CLOCK_SYNC_TIME_URL')
+    CLOCK_SYNC_TIME_FIELD = os.getenv('CLOCK_SYNC_TIME_FIELD', 'time')
+    CLOCK_SYNC_SAMPLES = int(os.getenv('CLOCK_SYNC_SAMPLES', 10))
+    CLOCK_SYNC_INTERVAL_SECONDS = int(os.getenv('CLOCK_SYNC_INTERVAL_SECONDS', 300))
+    CLOCK_SYNC_MAX_AGE_SECONDS = float(os.getenv('CLOCK_SYNC_MAX_AGE_SECONDS', 1800))
+    CLOCK_SYNC_TIMEOUT_SECONDS = float(os.getenv('CLOCK_SYNC_TIMEOUT_SECONDS', 5))
+    
+    # Identical searches (site, route, dates, passengers) are coalesced: one
+    # booking searches, the others reuse its result for SEARCH_CACHE_TTL_SECONDS
+    SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+    SEARCH_CACHE_TTL_SECONDS = float(os.getenv('SEARCH_CACHE_TTL_SECONDS', 5))
+    SEARCH_COALESCE_WAIT_SECONDS = float(os.getenv('SEARCH_COALESCE_WAIT_SECONDS', 30))
+    
+    # Write-behind booking status updates: transitions from all workers are
+    # committed together every STATUS_WRITER_FLUSH_MS (false = commit each one)
+    STATUS_WRITER_ENABLED = os.getenv('STATUS_WRITER_ENABLED', 'true').lower() == 'true'
+    STATUS_WRITER_FLUSH_MS = float(os.getenv('STATUS_WRITER_FLUSH_MS', 5))
+    STATUS_WRITER_MAX_BATCH = int(os.getenv('STATUS_WRITER_MAX_BATCH', 500))
+    STATUS_WRITER_WAIT_SECONDS = float(os.getenv('STATUS_WRITER_WAIT_SECONDS', 30))
+    
+    # Booking status events (SSE): 'local' delivers within one process only,
+    # 'postgres' uses LISTEN/NOTIFY so every worker sees every event.
+    # Defaults to postgres when DATABASE_URL is PostgreSQL.
+    # EVENT_BROKER_URL must bypass PgBouncer; defaults to DATABASE_URL
+    EVENT_BROKER = os.getenv('EVENT_BROKER', 'postgres' if SQLALCHEMY_DATABASE_URI.startswith('postgres') else 'local')
+    EVENT_BROKER_URL = os.getenv('EVENT_BROKER_URL')
+    EVENT_CHANNEL = os.getenv('EVENT_CHANNEL', 'booking_status')
+    SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_MAX_STREAM_SECONDS = float(os.getenv('SSE_MAX_STREAM_SECONDS', 600))  # client reconnects after this
+    SSE_MAX_QUEUE = int(os.getenv('SSE_MAX_QUEUE', 100))
+    # Open streams per worker process; each holds a gthread thread, so keep
+    # this well under gunicorn's --threads. Further clients get a 503
+    SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', 16))
+    SSE_RETRY_AFTER_SECONDS = int(os.getenv('SSE_RETRY_AFTER_SECONDS', 30))
+    SSE_REPLAY_SECONDS = float(os.getenv('SSE_REPLAY_SECONDS', 300))  # missed events replayed on reconnect
     
     # SendGrid
     SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
@@ -38,3 +115,66 @@ class Config:
     # Booking
     TARGET_TRAVEL_SITE_URL = os.getenv('TARGET_TRAVEL_SITE_URL')
     BOOKING_TIME = os.getenv('BOOKING_TIME', '00:00:00')
+    
+    # Retries must start within this many seconds of the scheduled time
+    RETRY_WINDOW_SECONDS = int(os.getenv('RETRY_WINDOW_SECONDS', 600))
+    
+    # Run the booking scheduler (and executor) in this process; turn off for
+    # web-only workers when another process schedules bookings
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    
+    # Expression indexes on booking_requests.primary_option fields
+    # (airline, cabin_class) for preference filters
+    OPTION_INDEXES_ENABLED = os.getenv('OPTION_INDEXES_ENABLED', 'true').lower() == 'true'
+    
+    # Archival of finished bookings to booking_requests_archive, nightly at
+    # ARCHIVE_HOUR (UTC) in batches of ARCHIVE_BATCH_SIZE rows. Automation
+    # traces of archived bookings are deleted, so ARCHIVE_AFTER_DAYS is also
+    # how long traces are kept for finished bookings
+    ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+    ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+    ARCHIVE_HOUR = int(os.getenv('ARCHIVE_HOUR', 11))
+    
+    # Booking executor: worker threads, per-tier guaranteed share of them, and
+    # how long a queued booking waits before being promoted one tier
+    EXECUTOR_MAX_WORKERS = int(os.getenv('EXECUTOR_MAX_WORKERS', 8))
+    TIER_CONCURRENCY_SHARES = os.getenv('TIER_CONCURRENCY_SHARES', 'premium=0.5,standard=0.3,basic=0.2')
+    TIER_AGING_SECONDS = float(os.getenv('TIER_AGING_SECONDS', 30))
+    
+    # Capacity planning: bookings must start within this window of their
+    # scheduled time; admission mode is 'off', 'warn' or 'reject'
+    CAPACITY_ADMISSION_MODE = os.getenv('CAPACITY_ADMISSION_MODE', 'warn')
+    CAPACITY_START_WINDOW_SECONDS = float(os.getenv('CAPACITY_START_WINDOW_SECONDS', 300))
+    CAPACITY_DEFAULT_BOOKING_SECONDS = float(os.getenv('CAPACITY_DEFAULT_BOOKING_SECONDS', 45))
+    CAPACITY_RESYNC_SECONDS = int(os.getenv('CAPACITY_RESYNC_SECONDS', 300))
+    
+    # Browser automation backend: 'sync' (one Playwright driver and browser
+    # per executor thread) or 'async' (coroutines on one event loop sharing a
+    # browser, at most ASYNC_AUTOMATION_CONCURRENCY at a time)
+    AUTOMATION_BACKEND = os.getenv('AUTOMATION_BACKEND', 'sync')
+    ASYNC_AUTOMATION_CONCURRENCY = int(os.getenv('ASYNC_AUTOMATION_CONCURRENCY', 100))
+    ASYNC_AUTOMATION_TIMEOUT_SECONDS = float(os.getenv('ASYNC_AUTOMATION_TIMEOUT_SECONDS', 300))
+    
+    # Serve target site responses from a recorded HAR file instead of the
+    # network (benchmarks and CI only)
+    AUTOMATION_REPLAY_HAR = os.getenv('AUTOMATION_REPLAY_HAR')
+    
+    # Per-attempt automation traces; failed attempts can also keep a
+    # 'screenshot' or a full 'playwright' trace in a size-capped directory
+    TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'true').lower() == 'true'
+    TRACE_ARTIFACTS = os.getenv('TRACE_ARTIFACTS', 'screenshot')
+    TRACE_ARTIFACT_DIR = os.getenv('TRACE_ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'traces'))
+    TRACE_ARTIFACT_MAX_MB = float(os.getenv('TRACE_ARTIFACT_MAX_MB', 200))
+    
+    # Per-site rate limiting ('local' per process, or 'database' across workers)
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+    RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 5))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 10))
+    RATE_LIMIT_TIMEOUT_SECONDS = float(os.getenv('RATE_LIMIT_TIMEOUT_SECONDS', 30))
+    
+    # Per-site circuit breaker
+    CIRCUIT_FAILURE_THRESHOLD = float(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 0.5))
+    CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 10))
+    CIRCUIT_WINDOW_SECONDS = float(os.getenv('CIRCUIT_WINDOW_SECONDS', 60))
+    CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_COOLDOWN_SECONDS', 30))
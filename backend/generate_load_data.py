@@ -0,0 +1,234 @@
+"""
+Bulk data generator for load and capacity testing.
+
+Creates users, subscriptions, bookings and audit logs in fixed-size chunks
+with bulk inserts (COPY on PostgreSQL), so memory use stays flat no matter
+how many rows are generated. Output is reproducible for a given --seed.
+
+Usage: python generate_load_data.py --users 100000 --bookings 10000000 [--seed 42]
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+from app import create_app, init_db
+from models import (
+    db, User, Subscription, BookingRequest, AuditLog,
+    BookingStatus, SubscriptionStatus, SubscriptionTier
+)
+from seed_bookings import DESTINATIONS
+from utils.security import hash_password
+from utils.timezone import batch_midnight_utc
+
+EMAIL_TEMPLATE = 'loadtest+{}@example.com'
+
+# Where users live; bookings fire at local midnight, so this is what shapes
+# the hourly peaks in UTC
+TIMEZONES = [
+    ('America/New_York', 0.22), ('America/Chicago', 0.10), ('America/Denver', 0.04),
+    ('America/Los_Angeles', 0.14), ('Europe/London', 0.10), ('Europe/Paris', 0.10),
+    ('Asia/Kolkata', 0.06), ('Asia/Singapore', 0.05), ('Asia/Tokyo', 0.07),
+    ('Australia/Sydney', 0.05), ('America/Sao_Paulo', 0.04), ('UTC', 0.03),
+]
+
+TIERS = [(SubscriptionTier.BASIC, 0.5), (SubscriptionTier.STANDARD, 0.35), (SubscriptionTier.PREMIUM, 0.15)]
+
+STATUSES = [
+    (BookingStatus.PENDING, 0.6),
+    (BookingStatus.SUCCESS, 0.25),
+    (BookingStatus.FAILED, 0.08),
+    (BookingStatus.CANCELED, 0.07),
+]
+
+# Relative demand by weekday (Monday first): Friday and Sunday departures peak
+WEEKDAY_WEIGHTS = [0.8, 0.7, 0.8, 1.0, 1.6, 1.1, 1.4]
+
+ROUTES = [(origin, destination) for origin in DESTINATIONS for destination in DESTINATIONS if origin != destination]
+
+class WeightedChoice:
+    """Precomputed cumulative weights so each draw is a single bisect"""
+
+    def __init__(self, pairs):
+        self.values = [value for value, _ in pairs]
+        self.cum_weights = []
+        total = 0
+        for _, weight in pairs:
+            total += weight
+            self.cum_weights.append(total)
+
+    def sample(self, rng, k):
+        return rng.choices(self.values, cum_weights=self.cum_weights, k=k)
+
+def write_rows(model, rows):
+    """Insert a chunk of row dicts: COPY on PostgreSQL, bulk insert elsewhere"""
+    if not rows:
+        return
+
+    if db.engine.dialect.name != 'postgresql':
+        db.session.bulk_insert_mappings(model, rows)
+        db.session.commit()
+        return
+
+    table = model.__table__
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[c] is None else (row[c].name if hasattr(row[c], 'name') else row[c]) for c in columns])
+    buffer.seek(0)
+
+    connection = db.session.connection().connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+    db.session.commit()
+
+def generate_users(rng, num_users, chunk_size):
+    """Create users with subscriptions; returns (user_ids, timezones) for the generated users"""
+    password_hash = hash_password('loadtest123')  # bcrypt is far too slow to run per row
+    timezone_choice = WeightedChoice(TIMEZONES)
+    tier_choice = WeightedChoice(TIERS)
+    now = datetime.utcnow()
+
+    start = db.session.query(db.func.count(User.id)).filter(User.email.like(EMAIL_TEMPLATE.format('%'))).scalar()
+    for offset in range(0, num_users, chunk_size):
+        size = min(chunk_size, num_users - offset)
+        timezones = timezone_choice.sample(rng, size)
+        write_rows(User, [
+            {
+                'email': EMAIL_TEMPLATE.format(start + offset + i),
+                'password_hash': password_hash,
+                'first_name': 'Load',
+                'last_name': f'Test{start + offset + i}',
+                'timezone': timezones[i],
+                'is_admin': False,
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now
+            }
+            for i in range(size)
+        ])
+
+    # Read back ids in one streaming pass; two flat lists stay small even for millions of users
+    user_ids, user_timezones = [], []
+    rows = db.session.query(User.id, User.timezone).filter(
+        User.email.like(EMAIL_TEMPLATE.format('%'))
+    ).order_by(User.id).yield_per(chunk_size)
+    for user_id, timezone in rows:
+        user_ids.append(user_id)
+        user_timezones.append(timezone)
+
+    new_ids = user_ids[start:]
+    for offset in range(0, len(new_ids), chunk_size):
+        chunk = new_ids[offset:offset + chunk_size]
+        tiers = tier_choice.sample(rng, len(chunk))
+        write_rows(Subscription, [
+            {
+                'user_id': user_id,
+                'tier': tiers[i],
+                'status': SubscriptionStatus.ACTIVE,
+                'current_period_start': now - timedelta(days=rng.randint(0, 29)),
+                'current_period_end': now + timedelta(days=rng.randint(1, 30)),
+                'created_at': now,
+                'updated_at': now
+            }
+            for i, user_id in enumerate(chunk)
+        ])
+
+    return user_ids, user_timezones
+
+def generate_bookings(rng, user_ids, user_timezones, num_bookings, days, chunk_size):
+    """Create bookings (and their audit log entries) concentrated on local-midnight peaks"""
+    status_choice = WeightedChoice(STATUSES)
+    today = date.today()
+    departure_days = [today + timedelta(days=d) for d in range(-days, days + 1)]
+    day_choice = WeightedChoice([(day, WEEKDAY_WEIGHTS[day.weekday()]) for day in departure_days])
+    passengers_choice = WeightedChoice([(1, 0.4), (2, 0.4), (3, 0.15), (4, 0.05)])
+    max_prices = [None, None, None, 300, 400, 500, 600, 800, 1000, 1500]
+    now = datetime.utcnow()
+
+    for offset in range(0, num_bookings, chunk_size):
+        size = min(chunk_size, num_bookings - offset)
+        users = [rng.randrange(len(user_ids)) for _ in range(size)]
+        statuses = status_choice.sample(rng, size)
+        departures = day_choice.sample(rng, size)
+        passengers = passengers_choice.sample(rng, size)
+        scheduled_times = batch_midnight_utc(
+            (departures[i], user_timezones[users[i]]) for i in range(size)
+        )
+
+        bookings = []
+        audit_logs = []
+        for i in range(size):
+            status = statuses[i]
+            # Past departures can only be finished; future ones are still pending
+            if departures[i] < today and status == BookingStatus.PENDING:
+                status = BookingStatus.SUCCESS
+            elif departures[i] >= today and status in (BookingStatus.SUCCESS, BookingStatus.FAILED):
+                status = BookingStatus.PENDING
+
+            origin, destination = rng.choice(ROUTES)
+            finished = status in (BookingStatus.SUCCESS, BookingStatus.FAILED)
+            created_at = scheduled_times[i] - timedelta(days=rng.randint(1, 60))
+            user_id = user_ids[users[i]]
+
+            bookings.append({
+                'user_id': user_id,
+                'status': status,
+                'origin': origin,
+                'destination': destination,
+                'departure_date': departures[i],
+                'return_date': departures[i] + timedelta(days=rng.randint(3, 14)) if rng.random() < 0.6 else None,
+                'passengers': passengers[i],
+                'max_price': rng.choice(max_prices),
+                'scheduled_time': scheduled_times[i],
+                'executed_at': scheduled_times[i] + timedelta(seconds=rng.randint(5, 600)) if finished else None,
+                'result_message': 'Booking completed successfully' if status == BookingStatus.SUCCESS else (
+                    'No booking options available' if status == BookingStatus.FAILED else None),
+                'booking_reference': f'LT{rng.randrange(10**8):08d}' if status == BookingStatus.SUCCESS else None,
+                'attempt_count': 1 if finished else 0,
+                'created_at': created_at,
+                'updated_at': now
+            })
+            audit_logs.append({
+                'user_id': user_id,
+                'action': 'booking.create',
+                'resource': 'booking_request',
+                'details': f'{origin} -> {destination}',
+                'ip_address': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+                'created_at': created_at
+            })
+
+        write_rows(BookingRequest, bookings)
+        write_rows(AuditLog, audit_logs)
+        print(f"  bookings: {offset + size}/{num_bookings}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate bulk load-test data')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--bookings', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=30, help='departure dates span +/- this many days')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app(scheduler_enabled=False)
+    init_db(app)
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        started = time.monotonic()
+        print(f"Creating {args.users} users...")
+        user_ids, user_timezones = generate_users(rng, args.users, args.chunk_size)
+
+        print(f"Creating {args.bookings} bookings across {len(user_ids)} load-test users...")
+        generate_bookings(rng, user_ids, user_timezones, args.bookings, args.days, args.chunk_size)
+
+        print(f"\nLoad data generated in {time.monotonic() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Create the database schema.
+
+Run once per deploy before starting the web workers, e.g.
+  python init_db.py && gunicorn ... 'app:create_app()'
+Workers no longer run create_all on boot, so scaling out does not send a
+round of DDL checks to the database from every new worker.
+"""
+import sys
+from app import create_app, init_db
+from utils.schema import SchemaUpgradeError
+
+def main():
+    app = create_app(scheduler_enabled=False)
+    try:
+        init_db(app)
+    except SchemaUpgradeError as e:
+        print(f"Schema upgrade failed: {e}")
+        return 1
+    print("Database schema is up to date")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
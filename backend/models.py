@@ -1,9 +1,18 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Enum
+from sqlalchemy import Enum, event
+from sqlalchemy.dialects.postgresql import JSONB
 import enum
+import json
+from config import Config
+from utils.booking_options import BookingOption, OptionValidationError, EMPTY_OPTION, INDEXED_OPTION_FIELDS, option_field
+from utils.db_routing import RoutingSession
+from utils.schema import create_search_index, create_trigram_extension, drop_search_index
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Native JSON: JSONB on PostgreSQL, JSON (text with json_extract) on SQLite
+OptionJSON = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
 
 class SubscriptionTier(enum.Enum):
     BASIC = 'basic'
@@ -22,6 +31,9 @@ class BookingStatus(enum.Enum):
     SUCCESS = 'success'
     FAILED = 'failed'
     CANCELED = 'canceled'
+    DEAD_LETTER = 'dead_letter'
+    # Failed after the confirm click was sent: the ticket may have been bought
+    NEEDS_REVIEW = 'needs_review'
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -92,8 +104,8 @@ class TravelCredential(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-class BookingRequest(db.Model):
-    __tablename__ = 'booking_requests'
+class BookingFields:
+    """Columns and serialization shared by live and archived bookings"""
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -106,9 +118,9 @@ class BookingRequest(db.Model):
     return_date = db.Column(db.Date)
     passengers = db.Column(db.Integer, default=1)
     
-    # Booking preferences
-    primary_option = db.Column(db.Text)  # JSON stored as text
-    backup_option = db.Column(db.Text)   # JSON stored as text
+    # Booking preferences, normalized BookingOption.to_dict() objects
+    primary_option = db.Column(OptionJSON)
+    backup_option = db.Column(OptionJSON)
     max_price = db.Column(db.Numeric(10, 2))
     
     # Execution details
@@ -117,9 +129,41 @@ class BookingRequest(db.Model):
     result_message = db.Column(db.Text)
     booking_reference = db.Column(db.String(100))
     
+    # Retry tracking
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime)
+    last_error_class = db.Column(db.String(50))
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    @classmethod
+    def option_value(cls, field: str, column: str = 'primary_option'):
+        """SQL expression for an option field's text value, as used by the expression indexes"""
+        return option_field(getattr(cls, column), field)
+    
+    @property
+    def primary_preferences(self) -> BookingOption:
+        return self._parsed_option('primary_option')
+    
+    @property
+    def backup_preferences(self) -> BookingOption:
+        return self._parsed_option('backup_option')
+    
+    def _parsed_option(self, column: str) -> BookingOption:
+        """Parse an option column once; reparsed only when a new value is assigned or loaded"""
+        raw = getattr(self, column)
+        cache = self.__dict__.setdefault('_option_cache', {})
+        cached = cache.get(column)
+        if cached is None or cached[0] is not raw:
+            try:
+                option = BookingOption.parse(raw, column)
+            except OptionValidationError:
+                # Stored before options were validated
+                option = EMPTY_OPTION
+            cached = cache[column] = (raw, option)
+        return cached[1]
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -130,15 +174,137 @@ class BookingRequest(db.Model):
             'departure_date': self.departure_date.isoformat(),
             'return_date': self.return_date.isoformat() if self.return_date else None,
             'passengers': self.passengers,
+            'primary_option': self.primary_option or {},
+            'backup_option': self.backup_option or {},
             'max_price': float(self.max_price) if self.max_price else None,
             'scheduled_time': self.scheduled_time.isoformat(),
             'executed_at': self.executed_at.isoformat() if self.executed_at else None,
             'result_message': self.result_message,
             'booking_reference': self.booking_reference,
+            'attempt_count': self.attempt_count,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error_class': self.last_error_class,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+class BookingRequest(BookingFields, db.Model):
+    __tablename__ = 'booking_requests'
+    __table_args__ = (
+        # A user's bookings, newest first (booking list and dashboard)
+        db.Index('ix_booking_requests_user_created', 'user_id', 'created_at'),
+        db.Index('ix_booking_requests_next_attempt_at', 'next_attempt_at'),
+        # Archival batches: finished bookings not updated since the cutoff
+        db.Index('ix_booking_requests_status_updated', 'status', 'updated_at'),
+        # Admin search: newest scheduled first, keyset paginated on (scheduled_time, id)
+        db.Index('ix_booking_requests_scheduled', 'scheduled_time', 'id'),
+        db.Index('ix_booking_requests_status_scheduled', 'status', 'scheduled_time', 'id'),
+        db.Index('ix_booking_requests_departure', 'departure_date'),
+        # Prefix and substring text search on PostgreSQL; SQLite uses the
+        # booking_search FTS5 table (utils/schema.py)
+        *(
+            db.Index(f'ix_booking_requests_{column}_trgm', column, postgresql_using='gin',
+                     postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+            for column in ('origin', 'destination', 'result_message')
+        ),
+        # SQLite reuses the highest rowid once it is deleted, and archived
+        # rows keep their id; AUTOINCREMENT never hands an id out twice
+        {'sqlite_autoincrement': True},
+    )
+
+event.listen(db.metadata, 'before_create', create_trigram_extension)
+event.listen(BookingRequest.__table__, 'after_create', create_search_index)
+event.listen(BookingRequest.__table__, 'before_drop', drop_search_index)
+
+if Config.OPTION_INDEXES_ENABLED:
+    # Preference filters on live bookings (executor and admin queries)
+    for _field in INDEXED_OPTION_FIELDS:
+        db.Index(f'ix_booking_requests_primary_{_field}', BookingRequest.option_value(_field))
+
+class ArchivedBooking(BookingFields, db.Model):
+    __tablename__ = 'booking_requests_archive'
+    __table_args__ = (
+        db.Index('ix_booking_requests_archive_user_created', 'user_id', 'created_at'),
+    )
+    
+    # Finished bookings moved out of booking_requests by services/archive.py;
+    # rows keep their original id
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    
+    def to_dict(self):
+        data = super().to_dict()
+        data['archived_at'] = self.archived_at.isoformat()
+        return data
+
+class StripeEvent(db.Model):
+    __tablename__ = 'stripe_events'
+    
+    # Raw webhook events, stored on receipt and processed in the background
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), unique=True, nullable=False)
+    event_type = db.Column(db.String(100), nullable=False)
+    customer_id = db.Column(db.String(100), index=True)
+    stripe_created = db.Column(db.Integer, nullable=False, default=0)  # Unix timestamp from Stripe
+    payload = db.Column(db.Text, nullable=False)  # JSON of event.data.object
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime)  # Retry backoff after a failed attempt
+    error = db.Column(db.Text)
+    processed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BookingTrace(db.Model):
+    __tablename__ = 'booking_traces'
+    
+    # One row per automation attempt; steps are compact JSON rows of
+    # [name, start_ms, duration_ms, [[wait_label, wait_ms], ...], error]
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking_requests.id'), nullable=False, index=True)
+    attempt = db.Column(db.Integer, nullable=False, default=1)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False, default=0)
+    outcome = db.Column(db.String(50))  # 'success' or the error class
+    steps = db.Column(db.Text, nullable=False, default='[]')
+    artifact_path = db.Column(db.String(500))  # screenshot or Playwright trace, if captured
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'booking_id': self.booking_id,
+            'attempt': self.attempt,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': self.duration_ms,
+            'outcome': self.outcome,
+            'steps': self.expand_steps(json.loads(self.steps or '[]')),
+            'has_artifact': bool(self.artifact_path),
+            'created_at': self.created_at.isoformat()
+        }
+    
+    @staticmethod
+    def expand_steps(rows):
+        """Compact step rows as readable dicts"""
+        return [
+            {
+                'name': name,
+                'start_ms': start_ms,
+                'duration_ms': duration_ms,
+                'waits': [{'selector': label, 'duration_ms': wait_ms} for label, wait_ms in waits],
+                'error': error
+            }
+            for name, start_ms, duration_ms, waits, error in rows
+        ]
+
+class RateLimitBucket(db.Model):
+    __tablename__ = 'rate_limit_buckets'
+    
+    # Token bucket state per target site host, shared by all executor workers
+    host = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # Unix timestamp
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
@@ -1,7 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, BookingRequest, AuditLog
+from models import db, User, ArchivedBooking, BookingRequest, BookingStatus, BookingTrace, AuditLog
+import os
 from functools import wraps
+from datetime import datetime
+from config import Config
+from services.executor import get_executor
+from services.capacity import get_planner
+from services.status_writer import get_status_writer
+from services.search_cache import get_search_cache
+from services.clock_sync import get_clock_sync
+from services.archive import archive_bookings, archive_status
+from services.booking_search import SearchError, search_bookings
+from utils.booking_options import BookingOption, OptionValidationError, INDEXED_OPTION_FIELDS
+from utils.db_pool import pool_status
+from utils.db_routing import read_replica, replica_status
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -22,6 +35,7 @@ def admin_required(fn):
 
 @admin_bp.route('/users', methods=['GET'])
 @admin_required
+@read_replica
 def get_all_users():
     """Get all users (admin only)"""
     try:
@@ -36,12 +50,13 @@ def get_all_users():
             'pages': users.pages,
             'current_page': users.page
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/users/<int:user_id>', methods=['GET'])
 @admin_required
+@read_replica
 def get_user(user_id):
     """Get specific user details (admin only)"""
     try:
@@ -51,7 +66,7 @@ def get_user(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({'user': user.to_dict()}), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -78,13 +93,14 @@ def update_user(user_id):
             'message': 'User updated successfully',
             'user': user.to_dict()
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/bookings', methods=['GET'])
 @admin_required
+@read_replica
 def get_all_bookings():
     """Get all booking requests (admin only)"""
     try:
@@ -95,7 +111,20 @@ def get_all_bookings():
         query = BookingRequest.query
         
         if status:
-            query = query.filter_by(status=status)
+            try:
+                query = query.filter_by(status=BookingStatus(status.lower()))
+            except ValueError:
+                return jsonify({'error': f"status must be one of {', '.join(s.value for s in BookingStatus)}"}), 400
+        
+        # Preference filters, normalized like stored options so the expression indexes match
+        try:
+            preferences = BookingOption.parse({
+                field: request.args[field] for field in INDEXED_OPTION_FIELDS if request.args.get(field)
+            }, 'filter')
+        except OptionValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        for field, value in preferences.to_dict().items():
+            query = query.filter(BookingRequest.option_value(field) == value)
         
         bookings = query.order_by(BookingRequest.created_at.desc()).paginate(page=page, per_page=per_page)
         
@@ -105,12 +134,210 @@ def get_all_bookings():
             'pages': bookings.pages,
             'current_page': bookings.page
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/bookings/search', methods=['GET'])
+@admin_required
+@read_replica
+def search_all_bookings():
+    """Search live bookings by route, status, dates, user email and result text (admin only)"""
+    try:
+        return jsonify(search_bookings(request.args)), 200
+    
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/bookings/<int:booking_id>/trace', methods=['GET'])
+@admin_required
+@read_replica
+def get_booking_trace(booking_id):
+    """Get step timings of every automation attempt for a booking (admin only)"""
+    try:
+        booking = BookingRequest.query.get(booking_id)
         
+        if not booking:
+            return jsonify({'error': 'Booking not found'}), 404
+        
+        traces = BookingTrace.query.filter_by(booking_id=booking_id).order_by(BookingTrace.attempt, BookingTrace.id).all()
+        
+        return jsonify({
+            'booking_id': booking_id,
+            'status': booking.status.value,
+            'traces': [trace.to_dict() for trace in traces]
+        }), 200
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/bookings/<int:booking_id>/trace/<int:trace_id>/artifact', methods=['GET'])
+@admin_required
+def get_booking_trace_artifact(booking_id, trace_id):
+    """Download the screenshot or Playwright trace of a failed attempt (admin only)"""
+    try:
+        trace = BookingTrace.query.filter_by(id=trace_id, booking_id=booking_id).first()
+        
+        if not trace or not trace.artifact_path:
+            return jsonify({'error': 'Trace artifact not found'}), 404
+        
+        # Artifacts are pruned oldest-first once the directory is over its size cap
+        if not os.path.isfile(trace.artifact_path):
+            return jsonify({'error': 'Trace artifact has been pruned'}), 410
+        
+        return send_file(trace.artifact_path, as_attachment=True)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/dead-letter', methods=['GET'])
+@admin_required
+@read_replica
+def get_dead_letter_bookings():
+    """Get bookings whose retries were exhausted (admin only)"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        
+        bookings = BookingRequest.query.filter_by(
+            status=BookingStatus.DEAD_LETTER
+        ).order_by(BookingRequest.updated_at.desc()).paginate(page=page, per_page=per_page)
+        
+        return jsonify({
+            'bookings': [booking.to_dict() for booking in bookings.items],
+            'total': bookings.total,
+            'pages': bookings.pages,
+            'current_page': bookings.page
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/dead-letter/<int:booking_id>/requeue', methods=['POST'])
+@admin_required
+def requeue_dead_letter_booking(booking_id):
+    """Put a dead-lettered booking back in the queue for immediate execution (admin only)"""
+    try:
+        booking = BookingRequest.query.get(booking_id)
+        
+        if not booking:
+            return jsonify({'error': 'Booking not found'}), 404
+        
+        if booking.status != BookingStatus.DEAD_LETTER:
+            return jsonify({'error': 'Only dead-lettered bookings can be requeued'}), 400
+        
+        booking.status = BookingStatus.PENDING
+        booking.attempt_count = 0
+        booking.next_attempt_at = datetime.utcnow()
+        booking.result_message = 'Requeued by admin'
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Booking requeued successfully',
+            'booking': booking.to_dict()
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/executor', methods=['GET'])
+@admin_required
+def get_executor_metrics():
+    """Get booking executor queue and per-tier wait metrics (admin only)"""
+    try:
+        executor = get_executor()
+        
+        if not executor:
+            return jsonify({'error': 'Booking executor is not running in this process'}), 503
+        
+        metrics = {
+            'executor': executor.metrics(),
+            'status_writer': get_status_writer().metrics(),
+            'search_cache': get_search_cache().metrics(),
+            'automation_backend': Config.AUTOMATION_BACKEND
+        }
+        if Config.AUTOMATION_BACKEND == 'async':
+            from services.async_automation import get_async_backend
+            metrics['async_backend'] = get_async_backend().metrics()
+        
+        return jsonify(metrics), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/capacity/forecast', methods=['GET'])
+@admin_required
+def get_capacity_forecast():
+    """Forecast scheduled bookings per hour slot against executor capacity (admin only)"""
+    try:
+        days = min(request.args.get('days', 7, type=int), 90)
+        planner = get_planner()
+        slots = planner.forecast(days)
+        
+        return jsonify({
+            'days': days,
+            'slot_capacity': planner.slot_capacity(),
+            'slots': slots,
+            'over_capacity_slots': sum(1 for slot in slots if slot['over_capacity'])
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/db-pool', methods=['GET'])
+@admin_required
+def get_db_pool_metrics():
+    """Get database connection pool occupancy and checkout metrics (admin only)"""
+    try:
+        return jsonify({
+            'pool': pool_status(db.engine),
+            'replicas': replica_status(db.engines)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/clock-sync', methods=['GET'])
+@admin_required
+def get_clock_sync_status():
+    """Get the measured clock offset and RTT of each target site (admin only)"""
+    try:
+        return jsonify({'enabled': Config.CLOCK_SYNC_ENABLED, 'sites': get_clock_sync().status()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/archive', methods=['GET'])
+@admin_required
+@read_replica
+def get_archive_status():
+    """Get live and archived booking counts (admin only)"""
+    try:
+        return jsonify(archive_status()), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/archive', methods=['POST'])
+@admin_required
+def run_archive():
+    """Archive finished bookings now instead of waiting for the nightly job (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        archived = archive_bookings(older_than_days=data.get('older_than_days'))
+        
+        return jsonify({'archived': archived, **archive_status()}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/audit-logs', methods=['GET'])
 @admin_required
+@read_replica
 def get_audit_logs():
     """Get audit logs (admin only)"""
     try:
@@ -131,28 +358,35 @@ def get_audit_logs():
             'pages': logs.pages,
             'current_page': logs.page
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/stats', methods=['GET'])
 @admin_required
+@read_replica
 def get_stats():
     """Get system statistics (admin only)"""
     try:
         total_users = User.query.count()
         active_users = User.query.filter_by(is_active=True).count()
-        total_bookings = BookingRequest.query.count()
+        archived_bookings = ArchivedBooking.query.count()
+        total_bookings = BookingRequest.query.count() + archived_bookings
         pending_bookings = BookingRequest.query.filter_by(status='pending').count()
+        dead_letter_bookings = BookingRequest.query.filter_by(status=BookingStatus.DEAD_LETTER).count()
+        needs_review_bookings = BookingRequest.query.filter_by(status=BookingStatus.NEEDS_REVIEW).count()
         
         return jsonify({
             'stats': {
                 'total_users': total_users,
                 'active_users': active_users,
                 'total_bookings': total_bookings,
-                'pending_bookings': pending_bookings
+                'pending_bookings': pending_bookings,
+                'dead_letter_bookings': dead_letter_bookings,
+                'needs_review_bookings': needs_review_bookings,
+                'archived_bookings': archived_bookings
             }
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,43 +1,111 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, BookingRequest, BookingStatus, Subscription, SubscriptionStatus
-from datetime import datetime, time
-import pytz
+from models import db, User, BookingRequest, BookingStatus
+from datetime import datetime
 import json
+import time
+from config import Config
+from services.archive import find_user_booking, user_bookings
+from services.capacity import get_planner
+from services.entitlements import get_entitlements
+from services.events import get_event_bus
+from utils.booking_options import BookingOption, OptionValidationError
+from utils.db_routing import read_replica
+from utils.timezone import local_midnight_utc
 
 bookings_bp = Blueprint('bookings', __name__)
 
 @bookings_bp.route('/', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_bookings():
-    """Get all booking requests for current user"""
+    """Get all booking requests for current user, including archived history"""
     try:
         current_user_id = get_jwt_identity()
-        bookings = BookingRequest.query.filter_by(user_id=current_user_id).order_by(BookingRequest.created_at.desc()).all()
+        bookings = user_bookings(current_user_id)
         
         return jsonify({
             'bookings': [booking.to_dict() for booking in bookings]
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bookings_bp.route('/<int:booking_id>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_booking(booking_id):
     """Get specific booking request"""
     try:
         current_user_id = get_jwt_identity()
-        booking = BookingRequest.query.filter_by(id=booking_id, user_id=current_user_id).first()
+        booking = find_user_booking(booking_id, current_user_id)
         
         if not booking:
             return jsonify({'error': 'Booking not found'}), 404
         
         return jsonify({'booking': booking.to_dict()}), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def status_message(event: dict) -> str:
+    """SSE status event; its id lets a reconnecting client ask for what it missed"""
+    return f"event: status\nid: {event['published_at']!r}\ndata: {json.dumps(event)}\n\n"
+
+def parse_event_id(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # A missing id is a fresh client; an unreadable one cannot be caught up
+        return None if value is None else 0.0
+
+@bookings_bp.route('/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def booking_events():
+    """Stream status changes of the current user's bookings as Server-Sent Events"""
+    bus = get_event_bus()
+    # EventSource sends Last-Event-ID on its own reconnects; the frontend
+    # reconnects by hand (for a fresh token) and passes it in the query string
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    subscription = bus.subscribe(get_jwt_identity(), last_event_id)
+    if subscription is None:
+        return jsonify({'error': 'Too many open event streams, try again later'}), 503, {
+            'Retry-After': str(Config.SSE_RETRY_AFTER_SECONDS)
+        }
+    
+    def stream():
+        try:
+            # ready carries the current time as an id, so a client that
+            # reconnects before any status event still gets caught up
+            opening = ['retry: 3000\n: connected\n\n', f"event: ready\nid: {time.time()!r}\ndata: {{}}\n\n"]
+            if subscription.missed is None:
+                opening.append('event: resync\ndata: {}\n\n')
+            else:
+                opening.extend(status_message(event) for event in subscription.missed)
+            yield ''.join(opening)
+            
+            deadline = time.monotonic() + Config.SSE_MAX_STREAM_SECONDS
+            while not subscription.overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # EventSource reconnects, picking up a fresh token and worker
+                    return
+                event = subscription.get(timeout=min(Config.SSE_HEARTBEAT_SECONDS, remaining))
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield status_message(event)
+            
+            # Client fell behind and missed events: it should refetch its bookings
+            yield 'event: resync\ndata: {}\n\n'
+        finally:
+            bus.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @bookings_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_booking():
@@ -46,8 +114,7 @@ def create_booking():
         current_user_id = get_jwt_identity()
         
         # Check if user has active subscription
-        subscription = Subscription.query.filter_by(user_id=current_user_id).first()
-        if not subscription or subscription.status != SubscriptionStatus.ACTIVE:
+        if not get_entitlements().get(current_user_id).is_active():
             return jsonify({'error': 'Active subscription required'}), 403
         
         data = request.get_json()
@@ -57,14 +124,27 @@ def create_booking():
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        # Get user's timezone
-        user = User.query.get(current_user_id)
-        user_tz = pytz.timezone(user.timezone)
+        try:
+            primary_option = BookingOption.parse(data.get('primary_option'), 'primary_option')
+            backup_option = BookingOption.parse(data.get('backup_option'), 'backup_option')
+        except OptionValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Parse departure date and create scheduled time (midnight in user's timezone)
+        user = User.query.get(current_user_id)
         departure_date = datetime.fromisoformat(data['departure_date']).date()
-        scheduled_datetime = datetime.combine(departure_date, time(0, 0, 0))
-        scheduled_datetime = user_tz.localize(scheduled_datetime)
+        scheduled_datetime = local_midnight_utc(departure_date, user.timezone)
+        
+        # Admission control against the executor's capacity for that slot
+        planner = get_planner()
+        capacity = None
+        if Config.CAPACITY_ADMISSION_MODE != 'off':
+            capacity = planner.check(scheduled_datetime)
+            if capacity['over_capacity'] and Config.CAPACITY_ADMISSION_MODE == 'reject':
+                return jsonify({
+                    'error': 'Booking slot is at capacity, please choose another date',
+                    'capacity': capacity
+                }), 409
         
         # Create booking request
         booking = BookingRequest(
@@ -74,8 +154,8 @@ def create_booking():
             departure_date=departure_date,
             return_date=datetime.fromisoformat(data['return_date']).date() if data.get('return_date') else None,
             passengers=data.get('passengers', 1),
-            primary_option=json.dumps(data.get('primary_option', {})),
-            backup_option=json.dumps(data.get('backup_option', {})),
+            primary_option=primary_option.to_dict(),
+            backup_option=backup_option.to_dict(),
             max_price=data.get('max_price'),
             scheduled_time=scheduled_datetime,
             status=BookingStatus.PENDING
@@ -83,12 +163,18 @@ def create_booking():
         
         db.session.add(booking)
         db.session.commit()
+        # Forecast only: admission counts the slot in the database
+        planner.index.add(booking.scheduled_time)
         
-        return jsonify({
+        response = {
             'message': 'Booking request created successfully',
             'booking': booking.to_dict()
-        }), 201
+        }
+        if capacity and capacity['over_capacity']:
+            response['capacity_warning'] = capacity
         
+        return jsonify(response), 201
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -109,31 +195,64 @@ def update_booking(booking_id):
         
         data = request.get_json()
         
+        try:
+            options = {
+                name: BookingOption.parse(data[name], name).to_dict()
+                for name in ('primary_option', 'backup_option') if name in data
+            }
+        except OptionValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        previous_scheduled_time = booking.scheduled_time
+        scheduled_datetime = previous_scheduled_time
+        if 'departure_date' in data:
+            departure_date = datetime.fromisoformat(data['departure_date']).date()
+            scheduled_datetime = local_midnight_utc(departure_date, booking.user.timezone)
+        
+        # Moving to another slot is admitted like a new booking
+        capacity = None
+        if Config.CAPACITY_ADMISSION_MODE != 'off' and scheduled_datetime != previous_scheduled_time:
+            capacity = get_planner().check(scheduled_datetime, booking_id=booking.id)
+            if capacity['over_capacity'] and Config.CAPACITY_ADMISSION_MODE == 'reject':
+                return jsonify({
+                    'error': 'Booking slot is at capacity, please choose another date',
+                    'capacity': capacity
+                }), 409
+        
         # Update allowed fields
         if 'origin' in data:
             booking.origin = data['origin']
         if 'destination' in data:
             booking.destination = data['destination']
         if 'departure_date' in data:
-            booking.departure_date = datetime.fromisoformat(data['departure_date']).date()
+            booking.departure_date = departure_date
+            booking.scheduled_time = scheduled_datetime
         if 'return_date' in data:
             booking.return_date = datetime.fromisoformat(data['return_date']).date() if data['return_date'] else None
         if 'passengers' in data:
             booking.passengers = data['passengers']
-        if 'primary_option' in data:
-            booking.primary_option = json.dumps(data['primary_option'])
-        if 'backup_option' in data:
-            booking.backup_option = json.dumps(data['backup_option'])
+        for name, option in options.items():
+            setattr(booking, name, option)
         if 'max_price' in data:
             booking.max_price = data['max_price']
         
         db.session.commit()
         
-        return jsonify({
+        # Forecast only: admission counts the slot in the database
+        if booking.scheduled_time != previous_scheduled_time:
+            planner = get_planner()
+            planner.index.remove(previous_scheduled_time)
+            planner.index.add(booking.scheduled_time)
+        
+        response = {
             'message': 'Booking updated successfully',
             'booking': booking.to_dict()
-        }), 200
+        }
+        if capacity and capacity['over_capacity']:
+            response['capacity_warning'] = capacity
         
+        return jsonify(response), 200
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -149,14 +268,19 @@ def cancel_booking(booking_id):
         if not booking:
             return jsonify({'error': 'Booking not found'}), 404
         
-        if booking.status in [BookingStatus.SUCCESS, BookingStatus.PROCESSING]:
-            return jsonify({'error': 'Cannot cancel completed or processing bookings'}), 400
+        if booking.status in [BookingStatus.SUCCESS, BookingStatus.PROCESSING, BookingStatus.NEEDS_REVIEW]:
+            return jsonify({'error': 'Cannot cancel completed, processing or under-review bookings'}), 400
         
+        was_pending = booking.status == BookingStatus.PENDING
         booking.status = BookingStatus.CANCELED
         db.session.commit()
         
-        return jsonify({'message': 'Booking canceled successfully'}), 200
+        # Forecast only: admission counts the slot in the database
+        if was_pending:
+            get_planner().index.remove(booking.scheduled_time)
         
+        return jsonify({'message': 'Booking canceled successfully'}), 200
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
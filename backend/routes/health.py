@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from services.health import get_readiness
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/live', methods=['GET'])
+def liveness():
+    """Process is up and serving requests"""
+    return jsonify({'status': 'alive'}), 200
+
+@health_bp.route('/ready', methods=['GET'])
+def readiness():
+    """Database and executor gate readiness; scheduler, due-booking lag and queue depth are reported (cached)"""
+    try:
+        report = get_readiness().report()
+        return jsonify(report), 200 if report['status'] == 'ready' else 503
+    
+    except Exception as e:
+        return jsonify({'status': 'not_ready', 'error': str(e)}), 503
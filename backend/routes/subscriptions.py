@@ -1,10 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Subscription, SubscriptionStatus
-import stripe
+from models import db, Subscription
 from config import Config
-
-stripe.api_key = Config.STRIPE_SECRET_KEY
+from services.stripe_events import store_event
+from services.entitlements import stripe_api
 
 subscriptions_bp = Blueprint('subscriptions', __name__)
 
@@ -46,7 +45,7 @@ def create_checkout_session():
             return jsonify({'error': 'Invalid subscription tier'}), 400
         
         # Create Stripe checkout session
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = stripe_api().checkout.Session.create(
             customer_email=data.get('email'),
             payment_method_types=['card'],
             line_items=[{
@@ -72,9 +71,10 @@ def create_checkout_session():
 
 @subscriptions_bp.route('/webhook', methods=['POST'])
 def stripe_webhook():
-    """Handle Stripe webhook events"""
+    """Receive Stripe webhook events; processing happens in the background"""
     payload = request.data
     sig_header = request.headers.get('Stripe-Signature')
+    stripe = stripe_api()
     
     try:
         event = stripe.Webhook.construct_event(
@@ -85,107 +85,14 @@ def stripe_webhook():
     except stripe.error.SignatureVerificationError:
         return jsonify({'error': 'Invalid signature'}), 400
     
-    # Handle different event types
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        handle_checkout_completed(session)
-    
-    elif event['type'] == 'customer.subscription.updated':
-        subscription_data = event['data']['object']
-        handle_subscription_updated(subscription_data)
-    
-    elif event['type'] == 'customer.subscription.deleted':
-        subscription_data = event['data']['object']
-        handle_subscription_deleted(subscription_data)
-    
-    elif event['type'] == 'invoice.payment_failed':
-        invoice = event['data']['object']
-        handle_payment_failed(invoice)
-    
-    return jsonify({'status': 'success'}), 200
-
-def handle_checkout_completed(session):
-    """Handle successful checkout completion"""
     try:
-        user_id = session['metadata']['user_id']
-        tier = session['metadata']['tier']
-        
-        # Get Stripe subscription
-        stripe_subscription = stripe.Subscription.retrieve(session['subscription'])
-        
-        # Create or update subscription in database
-        subscription = Subscription.query.filter_by(user_id=user_id).first()
-        
-        if subscription:
-            subscription.tier = tier
-            subscription.status = SubscriptionStatus.ACTIVE
-            subscription.stripe_customer_id = session['customer']
-            subscription.stripe_subscription_id = session['subscription']
-            subscription.current_period_start = datetime.fromtimestamp(stripe_subscription['current_period_start'])
-            subscription.current_period_end = datetime.fromtimestamp(stripe_subscription['current_period_end'])
-        else:
-            subscription = Subscription(
-                user_id=user_id,
-                tier=tier,
-                status=SubscriptionStatus.ACTIVE,
-                stripe_customer_id=session['customer'],
-                stripe_subscription_id=session['subscription'],
-                current_period_start=datetime.fromtimestamp(stripe_subscription['current_period_start']),
-                current_period_end=datetime.fromtimestamp(stripe_subscription['current_period_end'])
-            )
-            db.session.add(subscription)
-        
-        db.session.commit()
-        
+        if not store_event(event):
+            return jsonify({'status': 'duplicate'}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Error handling checkout completion: {e}")
-
-def handle_subscription_updated(subscription_data):
-    """Handle subscription update"""
-    try:
-        subscription = Subscription.query.filter_by(
-            stripe_subscription_id=subscription_data['id']
-        ).first()
-        
-        if subscription:
-            subscription.status = SubscriptionStatus.ACTIVE if subscription_data['status'] == 'active' else SubscriptionStatus.INACTIVE
-            subscription.current_period_start = datetime.fromtimestamp(subscription_data['current_period_start'])
-            subscription.current_period_end = datetime.fromtimestamp(subscription_data['current_period_end'])
-            db.session.commit()
-            
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error handling subscription update: {e}")
-
-def handle_subscription_deleted(subscription_data):
-    """Handle subscription cancellation"""
-    try:
-        subscription = Subscription.query.filter_by(
-            stripe_subscription_id=subscription_data['id']
-        ).first()
-        
-        if subscription:
-            subscription.status = SubscriptionStatus.CANCELED
-            db.session.commit()
-            
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error handling subscription deletion: {e}")
-
-def handle_payment_failed(invoice):
-    """Handle failed payment"""
-    try:
-        subscription = Subscription.query.filter_by(
-            stripe_customer_id=invoice['customer']
-        ).first()
-        
-        if subscription:
-            subscription.status = SubscriptionStatus.PAST_DUE
-            db.session.commit()
-            
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error handling payment failure: {e}")
-
-from datetime import datetime
+        return jsonify({'error': str(e)}), 500
+    
+    if Config.SCHEDULER_ENABLED:
+        from services.scheduler import wake_event_processor
+        wake_event_processor()
+    return jsonify({'status': 'queued'}), 200
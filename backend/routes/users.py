@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, TravelCredential
 from utils.security import encrypt_data, decrypt_data
+from services.dashboard import get_dashboard_cache
 
 users_bp = Blueprint('users', __name__)
 
@@ -53,6 +54,17 @@ def update_profile():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@users_bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard():
+    """Get booking counts, recent bookings, subscription and credential status for the dashboard"""
+    try:
+        current_user_id = get_jwt_identity()
+        return jsonify(get_dashboard_cache().get(current_user_id)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @users_bp.route('/credentials', methods=['POST'])
 @jwt_required()
 def save_travel_credentials():
@@ -6,10 +6,10 @@ import sys
 import random
 from datetime import datetime, timedelta
 from faker import Faker
-from app import create_app
+from app import create_app, init_db
 from models import db, User, BookingRequest, BookingStatus, Subscription, SubscriptionStatus, SubscriptionTier
+from utils.timezone import batch_midnight_utc
 import bcrypt
-import pytz
 
 fake = Faker()
 
@@ -68,9 +68,8 @@ def generate_fake_bookings(app, user_id, num_bookings=20):
     """Generate fake booking data"""
     with app.app_context():
         user = User.query.get(user_id)
-        user_tz = pytz.timezone(user.timezone)
         
-        bookings_created = 0
+        bookings = []
         statuses = [
             (BookingStatus.PENDING, 0.3),      # 30% pending
             (BookingStatus.PROCESSING, 0.1),    # 10% processing
@@ -107,29 +106,18 @@ def generate_fake_bookings(app, user_id, num_bookings=20):
             origin = random.choice(DESTINATIONS)
             destination = random.choice([d for d in DESTINATIONS if d != origin])
             
-            # Schedule time at midnight on departure date
-            scheduled_datetime = datetime.combine(departure_date, datetime.min.time())
-            # Use localize with is_dst=None to handle DST transitions safely
-            try:
-                scheduled_datetime = user_tz.localize(scheduled_datetime, is_dst=None)
-            except pytz.exceptions.AmbiguousTimeError:
-                # If time is ambiguous (DST transition), use DST time
-                scheduled_datetime = user_tz.localize(scheduled_datetime, is_dst=True)
-            except pytz.exceptions.NonExistentTimeError:
-                # If time doesn't exist (DST gap), use the next valid time
-                scheduled_datetime = user_tz.localize(scheduled_datetime, is_dst=False)
-            
-            # Executed time for completed bookings
-            executed_at = None
+            # Executed time for completed bookings (offset from the scheduled
+            # time, which is filled in below for the whole batch)
+            executed_after = None
             result_message = None
             booking_reference = None
             
             if status == BookingStatus.SUCCESS:
-                executed_at = scheduled_datetime + timedelta(minutes=random.randint(1, 10))
+                executed_after = timedelta(minutes=random.randint(1, 10))
                 result_message = "Booking completed successfully"
                 booking_reference = fake.bothify(text='??######', letters='ABCDEFGHIJKLMNOPQRSTUVWXYZ')
             elif status == BookingStatus.FAILED:
-                executed_at = scheduled_datetime + timedelta(minutes=random.randint(1, 10))
+                executed_after = timedelta(minutes=random.randint(1, 10))
                 failures = [
                     "No available flights found within budget",
                     "Travel site authentication failed",
@@ -160,17 +148,23 @@ def generate_fake_bookings(app, user_id, num_bookings=20):
                 return_date=return_date,
                 passengers=passengers,
                 max_price=max_price,
-                scheduled_time=scheduled_datetime,
-                executed_at=executed_at,
                 result_message=result_message,
                 booking_reference=booking_reference
             )
-            
+            bookings.append((booking, executed_after))
+        
+        # Schedule time at midnight on departure date in the user's timezone
+        scheduled_times = batch_midnight_utc(
+            (booking.departure_date, user.timezone) for booking, _ in bookings
+        )
+        for (booking, executed_after), scheduled_time in zip(bookings, scheduled_times):
+            booking.scheduled_time = scheduled_time
+            if executed_after:
+                booking.executed_at = scheduled_time + executed_after
             db.session.add(booking)
-            bookings_created += 1
         
         db.session.commit()
-        print(f"Successfully created {bookings_created} fake bookings for user {user.email}")
+        print(f"Successfully created {len(bookings)} fake bookings for user {user.email}")
 
 def main():
     # Get number of bookings from command line (default: 20)
@@ -181,7 +175,8 @@ def main():
         except ValueError:
             print("Invalid number of bookings. Using default: 20")
     
-    app = create_app()
+    app = create_app(scheduler_enabled=False)
+    init_db(app)
     
     print(f"Creating fake booking data...")
     print(f"Number of bookings to create: {num_bookings}")
@@ -0,0 +1,84 @@
+"""
+Booking history archival.
+
+Finished bookings (SUCCESS, FAILED, CANCELED) that have not changed for
+ARCHIVE_AFTER_DAYS move from booking_requests to booking_requests_archive
+in batches of ARCHIVE_BATCH_SIZE. Each batch is an INSERT ... SELECT and a
+DELETE by primary key in one short transaction, so the hot table and its
+indexes stay about the size of the last few weeks of traffic, which is all
+the scheduler, executor and health checks ever read.
+
+Archived rows keep their id; on SQLite booking_requests is an AUTOINCREMENT
+table, so a new booking never gets the id of an archived one. History reads go through user_bookings() and
+find_user_booking(), which fall back to the archive; archived bookings are
+read-only. Their automation traces are dropped when they are archived.
+"""
+import heapq
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal, select
+from config import Config
+from models import db, ArchivedBooking, BookingRequest, BookingStatus, BookingTrace
+
+ARCHIVED_STATUSES = (BookingStatus.SUCCESS, BookingStatus.FAILED, BookingStatus.CANCELED)
+
+def archivable_ids(cutoff: datetime, limit: int):
+    """Query for the next batch of booking ids to archive (served by ix_booking_requests_status_updated)"""
+    return db.session.query(BookingRequest.id).filter(
+        BookingRequest.status.in_(ARCHIVED_STATUSES),
+        BookingRequest.updated_at < cutoff
+    ).order_by(BookingRequest.id).limit(limit)
+
+def archive_bookings(older_than_days: float = None, batch_size: int = None, now: datetime = None) -> int:
+    """Move finished bookings last updated before the cutoff into the archive; returns how many moved"""
+    older_than_days = Config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    
+    hot = BookingRequest.__table__
+    columns = [column.name for column in hot.columns]
+    archived = 0
+    while True:
+        ids = [row.id for row in archivable_ids(cutoff, batch_size)]
+        if not ids:
+            break
+        
+        db.session.execute(insert(ArchivedBooking.__table__).from_select(
+            columns + ['archived_at'],
+            select(*hot.columns, literal(now, ArchivedBooking.archived_at.type)).where(hot.c.id.in_(ids))
+        ))
+        db.session.execute(delete(BookingTrace.__table__).where(BookingTrace.booking_id.in_(ids)))
+        db.session.execute(delete(hot).where(hot.c.id.in_(ids)))
+        db.session.commit()
+        
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    return archived
+
+def user_bookings(user_id, limit: int = None) -> list:
+    """A user's live and archived bookings, newest first"""
+    queries = [
+        model.query.filter_by(user_id=user_id).order_by(model.created_at.desc(), model.id.desc())
+        for model in (BookingRequest, ArchivedBooking)
+    ]
+    if limit is not None:
+        queries = [query.limit(limit) for query in queries]
+    
+    bookings = heapq.merge(*[query.all() for query in queries], key=lambda booking: (booking.created_at, booking.id), reverse=True)
+    return list(bookings)[:limit]
+
+def find_user_booking(booking_id, user_id):
+    """A user's booking by id, from the live table or else the archive"""
+    return (
+        BookingRequest.query.filter_by(id=booking_id, user_id=user_id).first()
+        or ArchivedBooking.query.filter_by(id=booking_id, user_id=user_id).first()
+    )
+
+def archive_status() -> dict:
+    return {
+        'enabled': Config.ARCHIVE_ENABLED,
+        'after_days': Config.ARCHIVE_AFTER_DAYS,
+        'live_bookings': db.session.query(func.count(BookingRequest.id)).scalar(),
+        'archived_bookings': db.session.query(func.count(ArchivedBooking.id)).scalar()
+    }
@@ -0,0 +1,315 @@
+"""
+Asyncio automation backend.
+
+All bookings share one event loop thread, one Playwright driver and one
+Chromium browser; each booking gets its own browser context (cookies,
+storage) and runs as a coroutine. A semaphore caps how many run at once.
+Executor threads only block on a future while their booking runs, so they
+no longer each carry a Playwright driver and browser of their own.
+"""
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from config import Config
+from services.booking_automation import LOGIN_FAILED, NO_OPTIONS
+from services.rate_limit import get_rate_limiter, site_host, RateLimitTimeout
+from services.retry import ERROR_TIMEOUT
+
+class AsyncAutomationBackend:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self.in_flight = 0
+        self.completed = 0
+        self.browser_launches = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._browser_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._thread = threading.Thread(target=self._run_loop, name='automation-loop', daemon=True)
+        self._thread.start()
+    
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    async def _get_browser(self):
+        """Shared browser, relaunched if it crashed or was closed"""
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    from playwright.async_api import async_playwright
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                self.browser_launches += 1
+            return self._browser
+    
+    async def _guarded(self, flow):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await flow(await self._get_browser())
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+    
+    def run(self, flow, timeout: float = None):
+        """
+        Run `flow(browser)` on the event loop and wait for its result from the
+        calling (synchronous) thread; the coroutine is cancelled on timeout.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._guarded(flow), self.loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+    
+    def metrics(self) -> dict:
+        return {
+            'concurrency': self.concurrency,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'browser_launches': self.browser_launches,
+            'browser_connected': bool(self._browser and self._browser.is_connected())
+        }
+    
+    async def _close(self):
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+    
+    def shutdown(self, timeout: float = 10):
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout)
+        except Exception as e:
+            print(f"Error closing automation browser: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_async_backend() -> AsyncAutomationBackend:
+    """Process-wide backend, started on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = AsyncAutomationBackend(Config.ASYNC_AUTOMATION_CONCURRENCY)
+        return _backend
+
+def shutdown_async_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.shutdown()
+            _backend = None
+
+class AsyncBookingFlow:
+    """The BookingAutomation steps written against playwright.async_api"""
+    
+    def __init__(self, automation):
+        self.automation = automation
+        self.tracer = automation.tracer
+        self.booking = automation.booking
+        # Set by the waiting thread when it gives up; guards the confirm click
+        self.abandoned = False
+        self._confirm_lock = threading.Lock()
+    
+    def abandon(self) -> bool:
+        """Stop the flow from confirming from now on; True if the confirm click was already sent"""
+        with self._confirm_lock:
+            self.abandoned = True
+            return self.automation.confirm_sent
+    
+    async def __call__(self, browser):
+        automation = self.automation
+        try:
+            with self.tracer.step('launch'):
+                context = await browser.new_context(**automation._context_options())
+                if automation.replay_har:
+                    # Unmatched requests fail instead of reaching the network
+                    await context.route_from_har(automation.replay_har, not_found='abort')
+                page = await context.new_page()
+            
+            if self.tracer.artifact_mode == 'playwright':
+                await context.tracing.start(screenshots=True, snapshots=True)
+            result = None
+            try:
+                result = await self._run_steps(page)
+                return result
+            finally:
+                await self._finish_trace(context, page, failed=not (result and result['success']))
+                # Closes this booking's context only; the browser is shared
+                await context.close()
+        
+        except Exception as e:
+            return automation._error_result(e)
+    
+    async def _finish_trace(self, context, page, failed: bool):
+        path = self.tracer.artifact_path_for(failed)
+        try:
+            if path and path.endswith('.zip'):
+                await context.tracing.stop(path=path)
+            elif path:
+                await page.screenshot(path=path, full_page=True)
+            elif self.tracer.artifact_mode == 'playwright':
+                await context.tracing.stop()
+        except Exception as e:
+            print(f"Could not save trace artifact for booking {self.booking.id}: {e}")
+            return
+        self.tracer.record_artifact(path)
+    
+    async def _run_steps(self, page):
+        if not await self._login(page):
+            return dict(LOGIN_FAILED)
+        
+        delay = self.automation._fire_delay()
+        if delay > 0:
+            with self.tracer.step('fire_wait'):
+                await asyncio.sleep(delay)
+        
+        lease = self.automation._search_lease()
+        try:
+            results = None
+            if lease:
+                with self.tracer.step('coalesce'):
+                    results = await lease.shared_results_async(Config.SEARCH_COALESCE_WAIT_SECONDS)
+            
+            option_url, failure = self.automation._shared_option(results)
+            if failure:
+                return failure
+            if option_url:
+                return self.automation._completed(await self._confirm_shared(page, option_url))
+            
+            failure = await self._take_search_token()
+            if failure:
+                return failure
+            await self._search(page)
+            
+            option, failure = await self._pick_option(page, lease)
+            if failure:
+                return failure
+            
+            return self.automation._completed(await self._confirm(page, option))
+        finally:
+            if lease:
+                lease.release()
+    
+    async def _take_search_token(self):
+        try:
+            with self.tracer.step('rate_limit'):
+                await get_rate_limiter().acquire_async(
+                    site_host(self.automation.site_url), timeout=Config.RATE_LIMIT_TIMEOUT_SECONDS
+                )
+        except RateLimitTimeout as e:
+            return self.automation._rate_limited_result(e)
+        return None
+    
+    async def _login(self, page) -> bool:
+        with self.tracer.step('login'):
+            username, password = self.automation._login_credentials()
+            
+            await page.goto(self.automation.site_url)
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+            
+            await page.fill('input[name="username"]', username)
+            await page.fill('input[name="password"]', password)
+            await page.click('button[type="submit"]')
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+            
+            return page.url.find('dashboard') != -1
+    
+    async def _search(self, page):
+        with self.tracer.step('search'):
+            await page.goto(f'{self.automation.site_url}/book')
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+            
+            for selector, value in self.automation._search_fields():
+                await page.fill(selector, value)
+            
+            await page.click('button[type="submit"]')
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+    
+    async def _pick_option(self, page, lease=None):
+        with self.tracer.step('results'):
+            await self.tracer.wait_async('.booking-results', page.wait_for_selector('.booking-results', timeout=30000))
+            
+            lowest_price_option = await page.query_selector('.booking-option:first-child')
+            leading = lease is not None and lease.leading
+            if not lowest_price_option:
+                if leading:
+                    lease.publish([])
+                return None, dict(NO_OPTIONS)
+            
+            price_text = None
+            if self.booking.max_price or leading:
+                price_element = await lowest_price_option.query_selector('.price')
+                price_text = await price_element.inner_text() if price_element else None
+            
+            if leading:
+                button = await lowest_price_option.query_selector('.book-button')
+                href = await button.get_attribute('href') if button else None
+                lease.publish([self.automation._result_option(page.url, price_text, href)])
+            
+            if self.booking.max_price and price_text:
+                failure = self.automation._price_failure(price_text)
+                if failure:
+                    return None, failure
+            
+            return lowest_price_option, None
+    
+    async def _confirm(self, page, option):
+        with self.tracer.step('confirm'):
+            await (await option.query_selector('.book-button')).click()
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+            return await self._confirm_booking(page)
+    
+    async def _confirm_shared(self, page, url: str):
+        with self.tracer.step('confirm'):
+            await page.goto(url)
+            await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+            return await self._confirm_booking(page)
+    
+    async def _confirm_booking(self, page):
+        if self.automation.dry_run:
+            # Stop here: button.confirm-booking is what actually buys the ticket
+            await self.tracer.wait_async('button.confirm-booking', page.wait_for_selector('button.confirm-booking'))
+            return None
+        
+        # Cancelling the future does not stop a flow mid-step, so the waiting
+        # thread and this check agree under a lock on whether the click happens
+        with self._confirm_lock:
+            if self.abandoned:
+                raise asyncio.CancelledError('Booking flow abandoned before confirming')
+            self.automation.confirm_sent = True
+        await page.click('button.confirm-booking')
+        await self.tracer.wait_async('networkidle', page.wait_for_load_state('networkidle'))
+        
+        try:
+            ref_element = await page.query_selector('.booking-reference')
+            if ref_element:
+                return await ref_element.inner_text()
+        except Exception:
+            pass
+        return None
+
+def run_async_booking(automation) -> dict:
+    """Bridge from an executor thread: run one booking on the shared loop and wait for it"""
+    flow = AsyncBookingFlow(automation)
+    try:
+        return get_async_backend().run(flow, timeout=Config.ASYNC_AUTOMATION_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        message = f'Browser automation exceeded {Config.ASYNC_AUTOMATION_TIMEOUT_SECONDS:.0f}s'
+        if flow.abandon():
+            # The site may have taken the booking
+            return automation._after_confirm_result(TimeoutError(message))
+        return {
+            'success': False,
+            'message': message,
+            'error_class': ERROR_TIMEOUT
+        }
+    except Exception as e:
+        # Browser launch and context errors surface here; classify them like the sync backend
+        return automation._error_result(e)
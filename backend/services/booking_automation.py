@@ -1,38 +1,129 @@
-from playwright.sync_api import sync_playwright
-from models import db, BookingRequest, BookingStatus, TravelCredential, User
+from models import db, BookingStatus, TravelCredential
 from utils.security import decrypt_data
-from datetime import datetime
+from config import Config
+from services.tracing import BookingTracer
+from services.events import status_event
+from services.status_writer import get_status_writer
+from services.rate_limit import get_rate_limiter, get_circuit_breaker, site_host, RateLimitTimeout
+from services.search_cache import SearchLease, get_search_cache, search_key
+from services.clock_sync import get_clock_sync
+from utils.booking_options import BookingOption, EMPTY_OPTION
+from services.retry import (
+    next_attempt_time, RETRY_POLICIES, SITE_FAILURES, ERROR_TIMEOUT, ERROR_NETWORK, ERROR_SITE,
+    ERROR_LOGIN, ERROR_NO_OPTIONS, ERROR_PRICE, ERROR_NO_CREDENTIALS, ERROR_RATE_LIMITED,
+    ERROR_CIRCUIT_OPEN, ERROR_UNKNOWN, ERROR_AFTER_CONFIRM
+)
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import urljoin
 import json
+import time
+
+LOGIN_FAILED = {
+    'success': False,
+    'message': 'Login failed - invalid credentials or site structure changed',
+    'error_class': ERROR_LOGIN
+}
+
+NO_OPTIONS = {
+    'success': False,
+    'message': 'No booking options available',
+    'error_class': ERROR_NO_OPTIONS
+}
+
+@dataclass(frozen=True, slots=True)
+class BookingSnapshot:
+    """
+    Immutable, session-free copy of what one booking attempt needs.
+    
+    The browser phase works only from this, so no ORM object can lazy-load
+    and no connection or transaction is held while the browser runs.
+    """
+    id: int
+    user_id: int
+    attempt_count: int
+    origin: str
+    destination: str
+    departure_date: date
+    scheduled_time: datetime = None
+    return_date: date = None
+    passengers: int = 1
+    max_price: Decimal = None
+    primary_option: BookingOption = EMPTY_OPTION
+    backup_option: BookingOption = EMPTY_OPTION
+    # Decrypted travel site credentials, once loaded
+    username: str = field(default=None, repr=False)
+    password: str = field(default=None, repr=False)
+    
+    @classmethod
+    def from_booking(cls, booking) -> 'BookingSnapshot':
+        if isinstance(booking, cls):
+            return booking
+        return cls(
+            id=booking.id,
+            user_id=booking.user_id,
+            attempt_count=booking.attempt_count,
+            origin=booking.origin,
+            destination=booking.destination,
+            departure_date=booking.departure_date,
+            scheduled_time=booking.scheduled_time,
+            return_date=booking.return_date,
+            passengers=booking.passengers,
+            max_price=booking.max_price,
+            primary_option=booking.primary_preferences,
+            backup_option=booking.backup_preferences
+        )
+    
+    def with_credentials(self, credentials: TravelCredential) -> 'BookingSnapshot':
+        return replace(
+            self,
+            username=decrypt_data(credentials.travel_site_username),
+            password=decrypt_data(credentials.travel_site_password)
+        )
+    
+    @property
+    def has_credentials(self) -> bool:
+        return self.username is not None
 
 class BookingAutomation:
     """Handles automated booking through browser simulation"""
     
-    def __init__(self, booking_request: BookingRequest, app_context):
-        self.booking = booking_request
+    def __init__(self, booking_request, app_context, dry_run: bool = False,
+                 replay_har: str = None, record_har: str = None, site_url: str = None):
+        # A BookingRequest is copied into a snapshot; results go back through the status writer
+        self.booking = BookingSnapshot.from_booking(booking_request)
         self.app_context = app_context
-        self.user = None
-        self.credentials = None
-        
+        self.login_override = None
+        self.pending_trace = None
+        # Dry run stops before the confirm click; replay serves site responses from a HAR file
+        self.dry_run = dry_run
+        self.replay_har = replay_har or Config.AUTOMATION_REPLAY_HAR
+        self.record_har = record_har
+        self.backend = Config.AUTOMATION_BACKEND
+        self.site_url = (site_url or Config.TARGET_TRAVEL_SITE_URL or 'https://example-travel-site.com').rstrip('/')
+        self.tracer = BookingTracer(self.booking.id, self.booking.attempt_count or 1)
+        # Set once the confirm click may have reached the site; from then on no failure is retried
+        self.confirm_sent = False
+        # The outcome status once it is written or queued; nothing may be queued after it
+        self.outcome = None
+    
     def execute(self):
         """Execute the automated booking"""
         with self.app_context:
             try:
-                # Load user and credentials
-                self.user = User.query.get(self.booking.user_id)
-                self.credentials = TravelCredential.query.filter_by(user_id=self.booking.user_id).first()
-                
-                if not self.credentials:
-                    self._update_booking_status(
-                        BookingStatus.FAILED,
-                        "No travel site credentials found"
-                    )
+                self._load_credentials()
+                if not self.booking.has_credentials:
+                    self._record_failure("No travel site credentials found", ERROR_NO_CREDENTIALS)
                     return False
                 
                 # Update status to processing
                 self._update_booking_status(BookingStatus.PROCESSING, "Starting booking automation")
                 
-                # Run browser automation
+                # Run browser automation. Nothing in here touches the session, which
+                # holds no connection until the result is written below
                 result = self._run_browser_automation()
+                self._save_trace('success' if result['success'] else result.get('error_class', ERROR_UNKNOWN))
                 
                 if result['success']:
                     self._update_booking_status(
@@ -42,144 +133,446 @@ class BookingAutomation:
                     )
                     return True
                 else:
-                    self._update_booking_status(
-                        BookingStatus.FAILED,
-                        result['message']
-                    )
+                    self._record_failure(result['message'], result.get('error_class', ERROR_UNKNOWN))
                     return False
-                    
+            
             except Exception as e:
-                self._update_booking_status(
-                    BookingStatus.FAILED,
-                    f"Error during automation: {str(e)}"
-                )
+                if self.outcome is not None:
+                    # A retry queued behind the outcome would overwrite it
+                    print(f"Error after booking {self.booking.id} reached {self.outcome.value}: {e}")
+                    return self.outcome == BookingStatus.SUCCESS
+                error_class = ERROR_AFTER_CONFIRM if self.confirm_sent else ERROR_UNKNOWN
+                self._save_trace(error_class)
+                self._record_failure(f"Error during automation: {str(e)}", error_class)
                 return False
     
+    def rehearse(self, username: str = None, password: str = None) -> dict:
+        """
+        Dry run for benchmarks and staging: run every step up to the confirm
+        click without touching the booking row, and return the result with
+        its trace. Credentials are taken from the arguments if given,
+        otherwise from the booking owner's saved credentials.
+        """
+        self.dry_run = True
+        with self.app_context:
+            if username is not None:
+                self.login_override = (username, password)
+            else:
+                self._load_credentials()
+                if not self.booking.has_credentials:
+                    return {
+                        'success': False,
+                        'message': 'No travel site credentials found',
+                        'error_class': ERROR_NO_CREDENTIALS,
+                        'trace': self.tracer.summary()
+                    }
+            
+            result = self._book_on_site()
+            return dict(result, trace=self.tracer.summary())
+    
+    def _load_credentials(self):
+        """Decrypt the owner's credentials into the snapshot in a short read, then release the connection"""
+        if self.booking.has_credentials:
+            return
+        credentials = TravelCredential.query.filter_by(user_id=self.booking.user_id).first()
+        if credentials:
+            self.booking = self.booking.with_credentials(credentials)
+        db.session.close()
+    
+    def _save_trace(self, outcome: str):
+        """Hold this attempt's trace; it is written with the next status update"""
+        if Config.TRACE_ENABLED and self.tracer.steps:
+            self.pending_trace = self.tracer.to_model(outcome)
+    
     def _run_browser_automation(self):
+        """Run the browser automation, throttled and guarded per target site"""
+        # The breaker comes first: a booking it turns away must not spend a
+        # rate-limit token. The token is taken right before the search
+        host = site_host(self.site_url)
+        breaker = get_circuit_breaker(host)
+        if not breaker.allow():
+            return {
+                'success': False,
+                'message': f'Circuit breaker open for {host}',
+                'error_class': ERROR_CIRCUIT_OPEN
+            }
+        
+        # Always report the outcome, or a half-open breaker never releases its probe
+        failed = True
+        try:
+            result = self._book_on_site()
+            failed = result.get('error_class') in SITE_FAILURES
+            return result
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+    
+    def _book_on_site(self):
         """Run the actual browser automation using Playwright"""
+        if self.backend == 'async':
+            # Runs as a coroutine on the shared event loop and browser
+            from services.async_automation import run_async_booking
+            return run_async_booking(self)
+        
+        # Imported here: Playwright is the heaviest import in the app and only executor threads need it
+        from playwright.sync_api import sync_playwright
+        
         try:
             with sync_playwright() as p:
-                # Launch browser in headless mode
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
-                page = context.new_page()
-                
-                # Decrypt credentials
-                username = decrypt_data(self.credentials.travel_site_username)
-                password = decrypt_data(self.credentials.travel_site_password)
-                
-                # Navigate to travel site
-                # NOTE: This is a placeholder implementation
-                # In production, replace with actual travel site selectors and logic
-                
-                page.goto('https://example-travel-site.com')
-                page.wait_for_load_state('networkidle')
-                
-                # Login
-                page.fill('input[name="username"]', username)
-                page.fill('input[name="password"]', password)
-                page.click('button[type="submit"]')
-                page.wait_for_load_state('networkidle')
-                
-                # Check if login was successful
-                if page.url.find('dashboard') == -1:
-                    browser.close()
-                    return {
-                        'success': False,
-                        'message': 'Login failed - invalid credentials or site structure changed'
-                    }
-                
-                # Navigate to booking page
-                page.goto('https://example-travel-site.com/book')
-                page.wait_for_load_state('networkidle')
-                
-                # Fill in search details
-                page.fill('input[name="origin"]', self.booking.origin)
-                page.fill('input[name="destination"]', self.booking.destination)
-                page.fill('input[name="departure_date"]', self.booking.departure_date.isoformat())
-                
-                if self.booking.return_date:
-                    page.fill('input[name="return_date"]', self.booking.return_date.isoformat())
-                
-                page.fill('input[name="passengers"]', str(self.booking.passengers))
-                
-                # Submit search
-                page.click('button[type="submit"]')
-                page.wait_for_load_state('networkidle')
-                
-                # Wait for results to load
-                page.wait_for_selector('.booking-results', timeout=30000)
-                
-                # Try to find and book the lowest price option
-                # This is a simplified example - actual implementation would need
-                # more sophisticated logic to handle various scenarios
-                
-                lowest_price_option = page.query_selector('.booking-option:first-child')
-                
-                if not lowest_price_option:
-                    browser.close()
-                    return {
-                        'success': False,
-                        'message': 'No booking options available'
-                    }
+                with self.tracer.step('launch'):
+                    # Launch browser in headless mode
+                    browser = p.chromium.launch(headless=True)
+                    context = browser.new_context(**self._context_options())
+                    if self.replay_har:
+                        # Unmatched requests fail instead of reaching the network
+                        context.route_from_har(self.replay_har, not_found='abort')
+                    page = context.new_page()
                 
-                # Check price if max_price is set
-                if self.booking.max_price:
-                    price_element = lowest_price_option.query_selector('.price')
-                    if price_element:
-                        price_text = price_element.inner_text().replace('$', '').replace(',', '')
-                        try:
-                            price = float(price_text)
-                            if price > float(self.booking.max_price):
-                                browser.close()
-                                return {
-                                    'success': False,
-                                    'message': f'Lowest price ${price} exceeds max price ${self.booking.max_price}'
-                                }
-                        except ValueError:
-                            pass
-                
-                # Click book button
-                lowest_price_option.query_selector('.book-button').click()
-                page.wait_for_load_state('networkidle')
-                
-                # Confirm booking
-                page.click('button.confirm-booking')
-                page.wait_for_load_state('networkidle')
-                
-                # Try to extract booking reference
-                booking_ref = None
+                self.tracer.start_browser_trace(context)
+                result = None
                 try:
-                    ref_element = page.query_selector('.booking-reference')
-                    if ref_element:
-                        booking_ref = ref_element.inner_text()
-                except:
-                    pass
-                
-                browser.close()
-                
-                return {
-                    'success': True,
-                    'message': 'Booking completed successfully',
-                    'booking_reference': booking_ref
-                }
-                
+                    result = self._run_steps(page)
+                    return result
+                finally:
+                    self.tracer.finish_browser_trace(context, page, failed=not (result and result['success']))
+                    # Closing the context is what writes a recorded HAR
+                    context.close()
+                    browser.close()
+        
         except Exception as e:
+            return self._error_result(e)
+    
+    def _context_options(self) -> dict:
+        """Browser context settings shared by the sync and async backends"""
+        options = {
+            'viewport': {'width': 1920, 'height': 1080},
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        if self.record_har:
+            options['record_har_path'] = self.record_har
+        return options
+    
+    def _error_result(self, e: Exception) -> dict:
+        """Failure result for an exception raised by the browser flow"""
+        from playwright.sync_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+        
+        if self.confirm_sent:
+            return self._after_confirm_result(e)
+        if isinstance(e, PlaywrightTimeoutError):
+            return {
+                'success': False,
+                'message': f'Browser automation timed out: {str(e)}',
+                'error_class': ERROR_TIMEOUT
+            }
+        if isinstance(e, PlaywrightError):
             return {
                 'success': False,
-                'message': f'Browser automation error: {str(e)}'
+                'message': f'Browser automation error: {str(e)}',
+                'error_class': ERROR_NETWORK if 'net::' in str(e) else ERROR_SITE
             }
+        return {
+            'success': False,
+            'message': f'Browser automation error: {str(e)}',
+            'error_class': ERROR_UNKNOWN
+        }
+    
+    def _after_confirm_result(self, e: Exception) -> dict:
+        """Failure result once the confirm click was sent: the booking may exist, so it is left for review"""
+        return {
+            'success': False,
+            'message': f'Failed after sending the booking confirmation, check the site before retrying: {str(e)}',
+            'error_class': ERROR_AFTER_CONFIRM
+        }
     
-    def _update_booking_status(self, status: BookingStatus, message: str, booking_ref: str = None):
-        """Update booking status in database"""
-        self.booking.status = status
-        self.booking.result_message = message
-        self.booking.executed_at = datetime.utcnow()
+    def _run_steps(self, page):
+        """Log in, search (or reuse an identical search), pick an option and confirm it; each step is traced"""
+        # NOTE: This is a placeholder implementation
+        # In production, replace with actual travel site selectors and logic
+        if not self._login(page):
+            return dict(LOGIN_FAILED)
         
+        delay = self._fire_delay()
+        if delay > 0:
+            with self.tracer.step('fire_wait'):
+                time.sleep(delay)
+        
+        lease = self._search_lease()
+        try:
+            results = None
+            if lease:
+                with self.tracer.step('coalesce'):
+                    results = lease.shared_results(Config.SEARCH_COALESCE_WAIT_SECONDS)
+            
+            option_url, failure = self._shared_option(results)
+            if failure:
+                return failure
+            if option_url:
+                return self._completed(self._confirm_shared(page, option_url))
+            
+            failure = self._take_search_token()
+            if failure:
+                return failure
+            self._search(page)
+            
+            option, failure = self._pick_option(page, lease)
+            if failure:
+                return failure
+            
+            return self._completed(self._confirm(page, option))
+        finally:
+            if lease:
+                lease.release()
+    
+    def _take_search_token(self):
+        """
+        Wait for the site's rate-limit token; taken just before the search,
+        the request the limit spaces out. Returns the failure if none came in time
+        """
+        try:
+            with self.tracer.step('rate_limit'):
+                get_rate_limiter().acquire(site_host(self.site_url), timeout=Config.RATE_LIMIT_TIMEOUT_SECONDS)
+        except RateLimitTimeout as e:
+            return self._rate_limited_result(e)
+        return None
+    
+    @staticmethod
+    def _rate_limited_result(e: RateLimitTimeout) -> dict:
+        return {
+            'success': False,
+            'message': str(e),
+            'error_class': ERROR_RATE_LIMITED
+        }
+    
+    def _fire_delay(self) -> float:
+        """
+        Seconds to wait after login so the search reaches the site when its
+        clock reads the scheduled time; retries and dry runs do not wait
+        """
+        if self.dry_run or not self.booking.scheduled_time or not Config.CLOCK_SYNC_ENABLED:
+            return 0.0
+        return get_clock_sync().fire_delay(site_host(self.site_url), self.booking.scheduled_time)
+    
+    def _search_lease(self):
+        """This booking's share of a coalesced search, or None if it searches on its own"""
+        # Dry runs are benchmarks and rehearsals: they must measure a real search
+        if not Config.SEARCH_CACHE_ENABLED or self.dry_run:
+            return None
+        return SearchLease(get_search_cache(), search_key(site_host(self.site_url), self.booking))
+    
+    def _shared_option(self, results):
+        """(booking URL, failure result) from another booking's search; (None, None) means search here"""
+        if results is None:
+            return None, None
+        if not results:
+            return None, dict(NO_OPTIONS)
+        
+        option = results[0]
+        if self.booking.max_price and option['price']:
+            failure = self._price_failure(option['price'])
+            if failure:
+                return None, failure
+        return option['url'], None
+    
+    @staticmethod
+    def _result_option(page_url: str, price_text: str, href: str) -> dict:
+        """Cache entry for the option a leading search picked"""
+        return {'price': price_text, 'url': urljoin(page_url, href) if href else None}
+    
+    def _completed(self, booking_ref) -> dict:
+        """Result once the flow got through the confirm step"""
+        if self.dry_run:
+            return {
+                'success': True,
+                'message': 'Dry run completed before confirming booking',
+                'dry_run': True
+            }
+        
+        return {
+            'success': True,
+            'message': 'Booking completed successfully',
+            'booking_reference': booking_ref
+        }
+    
+    def _login_credentials(self):
+        """(username, password) for the travel site"""
+        if self.login_override:
+            return self.login_override
+        return self.booking.username, self.booking.password
+    
+    def _search_fields(self) -> list:
+        """(selector, value) pairs for the search form"""
+        fields = [
+            ('input[name="origin"]', self.booking.origin),
+            ('input[name="destination"]', self.booking.destination),
+            ('input[name="departure_date"]', self.booking.departure_date.isoformat())
+        ]
+        if self.booking.return_date:
+            fields.append(('input[name="return_date"]', self.booking.return_date.isoformat()))
+        fields.append(('input[name="passengers"]', str(self.booking.passengers)))
+        return fields
+    
+    def _price_failure(self, price_text: str):
+        """Failure result if the option's price is above the booking's max price"""
+        try:
+            price = float(price_text.replace('$', '').replace(',', ''))
+        except ValueError:
+            return None
+        
+        if price > float(self.booking.max_price):
+            return {
+                'success': False,
+                'message': f'Lowest price ${price} exceeds max price ${self.booking.max_price}',
+                'error_class': ERROR_PRICE
+            }
+        return None
+    
+    def _login(self, page) -> bool:
+        """Log in to the travel site; returns False if the site rejected the credentials"""
+        with self.tracer.step('login'):
+            username, password = self._login_credentials()
+            
+            page.goto(self.site_url)
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+            
+            page.fill('input[name="username"]', username)
+            page.fill('input[name="password"]', password)
+            page.click('button[type="submit"]')
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+            
+            # Check if login was successful
+            return page.url.find('dashboard') != -1
+    
+    def _search(self, page):
+        """Fill in and submit the search form"""
+        with self.tracer.step('search'):
+            # Navigate to booking page
+            page.goto(f'{self.site_url}/book')
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+            
+            # Fill in search details
+            for selector, value in self._search_fields():
+                page.fill(selector, value)
+            
+            # Submit search
+            page.click('button[type="submit"]')
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+    
+    def _pick_option(self, page, lease=None):
+        """Wait for results and pick the lowest price option; returns (option, failure result)"""
+        with self.tracer.step('results'):
+            self.tracer.wait('.booking-results', page.wait_for_selector, '.booking-results', timeout=30000)
+            
+            # This is a simplified example - actual implementation would need
+            # more sophisticated logic to handle various scenarios
+            lowest_price_option = page.query_selector('.booking-option:first-child')
+            leading = lease is not None and lease.leading
+            
+            if not lowest_price_option:
+                if leading:
+                    lease.publish([])
+                return None, dict(NO_OPTIONS)
+            
+            price_text = None
+            if self.booking.max_price or leading:
+                price_element = lowest_price_option.query_selector('.price')
+                price_text = price_element.inner_text() if price_element else None
+            
+            if leading:
+                # Publish before this booking's own price check: waiting bookings
+                # may have a different max price
+                button = lowest_price_option.query_selector('.book-button')
+                href = button.get_attribute('href') if button else None
+                lease.publish([self._result_option(page.url, price_text, href)])
+            
+            # Check price if max_price is set
+            if self.booking.max_price and price_text:
+                failure = self._price_failure(price_text)
+                if failure:
+                    return None, failure
+            
+            return lowest_price_option, None
+    
+    def _confirm(self, page, option):
+        """Book the chosen option and return the booking reference, if shown"""
+        with self.tracer.step('confirm'):
+            # Click book button
+            option.query_selector('.book-button').click()
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+            return self._confirm_booking(page)
+    
+    def _confirm_shared(self, page, url: str):
+        """Open the option another booking's search found and book it"""
+        with self.tracer.step('confirm'):
+            page.goto(url)
+            self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+            return self._confirm_booking(page)
+    
+    def _confirm_booking(self, page):
+        """On the option's booking page: confirm and return the booking reference, if shown"""
+        if self.dry_run:
+            # Stop here: button.confirm-booking is what actually buys the ticket
+            self.tracer.wait('button.confirm-booking', page.wait_for_selector, 'button.confirm-booking')
+            return None
+        
+        # Confirm booking. Flagged before the click: a click that raises may still have reached the site
+        self.confirm_sent = True
+        page.click('button.confirm-booking')
+        self.tracer.wait('networkidle', page.wait_for_load_state, 'networkidle')
+        
+        # Try to extract booking reference
+        try:
+            ref_element = page.query_selector('.booking-reference')
+            if ref_element:
+                return ref_element.inner_text()
+        except:
+            pass
+        return None
+    
+    def _record_failure(self, message: str, error_class: str):
+        """Record a failed attempt and either schedule a retry, dead-letter or fail the booking"""
+        run_at = next_attempt_time(self.booking, error_class)
+        
+        if run_at:
+            self._update_booking_status(
+                BookingStatus.PENDING,
+                f"Attempt {self.booking.attempt_count} failed: {message} (retrying at {run_at.isoformat()})",
+                last_error_class=error_class,
+                next_attempt_at=run_at
+            )
+        elif error_class == ERROR_AFTER_CONFIRM:
+            self._update_booking_status(BookingStatus.NEEDS_REVIEW, message, last_error_class=error_class)
+        elif error_class in RETRY_POLICIES:
+            # Transient error, but retries are exhausted or out of the fare window
+            self._update_booking_status(BookingStatus.DEAD_LETTER, message, last_error_class=error_class)
+        else:
+            self._update_booking_status(BookingStatus.FAILED, message, last_error_class=error_class)
+    
+    def _update_booking_status(self, status: BookingStatus, message: str, booking_ref: str = None, **columns):
+        """
+        Hand the status update (and any pending trace) to the status writer.
+        Outcomes wait until their batch is committed, since the scheduler reads
+        them back; the PROCESSING update does not hold up the browser run.
+        An outcome still queued when the wait times out is logged, not raised:
+        the writer still applies it, and anything queued after it would win.
+        """
+        values = dict(columns, status=status, result_message=message, executed_at=datetime.utcnow())
         if booking_ref:
-            self.booking.booking_reference = booking_ref
+            values['booking_reference'] = booking_ref
+        
+        transition = get_status_writer().submit(
+            self.booking.id, values, trace=self.pending_trace, event=status_event(self.booking, values)
+        )
+        self.pending_trace = None
+        if status == BookingStatus.PROCESSING:
+            return
         
-        db.session.commit()
+        try:
+            transition.wait(Config.STATUS_WRITER_WAIT_SECONDS)
+        except TimeoutError as e:
+            # Still queued, and the writer applies it in order: treat it as persisted
+            print(f"{e}; leaving it to the status writer")
+        self.outcome = status
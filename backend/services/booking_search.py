@@ -0,0 +1,146 @@
+"""
+Admin booking search.
+
+Filters live bookings by origin, destination and result_message text
+(prefix or substring), status, departure and scheduled date ranges and the
+exact user email. Results are ordered by scheduled_time then id, newest
+first, and paged with a keyset cursor, so page N costs the same as page 1.
+
+Text filters are served by indexes: trigram GIN indexes on PostgreSQL and
+the booking_search FTS5 trigram table on SQLite (see utils/schema.py).
+Archived bookings are not searched.
+"""
+import base64
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import column, select, table, tuple_
+from models import db, BookingRequest, BookingStatus, User
+from utils.schema import SQLITE_SEARCH_TABLE
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+TEXT_FIELDS = ('origin', 'destination', 'result_message')
+MATCH_MODES = ('prefix', 'contains')
+
+# The SQLite FTS5 table, for subqueries on its trigram index
+search_table = table(SQLITE_SEARCH_TABLE, column('rowid'), *(column(field) for field in TEXT_FIELDS))
+
+class SearchError(ValueError):
+    """An invalid search parameter"""
+
+def _like_pattern(value: str, mode: str) -> tuple:
+    """(pattern, escape) for a LIKE match; escaping only when needed keeps the FTS5 trigram index usable"""
+    escape = None
+    if '%' in value or '_' in value:
+        escape = '\\'
+        value = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return (f'{value}%' if mode == 'prefix' else f'%{value}%'), escape
+
+def _text_filter(dialect: str, field: str, value: str, mode: str):
+    pattern, escape = _like_pattern(value, mode)
+    if dialect == 'sqlite':
+        return BookingRequest.id.in_(
+            select(search_table.c.rowid).where(search_table.c[field].like(pattern, escape=escape))
+        )
+    return getattr(BookingRequest, field).ilike(pattern, escape=escape)
+
+def _parse_date(args, name: str):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f'{name} must be a date as YYYY-MM-DD')
+
+def _parse_datetime(args, name: str, end: bool = False):
+    """A datetime or date (inclusive of the whole day when it ends a range)"""
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        if len(value) == 10:
+            day = datetime.combine(date.fromisoformat(value), time())
+            return day + timedelta(days=1) if end else day
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f'{name} must be an ISO date or datetime')
+
+def encode_cursor(booking) -> str:
+    raw = f'{booking.scheduled_time.isoformat()}|{booking.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        scheduled, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(scheduled), int(booking_id)
+    except ValueError:
+        raise SearchError('Invalid cursor')
+
+def build_query(args, dialect: str):
+    """Query for request args; raises SearchError on invalid parameters"""
+    query = BookingRequest.query
+    
+    match = args.get('match', 'prefix')
+    if match not in MATCH_MODES:
+        raise SearchError(f"match must be one of {', '.join(MATCH_MODES)}")
+    for field in TEXT_FIELDS:
+        value = (args.get(field) or '').strip()
+        if value:
+            # result_message is free text: always a substring match
+            query = query.filter(_text_filter(dialect, field, value, 'contains' if field == 'result_message' else match))
+    
+    if args.get('status'):
+        try:
+            statuses = [BookingStatus(status.strip().lower()) for status in args['status'].split(',')]
+        except ValueError:
+            raise SearchError(f"status must be one of {', '.join(status.value for status in BookingStatus)}")
+        query = query.filter(BookingRequest.status.in_(statuses))
+    
+    departure_from, departure_to = _parse_date(args, 'departure_from'), _parse_date(args, 'departure_to')
+    if departure_from:
+        query = query.filter(BookingRequest.departure_date >= departure_from)
+    if departure_to:
+        query = query.filter(BookingRequest.departure_date <= departure_to)
+    
+    scheduled_from, scheduled_to = _parse_datetime(args, 'scheduled_from'), _parse_datetime(args, 'scheduled_to', end=True)
+    if scheduled_from:
+        query = query.filter(BookingRequest.scheduled_time >= scheduled_from)
+    if scheduled_to:
+        query = query.filter(BookingRequest.scheduled_time < scheduled_to)
+    
+    if args.get('email'):
+        query = query.filter(BookingRequest.user_id == select(User.id).where(User.email == args['email'].strip()).scalar_subquery())
+    
+    if args.get('cursor'):
+        query = query.filter(tuple_(BookingRequest.scheduled_time, BookingRequest.id) < decode_cursor(args['cursor']))
+    
+    return query.order_by(BookingRequest.scheduled_time.desc(), BookingRequest.id.desc())
+
+def search_bookings(args) -> dict:
+    """One page of matching bookings with their user's email, and the cursor for the next page"""
+    try:
+        limit = min(int(args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise SearchError('limit must be an integer')
+    if limit < 1:
+        raise SearchError('limit must be positive')
+    
+    # One row past the page tells whether there is a next page without a COUNT
+    bookings = build_query(args, db.engine.dialect.name).limit(limit + 1).all()
+    has_more = len(bookings) > limit
+    bookings = bookings[:limit]
+    
+    emails = dict(db.session.query(User.id, User.email).filter(
+        User.id.in_({booking.user_id for booking in bookings})
+    )) if bookings else {}
+    results = []
+    for booking in bookings:
+        data = booking.to_dict()
+        data['user_email'] = emails.get(booking.user_id)
+        results.append(data)
+    
+    return {
+        'bookings': results,
+        'next_cursor': encode_cursor(bookings[-1]) if has_more else None
+    }
@@ -0,0 +1,140 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from config import Config
+from models import db, BookingRequest, BookingStatus
+from services.executor import get_executor
+
+def slot_start(scheduled_time: datetime) -> datetime:
+    """Start of the (UTC) hour slot a booking fires in"""
+    return scheduled_time.replace(minute=0, second=0, microsecond=0)
+
+def _hour_bucket(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc('hour', column)
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+def pending_in_slot(scheduled_time: datetime, exclude_id: int = None) -> int:
+    """Pending bookings in a slot, counted in the database (ix_booking_requests_status_scheduled)"""
+    start = slot_start(scheduled_time)
+    query = db.session.query(func.count(BookingRequest.id)).filter(
+        BookingRequest.status == BookingStatus.PENDING,
+        BookingRequest.scheduled_time >= start,
+        BookingRequest.scheduled_time < start + timedelta(hours=1)
+    )
+    if exclude_id is not None:
+        query = query.filter(BookingRequest.id != exclude_id)
+    return query.scalar()
+
+class SlotIndex:
+    """
+    In-memory count of pending bookings per hour slot, for the forecast.
+
+    Each process adjusts its own index for the bookings it creates, moves
+    and cancels, and reloads it every CAPACITY_RESYNC_SECONDS. With several
+    workers, the forecast may lag changes made on other workers by up to
+    that long. Admission does not use the index.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def load(self, now: datetime = None):
+        """Rebuild the index from the database with a single GROUP BY"""
+        now = now or datetime.utcnow()
+        bucket = _hour_bucket(BookingRequest.scheduled_time)
+        rows = db.session.query(bucket, func.count(BookingRequest.id)).filter(
+            BookingRequest.status == BookingStatus.PENDING,
+            BookingRequest.scheduled_time >= slot_start(now)
+        ).group_by(bucket).all()
+
+        counts = Counter()
+        for slot, count in rows:
+            if isinstance(slot, str):
+                slot = datetime.fromisoformat(slot)
+            counts[slot.replace(tzinfo=None)] = count
+
+        with self._lock:
+            self._counts = counts
+            self.loaded_at = now
+
+    def add(self, scheduled_time: datetime):
+        with self._lock:
+            self._counts[slot_start(scheduled_time)] += 1
+
+    def remove(self, scheduled_time: datetime):
+        slot = slot_start(scheduled_time)
+        with self._lock:
+            if self._counts[slot] > 1:
+                self._counts[slot] -= 1
+            else:
+                self._counts.pop(slot, None)
+
+    def count(self, scheduled_time: datetime) -> int:
+        with self._lock:
+            return self._counts.get(slot_start(scheduled_time), 0)
+
+    def slots(self, start: datetime, end: datetime) -> dict:
+        with self._lock:
+            return {slot: count for slot, count in self._counts.items() if start <= slot < end}
+
+class CapacityPlanner:
+    """
+    Compares scheduled load per hour slot with what the executor can start.
+
+    A slot can start roughly `workers * window / seconds_per_booking`
+    bookings, where the window is how long after the scheduled time a booking
+    may still start and seconds_per_booking is measured by the executor (or
+    taken from Config until it has run anything).
+    """
+
+    def __init__(self, index: SlotIndex):
+        self.index = index
+
+    def ensure_loaded(self):
+        stale_after = timedelta(seconds=Config.CAPACITY_RESYNC_SECONDS)
+        if self.index.loaded_at is None or datetime.utcnow() - self.index.loaded_at > stale_after:
+            self.index.load()
+
+    def slot_capacity(self) -> int:
+        executor = get_executor()
+        workers = executor.max_workers if executor else Config.EXECUTOR_MAX_WORKERS
+        seconds_per_booking = (executor.avg_run_seconds if executor else None) or Config.CAPACITY_DEFAULT_BOOKING_SECONDS
+        return int(workers * Config.CAPACITY_START_WINDOW_SECONDS / seconds_per_booking)
+
+    def check(self, scheduled_time: datetime, booking_id: int = None) -> dict:
+        """Return the load a new booking at this time would see; booking_id is one being moved there"""
+        # Counted in the database, so bookings made through other workers are included
+        scheduled = pending_in_slot(scheduled_time, exclude_id=booking_id)
+        capacity = self.slot_capacity()
+        return {
+            'slot': slot_start(scheduled_time).isoformat(),
+            'scheduled': scheduled,
+            'capacity': capacity,
+            'over_capacity': scheduled + 1 > capacity
+        }
+
+    def forecast(self, days: int, now: datetime = None) -> list:
+        """Per-slot load for every non-empty slot in the next `days` days"""
+        self.ensure_loaded()
+        now = now or datetime.utcnow()
+        capacity = self.slot_capacity()
+        slots = self.index.slots(slot_start(now), now + timedelta(days=days))
+        return [
+            {
+                'slot': slot.isoformat(),
+                'scheduled': count,
+                'capacity': capacity,
+                'utilization': round(count / capacity, 3) if capacity else None,
+                'over_capacity': count > capacity
+            }
+            for slot, count in sorted(slots.items())
+        ]
+
+def get_planner() -> CapacityPlanner:
+    """Return the capacity planner for the current app"""
+    return current_app.extensions.setdefault('capacity_planner', CapacityPlanner(SlotIndex()))
@@ -0,0 +1,167 @@
+"""
+Target-site clock synchronization.
+
+Fares open at midnight by the travel site's clock, not ours. ClockSync
+estimates each site's offset from our clock and the round-trip time to it,
+and BookingAutomation waits after logging in until the site's midnight
+minus half the RTT, so the search arrives as the fares open.
+
+Two sources of site time:
+  Date header  every HTTP response carries one, but only to the second.
+               Each sample bounds the offset to an interval (the server
+               stamped some second D somewhere between our send and
+               receive), and samples spread across a second narrow the
+               intersection to roughly the RTT.
+  time URL     CLOCK_SYNC_TIME_URL returning epoch seconds (plain number or
+               JSON field); the offset is the median of the lowest-RTT
+               samples, NTP style.
+
+Requests reuse one keep-alive connection, and the first response is
+discarded, so handshakes do not count as RTT.
+"""
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from config import Config
+from services.rate_limit import site_host
+
+# A new estimate this far from the running one replaces it instead of being smoothed in
+CLOCK_JUMP_SECONDS = 1.0
+SMOOTHING = 0.5
+
+def utc_timestamp(moment: datetime) -> float:
+    """Epoch seconds of a naive UTC datetime"""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+def estimate_from_dates(samples) -> dict:
+    """
+    Offset from (sent, received, date_header_epoch) samples: each bounds the
+    offset to [D - received, D + 1 - sent]; the estimate is the middle of the
+    intersection. Inconsistent samples (an empty intersection, e.g. a cached
+    Date) fall back to the median of the per-sample midpoints.
+    """
+    low = max(date - received for sent, received, date in samples)
+    high = min(date + 1 - sent for sent, received, date in samples)
+    rtt = statistics.median(received - sent for sent, received, _ in samples)
+    if low > high:
+        offset = statistics.median(date + 0.5 - (sent + received) / 2 for sent, received, date in samples)
+        return {'offset': offset, 'rtt': rtt, 'uncertainty': 0.5 + rtt / 2}
+    return {'offset': (low + high) / 2, 'rtt': rtt, 'uncertainty': (high - low) / 2}
+
+def estimate_from_times(samples) -> dict:
+    """Offset from (sent, received, server_epoch) samples: median over the lowest-RTT third"""
+    ranked = sorted(samples, key=lambda sample: sample[1] - sample[0])
+    best = ranked[:max(len(ranked) // 3, 1)]
+    rtt = best[0][1] - best[0][0]
+    offset = statistics.median(server - (sent + received) / 2 for sent, received, server in best)
+    return {'offset': offset, 'rtt': rtt, 'uncertainty': rtt / 2}
+
+class ClockSync:
+    """Running clock offset and RTT per target site host"""
+    
+    def __init__(self, samples: int, timeout: float, max_age: float, time_url: str = None,
+                 time_field: str = 'time', clock=time.time):
+        self.samples = samples
+        self.timeout = timeout
+        self.max_age = max_age
+        self.time_url = time_url
+        self.time_field = time_field
+        self.clock = clock
+        self._sites = {}
+        self._lock = threading.Lock()
+    
+    def _sample(self, session, url: str, read_time) -> tuple:
+        sent = self.clock()
+        response = session.get(url, timeout=self.timeout) if self.time_url else session.head(url, timeout=self.timeout)
+        received = self.clock()
+        response.raise_for_status()
+        return sent, received, read_time(response)
+    
+    def _date_header(self, response) -> float:
+        date = response.headers.get('Date')
+        if not date:
+            raise ValueError('response has no Date header')
+        return parsedate_to_datetime(date).timestamp()
+    
+    def _time_body(self, response) -> float:
+        try:
+            return float(response.text)
+        except ValueError:
+            return float(response.json()[self.time_field])
+    
+    def measure(self, site_url: str) -> dict:
+        """Sample the site's clock and return {'offset', 'rtt', 'uncertainty'} in seconds"""
+        url = self.time_url or site_url
+        read_time = self._time_body if self.time_url else self._date_header
+        with requests.Session() as session:
+            # Warm the connection so TCP/TLS setup is not measured as RTT
+            self._sample(session, url, read_time)
+            samples = []
+            for i in range(self.samples):
+                if not self.time_url and i:
+                    # Spread Date samples across a second so they straddle a tick
+                    time.sleep(1.0 / self.samples)
+                samples.append(self._sample(session, url, read_time))
+        
+        estimate = estimate_from_times(samples) if self.time_url else estimate_from_dates(samples)
+        estimate['source'] = 'time_url' if self.time_url else 'date_header'
+        return estimate
+    
+    def sync(self, site_url: str) -> dict:
+        """Measure a site and fold the result into its running estimate"""
+        estimate = self.measure(site_url)
+        host = site_host(site_url)
+        with self._lock:
+            current = self._sites.get(host)
+            if current and abs(estimate['offset'] - current['offset']) < CLOCK_JUMP_SECONDS:
+                estimate['offset'] = current['offset'] + SMOOTHING * (estimate['offset'] - current['offset'])
+                estimate['rtt'] = current['rtt'] + SMOOTHING * (estimate['rtt'] - current['rtt'])
+            estimate['synced_at'] = self.clock()
+            self._sites[host] = estimate
+        return dict(estimate)
+    
+    def estimate(self, host: str):
+        """Running estimate for a host, or None if it was never synced or is older than max_age"""
+        with self._lock:
+            estimate = self._sites.get(host)
+        if estimate is None or self.clock() - estimate['synced_at'] > self.max_age:
+            return None
+        return estimate
+    
+    def fire_delay(self, host: str, site_time: datetime) -> float:
+        """
+        Seconds from now until a request should be sent so it reaches the site
+        when the site's clock reads site_time (naive UTC); negative if that has
+        passed. Without a fresh estimate our own clock is used.
+        """
+        estimate = self.estimate(host) or {'offset': 0.0, 'rtt': 0.0}
+        send_at = utc_timestamp(site_time) - estimate['offset'] - estimate['rtt'] / 2
+        return send_at - self.clock()
+    
+    def status(self) -> dict:
+        with self._lock:
+            sites = {host: dict(estimate) for host, estimate in self._sites.items()}
+        now = self.clock()
+        for estimate in sites.values():
+            estimate['age_seconds'] = round(now - estimate.pop('synced_at'), 1)
+        return sites
+
+_clock_sync = None
+_clock_sync_lock = threading.Lock()
+
+def get_clock_sync() -> ClockSync:
+    """Process-wide clock sync configured from Config"""
+    global _clock_sync
+    with _clock_sync_lock:
+        if _clock_sync is None:
+            _clock_sync = ClockSync(
+                samples=Config.CLOCK_SYNC_SAMPLES,
+                timeout=Config.CLOCK_SYNC_TIMEOUT_SECONDS,
+                max_age=Config.CLOCK_SYNC_MAX_AGE_SECONDS,
+                time_url=Config.CLOCK_SYNC_TIME_URL,
+                time_field=Config.CLOCK_SYNC_TIME_FIELD
+            )
+        return _clock_sync
@@ -0,0 +1,94 @@
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from config import Config
+from models import db, ArchivedBooking, BookingRequest, BookingStatus, Subscription, TravelCredential
+from services.archive import user_bookings
+from utils.db_routing import RoutingSession
+
+RECENT_BOOKINGS = 5
+
+# Rows that change what a user's dashboard shows
+DASHBOARD_MODELS = (BookingRequest, Subscription, TravelCredential)
+
+def build_dashboard(user_id: int) -> dict:
+    """Status counts, recent bookings, subscription and credential presence, archived history included"""
+    counts = {status.value: 0 for status in BookingStatus}
+    for model in (BookingRequest, ArchivedBooking):
+        for status, count in db.session.query(model.status, func.count(model.id)).filter(
+            model.user_id == user_id
+        ).group_by(model.status):
+            counts[status.value] += count
+    counts['total'] = sum(counts.values())
+    
+    recent = user_bookings(user_id, limit=RECENT_BOOKINGS)
+    
+    subscription = Subscription.query.filter_by(user_id=user_id).first()
+    has_credentials = db.session.query(
+        TravelCredential.query.filter_by(user_id=user_id).exists()
+    ).scalar()
+    
+    return {
+        'counts': counts,
+        'recent_bookings': [booking.to_dict() for booking in recent],
+        'subscription': subscription.to_dict() if subscription else None,
+        'has_credentials': bool(has_credentials)
+    }
+
+class DashboardCache:
+    """
+    user_id -> dashboard payload.
+    
+    Entries are dropped when a commit touches the user's bookings,
+    subscription or credentials; the TTL covers writes made by other
+    processes.
+    """
+    
+    def __init__(self, ttl_seconds: float, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, user_id) -> dict:
+        user_id = int(user_id)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                return entry[0]
+        
+        dashboard = build_dashboard(user_id)
+        with self._lock:
+            self._entries[user_id] = (dashboard, now + self.ttl_seconds)
+        return dashboard
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+def get_dashboard_cache() -> DashboardCache:
+    """Return the dashboard cache for the current app"""
+    return current_app.extensions.setdefault(
+        'dashboard_cache', DashboardCache(Config.DASHBOARD_CACHE_TTL_SECONDS)
+    )
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_dashboard_changes(session, flush_context):
+    users = session.info.setdefault('dashboard_users', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, DASHBOARD_MODELS) and obj.user_id is not None:
+            users.add(obj.user_id)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_dashboards(session):
+    users = session.info.pop('dashboard_users', None)
+    if users and has_app_context():
+        cache = get_dashboard_cache()
+        for user_id in users:
+            cache.invalidate(user_id)
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard_dashboard_changes(session, previous_transaction):
+    session.info.pop('dashboard_users', None)
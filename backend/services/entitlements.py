@@ -0,0 +1,144 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from flask import current_app
+from config import Config
+from models import db, Subscription, SubscriptionStatus, SubscriptionTier
+
+@dataclass(frozen=True)
+class Entitlement:
+    tier: SubscriptionTier
+    status: SubscriptionStatus
+    period_end: datetime = None
+
+    def is_active(self, at: datetime = None) -> bool:
+        """Active subscription whose current period has not ended"""
+        if self.status != SubscriptionStatus.ACTIVE:
+            return False
+        return self.period_end is None or self.period_end > (at or datetime.utcnow())
+
+NO_ENTITLEMENT = Entitlement(tier=None, status=SubscriptionStatus.INACTIVE)
+
+class EntitlementCache:
+    """
+    user_id -> Entitlement, loaded from the database on first use.
+
+    Webhook handlers invalidate entries as subscriptions change; the TTL is a
+    safety net for changes made by other processes.
+    """
+
+    def __init__(self, ttl_seconds: float, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> Entitlement:
+        user_id = int(user_id)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        entitlement = self._load(user_id)
+        with self._lock:
+            self._entries[user_id] = (entitlement, now + self.ttl_seconds)
+        return entitlement
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _load(self, user_id) -> Entitlement:
+        row = db.session.query(
+            Subscription.tier, Subscription.status, Subscription.current_period_end
+        ).filter(Subscription.user_id == user_id).first()
+
+        if row is None:
+            return NO_ENTITLEMENT
+        return Entitlement(tier=row.tier, status=row.status, period_end=row.current_period_end)
+
+def get_entitlements() -> EntitlementCache:
+    """Return the entitlement cache for the current app"""
+    return current_app.extensions.setdefault(
+        'entitlement_cache', EntitlementCache(Config.ENTITLEMENT_CACHE_TTL_SECONDS)
+    )
+
+def invalidate_entitlement(user_id):
+    """Drop a user's cached entitlement after their subscription changed"""
+    get_entitlements().invalidate(user_id)
+
+def stripe_api():
+    """The stripe module with our API key set; imported on first use because it is slow to import"""
+    import stripe
+    stripe.api_key = Config.STRIPE_SECRET_KEY
+    return stripe
+
+STRIPE_STATUS_MAP = {
+    'active': SubscriptionStatus.ACTIVE,
+    'trialing': SubscriptionStatus.ACTIVE,
+    'past_due': SubscriptionStatus.PAST_DUE,
+    'unpaid': SubscriptionStatus.PAST_DUE,
+    'canceled': SubscriptionStatus.CANCELED,
+}
+
+def reconcile_subscriptions(batch_size: int = 500) -> dict:
+    """
+    Sync every local subscription with Stripe in bulk.
+
+    Local rows are loaded with one query, Stripe subscriptions are read with
+    paged list calls rather than one retrieve per row, and changes are
+    written back with bulk updates.
+    """
+    local = {
+        row.stripe_subscription_id: row
+        for row in db.session.query(
+            Subscription.id, Subscription.user_id, Subscription.stripe_subscription_id,
+            Subscription.status, Subscription.current_period_start, Subscription.current_period_end
+        ).filter(Subscription.stripe_subscription_id.isnot(None))
+    }
+
+    seen = 0
+    changes = []
+    changed_users = []
+    for remote in stripe_api().Subscription.list(status='all', limit=100).auto_paging_iter():
+        row = local.get(remote['id'])
+        if row is None:
+            continue
+        seen += 1
+
+        update = {
+            'id': row.id,
+            'status': STRIPE_STATUS_MAP.get(remote['status'], SubscriptionStatus.INACTIVE),
+            'current_period_start': datetime.utcfromtimestamp(remote['current_period_start']),
+            'current_period_end': datetime.utcfromtimestamp(remote['current_period_end'])
+        }
+        if (update['status'], update['current_period_start'], update['current_period_end']) != \
+                (row.status, row.current_period_start, row.current_period_end):
+            changes.append(update)
+            changed_users.append(row.user_id)
+
+        if len(changes) >= batch_size:
+            db.session.bulk_update_mappings(Subscription, changes)
+            db.session.commit()
+            changes = []
+
+    if changes:
+        db.session.bulk_update_mappings(Subscription, changes)
+        db.session.commit()
+
+    cache = get_entitlements()
+    for user_id in changed_users:
+        cache.invalidate(user_id)
+
+    return {
+        'local': len(local),
+        'matched': seen,
+        'updated': len(changed_users)
+    }
@@ -0,0 +1,311 @@
+"""
+Booking status events for the SSE stream.
+
+BookingAutomation publishes a small JSON event whenever it changes a
+booking's status; every process hands the event to a broker, and each
+process fans the events it receives out to the SSE connections of the
+booking's owner. Bookings run on whichever worker claimed them, so a
+cross-process broker is needed as soon as there is more than one worker:
+
+  local     delivered inside this process only (single worker, tests)
+  postgres  LISTEN/NOTIFY on the main database, no extra infrastructure
+            (the default with a PostgreSQL DATABASE_URL)
+
+create_app warns when the local broker runs under several gunicorn workers.
+"""
+import json
+import os
+import queue
+import select
+import sys
+import threading
+import time
+from collections import deque
+from sqlalchemy.engine import make_url
+from config import Config
+from utils.metrics import SSE_CONNECTIONS
+
+# NOTIFY payloads are limited to 8000 bytes
+MAX_MESSAGE_LENGTH = 500
+
+class LocalBroker:
+    """In-process broker: publish delivers straight to this process's handler"""
+    
+    def start(self, handler):
+        self.handler = handler
+    
+    def publish(self, payload: str):
+        self.handler(payload)
+    
+    def close(self):
+        pass
+
+class PostgresBroker:
+    """
+    Postgres LISTEN/NOTIFY broker.
+    
+    A daemon thread holds one LISTEN connection and reconnects if it drops.
+    Publishing uses a second autocommit connection. Both need a direct
+    connection: PgBouncer in transaction mode does not support LISTEN.
+    """
+    
+    def __init__(self, url: str, channel: str):
+        self.dsn = make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+        self.channel = channel
+        self.handler = None
+        self._publish_connection = None
+        self._publish_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+    
+    def start(self, handler):
+        self.handler = handler
+        self._thread = threading.Thread(target=self._listen, name='status-events', daemon=True)
+        self._thread.start()
+    
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                connection = self._connect()
+                try:
+                    connection.cursor().execute(f'LISTEN "{self.channel}"')
+                    while not self._stopped.is_set():
+                        if select.select([connection], [], [], 5) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            self.handler(connection.notifies.pop(0).payload)
+                finally:
+                    connection.close()
+            except Exception as e:
+                print(f"Status event listener error: {e}")
+                self._stopped.wait(1)
+    
+    def publish(self, payload: str):
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_connection is None or self._publish_connection.closed:
+                        self._publish_connection = self._connect()
+                    self._publish_connection.cursor().execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+                    return
+                except Exception:
+                    # Stale connection: reconnect once, then give up
+                    self._publish_connection = None
+                    if attempt:
+                        raise
+    
+    def close(self):
+        self._stopped.set()
+        if self._publish_connection is not None:
+            self._publish_connection.close()
+
+class StatusSubscription:
+    """One SSE connection's queue of events for a user"""
+    
+    def __init__(self, user_id: int, max_queue: int):
+        self.user_id = user_id
+        self.queue = queue.Queue(max_queue)
+        # Set when the client fell behind and events were dropped
+        self.overflowed = False
+        # Events missed since the client's Last-Event-ID, or None if some
+        # of them are no longer held and the client has to refetch
+        self.missed = []
+    
+    def get(self, timeout: float):
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class StatusHistory:
+    """
+    Recent events per user, so a reconnecting client is caught up from its
+    Last-Event-ID instead of refetching all its bookings.
+    
+    Events are identified by published_at. complete_since is the time after
+    which every event this process received is still held: the bus start, or
+    the newest event dropped for age or space since.
+    """
+    
+    def __init__(self, max_events: int, window_seconds: float, clock=time.time):
+        self.max_events = max_events
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.complete_since = clock()
+        self._events = {}
+        self._swept_at = self.complete_since
+    
+    def add(self, event: dict):
+        events = self._events.setdefault(event['user_id'], deque())
+        events.append(event)
+        if len(events) > self.max_events:
+            self._drop(events.popleft())
+        
+        now = self.clock()
+        if now - self._swept_at >= self.window_seconds:
+            self._sweep(now - self.window_seconds)
+            self._swept_at = now
+    
+    def since(self, user_id: int, last_event_id: float):
+        """The user's events published after last_event_id, or None if some may be gone"""
+        if last_event_id < self.complete_since:
+            return None
+        return [event for event in self._events.get(user_id, ()) if event['published_at'] > last_event_id]
+    
+    def _sweep(self, cutoff: float):
+        for user_id in list(self._events):
+            events = self._events[user_id]
+            while events and events[0]['published_at'] < cutoff:
+                self._drop(events.popleft())
+            if not events:
+                del self._events[user_id]
+    
+    def _drop(self, event: dict):
+        self.complete_since = max(self.complete_since, event['published_at'])
+
+class StatusEventBus:
+    """
+    Fans broker events out to the subscriptions of each booking's owner.
+    
+    Each open stream holds a server thread for its whole life, so at most
+    max_streams are open per process; the rest of the threads stay free for
+    ordinary requests.
+    """
+    
+    def __init__(self, broker, max_queue: int = 100, max_streams: int = 16, replay_seconds: float = 300):
+        self.broker = broker
+        self.max_queue = max_queue
+        self.max_streams = max_streams
+        self.history = StatusHistory(max_queue, replay_seconds)
+        self._subscriptions = {}
+        self._streams = 0
+        self._lock = threading.Lock()
+        broker.start(self._dispatch)
+    
+    def subscribe(self, user_id, last_event_id: float = None) -> StatusSubscription:
+        """
+        Open a subscription, or return None when max_streams are already open.
+        
+        With last_event_id, the subscription's missed holds the events
+        published after it, or None if the client has to refetch.
+        """
+        subscription = StatusSubscription(int(user_id), self.max_queue)
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+            self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+            # Under the lock, so each event is either missed or queued, never both or neither
+            if last_event_id is not None:
+                subscription.missed = self.history.since(subscription.user_id, last_event_id)
+        SSE_CONNECTIONS.inc()
+        return subscription
+    
+    def unsubscribe(self, subscription: StatusSubscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+                self._streams -= 1
+                SSE_CONNECTIONS.inc(-1)
+    
+    def publish(self, event: dict):
+        self.broker.publish(json.dumps(event, separators=(',', ':')))
+    
+    def _dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        
+        with self._lock:
+            if isinstance(event.get('published_at'), (int, float)):
+                self.history.add(event)
+            subscriptions = list(self._subscriptions.get(event.get('user_id'), ()))
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.overflowed = True
+    
+    def close(self):
+        self.broker.close()
+
+def status_event(booking, values: dict = None) -> dict:
+    """Event payload for a booking's status; values being written take precedence over the booking's attributes"""
+    values = values or {}
+    
+    def current(name):
+        return values[name] if name in values else getattr(booking, name, None)
+    
+    executed_at = current('executed_at')
+    return {
+        'booking_id': booking.id,
+        'user_id': booking.user_id,
+        'status': current('status').value,
+        'message': (current('result_message') or '')[:MAX_MESSAGE_LENGTH],
+        'booking_reference': current('booking_reference'),
+        'attempt_count': current('attempt_count'),
+        'executed_at': executed_at.isoformat() if executed_at else None,
+        'published_at': time.time()
+    }
+
+def server_workers() -> int:
+    """Worker processes gunicorn was started with; 1 outside gunicorn"""
+    if 'gunicorn' not in os.path.basename(sys.argv[0]):
+        return 1
+    
+    args = sys.argv[1:] + os.getenv('GUNICORN_CMD_ARGS', '').split()
+    for i, arg in enumerate(args):
+        if arg.startswith('--workers='):
+            value = arg.split('=', 1)[1]
+        elif arg in ('-w', '--workers') and i + 1 < len(args):
+            value = args[i + 1]
+        else:
+            continue
+        return int(value) if value.isdigit() else 1
+    value = os.getenv('WEB_CONCURRENCY', '1')
+    return int(value) if value.isdigit() else 1
+
+def check_broker():
+    """Warn when status events cannot reach SSE clients connected to other workers"""
+    workers = server_workers()
+    if Config.EVENT_BROKER != 'postgres' and workers > 1:
+        print(f"WARNING: EVENT_BROKER={Config.EVENT_BROKER} delivers status events within one process, "
+              f"but {workers} workers are running; SSE clients miss events published on other workers. "
+              "Set EVENT_BROKER=postgres or run a single worker.")
+        return False
+    return True
+
+def create_broker():
+    if Config.EVENT_BROKER == 'postgres':
+        return PostgresBroker(Config.EVENT_BROKER_URL or Config.SQLALCHEMY_DATABASE_URI, Config.EVENT_CHANNEL)
+    return LocalBroker()
+
+_bus = None
+_bus_lock = threading.Lock()
+
+def get_event_bus() -> StatusEventBus:
+    """Process-wide event bus, started on first use"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = StatusEventBus(create_broker(), Config.SSE_MAX_QUEUE, Config.SSE_MAX_STREAMS, Config.SSE_REPLAY_SECONDS)
+        return _bus
+
+def publish_status(event: dict):
+    """Publish a status event; a broker failure never fails the booking"""
+    try:
+        get_event_bus().publish(event)
+    except Exception as e:
+        print(f"Could not publish status event for booking {event['booking_id']}: {e}")
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from config import Config
+from models import SubscriptionTier
+
+# Lower rank runs first
+TIER_RANK = {
+    SubscriptionTier.PREMIUM: 0,
+    SubscriptionTier.STANDARD: 1,
+    SubscriptionTier.BASIC: 2,
+}
+
+def parse_tier_shares(value: str) -> dict:
+    """Parse 'premium=0.5,standard=0.3,basic=0.2' into {SubscriptionTier: share}"""
+    shares = {}
+    for part in value.split(','):
+        if '=' not in part:
+            continue
+        name, share = part.split('=', 1)
+        shares[SubscriptionTier(name.strip().lower())] = float(share)
+    return shares
+
+@dataclass(order=True)
+class QueuedBooking:
+    scheduled_time: datetime
+    created_at: datetime
+    seq: int
+    booking_id: int = field(compare=False)
+    tier: SubscriptionTier = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+class TierQueue:
+    """
+    Due bookings ordered by tier, then scheduled time, then creation time.
+
+    Each tier has guaranteed slots derived from its concurrency share. A tier
+    may always use its guaranteed slots; it may only borrow a free slot if
+    that leaves enough room for the unmet guarantees of other tiers that have
+    work waiting. Bookings are promoted one tier for every `aging_seconds`
+    they wait, so a flood of PREMIUM work cannot starve BASIC forever.
+    """
+
+    def __init__(self, capacity: int, shares: dict, aging_seconds: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.aging_seconds = aging_seconds
+        self.clock = clock
+        self.guaranteed = {tier: int(shares.get(tier, 0) * capacity) for tier in TIER_RANK}
+        self._heaps = {tier: [] for tier in TIER_RANK}
+        self._seq = itertools.count()
+
+    def push(self, booking_id, tier, scheduled_time, created_at) -> QueuedBooking:
+        item = QueuedBooking(scheduled_time, created_at, next(self._seq), booking_id, tier, self.clock())
+        heapq.heappush(self._heaps[tier], item)
+        return item
+
+    def depth(self) -> dict:
+        return {tier: len(heap) for tier, heap in self._heaps.items()}
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def pop_next(self, running: dict):
+        """Pop the booking that should start next given per-tier running counts, or None"""
+        free = self.capacity - sum(running.values())
+        if free <= 0:
+            return None
+
+        now = self.clock()
+        best = None
+        for tier, heap in self._heaps.items():
+            if not heap or not self._eligible(tier, running, free):
+                continue
+
+            head = heap[0]
+            promotion = int((now - head.enqueued_at) // self.aging_seconds) if self.aging_seconds else 0
+            key = (max(TIER_RANK[tier] - promotion, 0), head)
+            if best is None or key < best[0]:
+                best = (key, tier)
+
+        if best is None:
+            return None
+        return heapq.heappop(self._heaps[best[1]])
+
+    def _eligible(self, tier, running, free) -> bool:
+        if running.get(tier, 0) < self.guaranteed[tier]:
+            return True
+
+        reserved = sum(
+            max(self.guaranteed[other] - running.get(other, 0), 0)
+            for other, heap in self._heaps.items()
+            if other != tier and heap
+        )
+        return free - reserved > 0
+
+class WaitStats:
+    """Queue-wait and start-lag statistics for one tier"""
+
+    def __init__(self, window: int = 500):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=window)
+        self._recent_lags = deque(maxlen=window)
+
+    def record(self, wait: float, start_lag: float):
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._recent_waits.append(wait)
+        self._recent_lags.append(start_lag)
+
+    def to_dict(self):
+        return {
+            'started': self.count,
+            'avg_queue_wait_seconds': self.total_wait / self.count if self.count else 0.0,
+            'max_queue_wait_seconds': self.max_wait,
+            'p50_queue_wait_seconds': _percentile(self._recent_waits, 0.5),
+            'p95_queue_wait_seconds': _percentile(self._recent_waits, 0.95),
+            'p50_start_lag_seconds': _percentile(self._recent_lags, 0.5),
+            'p95_start_lag_seconds': _percentile(self._recent_lags, 0.95),
+        }
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+class BookingExecutor:
+    """Runs due bookings on a bounded thread pool in tier priority order"""
+
+    def __init__(self, runner, max_workers: int, shares: dict, aging_seconds: float):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.queue = TierQueue(max_workers, shares, aging_seconds)
+        self.running = {tier: 0 for tier in TIER_RANK}
+        self.stats = {tier: WaitStats() for tier in TIER_RANK}
+        self.avg_run_seconds = None  # EWMA of booking run time, feeds capacity planning
+        self._known = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='booking')
+
+    def submit(self, booking_id, tier, scheduled_time, created_at) -> bool:
+        """Queue a booking; returns False if it is already queued or running"""
+        tier = tier or SubscriptionTier.BASIC
+        with self._lock:
+            if booking_id in self._known:
+                return False
+            self._known.add(booking_id)
+            self.queue.push(booking_id, tier, scheduled_time, created_at)
+            self._dispatch()
+        return True
+
+    def _dispatch(self):
+        # Called with the lock held
+        while True:
+            item = self.queue.pop_next(self.running)
+            if item is None:
+                return
+
+            self.running[item.tier] += 1
+            wait = self.queue.clock() - item.enqueued_at
+            start_lag = max((datetime.utcnow() - item.scheduled_time).total_seconds(), 0.0)
+            self.stats[item.tier].record(wait, start_lag)
+            self._pool.submit(self._run, item)
+
+    def _run(self, item):
+        started = time.monotonic()
+        try:
+            self.runner(item.booking_id)
+        except Exception as e:
+            print(f"Error executing booking {item.booking_id}: {e}")
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                if self.avg_run_seconds is None:
+                    self.avg_run_seconds = elapsed
+                else:
+                    self.avg_run_seconds += 0.1 * (elapsed - self.avg_run_seconds)
+                self.running[item.tier] -= 1
+                self._known.discard(item.booking_id)
+                self._dispatch()
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self.queue)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            depth = self.queue.depth()
+            return {
+                'max_workers': self.max_workers,
+                'avg_run_seconds': self.avg_run_seconds,
+                'queued': len(self.queue),
+                'running': sum(self.running.values()),
+                'tiers': {
+                    tier.value: {
+                        'queued': depth[tier],
+                        'running': self.running[tier],
+                        'guaranteed_slots': self.queue.guaranteed[tier],
+                        **self.stats[tier].to_dict()
+                    }
+                    for tier in TIER_RANK
+                }
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+_executor = None
+
+def init_executor(runner) -> BookingExecutor:
+    """Create the process-wide executor from Config, or rebind its runner"""
+    global _executor
+    if _executor is not None:
+        _executor.runner = runner
+    else:
+        _executor = BookingExecutor(
+            runner,
+            max_workers=Config.EXECUTOR_MAX_WORKERS,
+            shares=parse_tier_shares(Config.TIER_CONCURRENCY_SHARES),
+            aging_seconds=Config.TIER_AGING_SECONDS
+        )
+    return _executor
+
+def get_executor():
+    """Return the process-wide executor, or None if the scheduler is not running here"""
+    return _executor
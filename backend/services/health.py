@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, func, or_, text
+from config import Config
+from models import db, BookingRequest, BookingStatus
+from services.executor import get_executor
+
+# One thread for database probes; a probe stuck past its timeout keeps the
+# thread busy, and later probes fail fast instead of piling up connections
+_db_probe_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='health-db')
+
+def check_database(engine, timeout: float) -> dict:
+    """SELECT 1 on the primary, bounded by timeout"""
+    def probe():
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    
+    started = time.perf_counter()
+    try:
+        _db_probe_pool.submit(probe).result(timeout=timeout)
+    except FutureTimeout:
+        return {'ok': False, 'error': f'no response within {timeout}s'}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': True, 'latency_ms': round(1000 * (time.perf_counter() - started), 1)}
+
+def check_scheduler(max_age: float) -> dict:
+    """The scheduler thread is running and has ticked recently"""
+    if not Config.SCHEDULER_ENABLED:
+        return {'ok': True, 'enabled': False}
+    
+    from services import scheduler as booking_scheduler
+    heartbeat = booking_scheduler.last_heartbeat
+    if not booking_scheduler.scheduler.running:
+        return {'ok': False, 'error': 'scheduler not running'}
+    if heartbeat is None:
+        return {'ok': False, 'error': 'no scheduler heartbeat yet'}
+    
+    age = time.time() - heartbeat
+    return {'ok': age <= max_age, 'heartbeat_age_seconds': round(age, 1)}
+
+def check_due_lag(max_lag: float) -> dict:
+    """How long the oldest booking that is due has been waiting to start"""
+    now = datetime.utcnow()
+    due_at = func.coalesce(BookingRequest.next_attempt_at, BookingRequest.scheduled_time)
+    oldest = db.session.query(func.min(due_at)).filter(
+        BookingRequest.status == BookingStatus.PENDING,
+        or_(
+            and_(
+                BookingRequest.next_attempt_at.is_(None),
+                BookingRequest.scheduled_time <= now,
+                BookingRequest.scheduled_time > now - timedelta(minutes=5)
+            ),
+            BookingRequest.next_attempt_at <= now
+        )
+    ).scalar()
+    
+    lag = (now - oldest).total_seconds() if oldest else 0.0
+    return {'ok': lag <= max_lag, 'oldest_due_lag_seconds': round(lag, 1)}
+
+def check_executor() -> dict:
+    """The booking executor was started in this process"""
+    if not Config.SCHEDULER_ENABLED:
+        return {'ok': True, 'enabled': False}
+    
+    executor = get_executor()
+    if executor is None:
+        return {'ok': False, 'error': 'executor not started'}
+    
+    metrics = executor.metrics()
+    return {'ok': True, 'running': metrics['running'], 'max_workers': metrics['max_workers']}
+
+def check_queue_depth(max_depth: int) -> dict:
+    """Bookings waiting in this process's executor queue"""
+    executor = get_executor()
+    if not Config.SCHEDULER_ENABLED or executor is None:
+        return {'ok': True, 'enabled': False}
+    
+    queued = executor.metrics()['queued']
+    return {'ok': queued <= max_depth, 'queued': queued}
+
+# Checks that decide readiness. The others (scheduler heartbeat, due-booking
+# lag, queue depth) measure load or shared state: a backlog or a slow
+# database would fail them on every worker at once, and taking all of them
+# out of rotation only makes it worse, so they are reported for alerting
+READINESS_GATES = ('database', 'executor')
+
+class ReadinessCheck:
+    """
+    Runs the readiness checks at most once per TTL; probes in between get the
+    cached report, so a load balancer polling every second costs nothing.
+    """
+    
+    def __init__(self, ttl_seconds: float, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._report = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+    
+    def report(self) -> dict:
+        with self._lock:
+            if self._report is None or self.clock() >= self._expires:
+                self._report = self._run()
+                self._expires = self.clock() + self.ttl_seconds
+            return self._report
+    
+    def _run(self) -> dict:
+        checks = {'database': check_database(db.engine, Config.HEALTH_DB_TIMEOUT_SECONDS)}
+        checks['scheduler'] = check_scheduler(Config.HEALTH_SCHEDULER_MAX_AGE_SECONDS)
+        checks['executor'] = check_executor()
+        checks['queue_depth'] = check_queue_depth(Config.HEALTH_MAX_QUEUE_DEPTH)
+        if checks['database']['ok']:
+            try:
+                checks['due_bookings'] = check_due_lag(Config.HEALTH_MAX_DUE_LAG_SECONDS)
+            except Exception as e:
+                db.session.rollback()
+                checks['due_bookings'] = {'ok': False, 'error': str(e)}
+        
+        ready = all(checks[name]['ok'] for name in READINESS_GATES)
+        return {
+            'status': 'ready' if ready else 'not_ready',
+            'checks': checks,
+            'checked_at': datetime.utcnow().isoformat()
+        }
+
+def get_readiness() -> ReadinessCheck:
+    """Return the readiness check for the current app"""
+    return current_app.extensions.setdefault(
+        'readiness_check', ReadinessCheck(Config.HEALTH_CACHE_SECONDS)
+    )
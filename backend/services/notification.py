@@ -1,14 +1,18 @@
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 from config import Config
 from models import BookingRequest, User
+from utils.metrics import EMAIL_SEND_SECONDS
+import time
 
 class NotificationService:
     """Handle email notifications using SendGrid"""
     
     def __init__(self, app):
         self.app = app
-        self.sg = SendGridAPIClient(Config.SENDGRID_API_KEY) if Config.SENDGRID_API_KEY else None
+        self.sg = None
+        if Config.SENDGRID_API_KEY:
+            # Imported only when email is configured; sendgrid is slow to import
+            from sendgrid import SendGridAPIClient
+            self.sg = SendGridAPIClient(Config.SENDGRID_API_KEY)
     
     def send_booking_result(self, booking: BookingRequest, success: bool):
         """Send booking result notification to user"""
@@ -27,15 +31,10 @@ class NotificationService:
             
             html_content = self._get_booking_result_template(booking, user, success)
             
-            message = Mail(
-                from_email=Config.SENDGRID_FROM_EMAIL,
-                to_emails=user.email,
-                subject=subject,
-                html_content=html_content
-            )
+            message = self._message(user.email, subject, html_content)
             
             try:
-                response = self.sg.send(message)
+                response = self._send(message, 'booking_result')
                 print(f"Email sent to {user.email}: {response.status_code}")
             except Exception as e:
                 print(f"Error sending email: {e}")
@@ -64,19 +63,34 @@ class NotificationService:
         </html>
         """
         
-        message = Mail(
-            from_email=Config.SENDGRID_FROM_EMAIL,
-            to_emails=user_email,
-            subject="Welcome to Midnight Travel Booker!",
-            html_content=html_content
-        )
+        message = self._message(user_email, "Welcome to Midnight Travel Booker!", html_content)
         
         try:
-            response = self.sg.send(message)
+            response = self._send(message, 'welcome')
             print(f"Welcome email sent to {user_email}: {response.status_code}")
         except Exception as e:
             print(f"Error sending welcome email: {e}")
     
+    def _message(self, to_email: str, subject: str, html_content: str):
+        from sendgrid.helpers.mail import Mail
+        return Mail(
+            from_email=Config.SENDGRID_FROM_EMAIL,
+            to_emails=to_email,
+            subject=subject,
+            html_content=html_content
+        )
+    
+    def _send(self, message, kind: str):
+        """Send through SendGrid, recording latency by email kind and outcome"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.sg.send(message)
+            outcome = 'sent'
+            return response
+        finally:
+            EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, kind=kind, outcome=outcome)
+    
     def _get_booking_result_template(self, booking: BookingRequest, user: User, success: bool):
         """Generate HTML template for booking result email"""
         status_color = "#10b981" if success else "#ef4444"
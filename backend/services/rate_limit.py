@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models import db, RateLimitBucket
+
+class RateLimitTimeout(Exception):
+    """Raised when a token could not be acquired in time"""
+
+def site_host(url: str) -> str:
+    """Normalise a site URL to the host used as the limiter/breaker key"""
+    return urlparse(url).netloc or url
+
+class LocalBucketStore:
+    """In-process token buckets, shared by the threads of one worker"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, host: str, capacity: float, rate: float, now: float) -> float:
+        """Take one token; return 0 on success or the seconds to wait for the next one"""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(host, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            if tokens >= 1:
+                self._buckets[host] = (tokens - 1, now)
+                return 0
+
+            self._buckets[host] = (tokens, now)
+            return (1 - tokens) / rate
+
+class DatabaseBucketStore:
+    """Token buckets stored in the database, shared by every worker process"""
+
+    def take(self, host: str, capacity: float, rate: float, now: float) -> float:
+        """Take one token; return 0 on success or the seconds to wait for the next one"""
+        table = RateLimitBucket.__table__
+        refilled = table.c.tokens + (now - table.c.updated_at) * rate
+        refilled = case((refilled > capacity, capacity), else_=refilled)
+
+        # A single conditional UPDATE is atomic on every backend, so no row
+        # locks are held between reading and spending the token
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(table)
+                .where(table.c.host == host, refilled >= 1)
+                .values(tokens=refilled - 1, updated_at=now)
+            )
+            if result.rowcount:
+                return 0
+
+            row = conn.execute(
+                select(table.c.tokens, table.c.updated_at).where(table.c.host == host)
+            ).first()
+
+        if row is None:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(table).values(host=host, tokens=capacity - 1, updated_at=now))
+                return 0
+            except IntegrityError:
+                # Another worker created the bucket first
+                return self.take(host, capacity, rate, now)
+
+        tokens = min(capacity, row.tokens + (now - row.updated_at) * rate)
+        return max((1 - tokens) / rate, 0.001)
+
+class RateLimiter:
+    """Token-bucket rate limiter keyed by target host"""
+
+    def __init__(self, store, rate: float, capacity: float, clock=time.time, sleep=time.sleep):
+        self.store = store
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self, host: str, timeout: float = None):
+        """Block until a token for the host is available or the timeout passes"""
+        deadline = self.clock() + timeout if timeout is not None else None
+
+        while True:
+            wait = self.store.take(host, self.capacity, self.rate, self.clock())
+            if wait <= 0:
+                return
+
+            if deadline is not None and self.clock() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit for {host} not available within {timeout}s")
+
+            self.sleep(wait)
+
+    async def acquire_async(self, host: str, timeout: float = None):
+        """acquire for coroutines on the async backend's loop: waits without blocking the loop"""
+        deadline = self.clock() + timeout if timeout is not None else None
+
+        while True:
+            wait = self.store.take(host, self.capacity, self.rate, self.clock())
+            if wait <= 0:
+                return
+
+            if deadline is not None and self.clock() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit for {host} not available within {timeout}s")
+
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Stops dispatching to a site when its recent error rate spikes.
+
+    CLOSED lets everything through and tracks outcomes over a sliding window.
+    When the failure ratio crosses the threshold the breaker goes OPEN and
+    rejects calls for the cooldown period, then HALF_OPEN lets a single probe
+    through: success closes the breaker, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: float, min_calls: int, window_seconds: float,
+                 cooldown_seconds: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque()
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may be dispatched now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.cooldown_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+
+            return True
+
+    def record_success(self):
+        """Record a call that reached the site and got a sane response"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+            else:
+                self._record(True)
+
+    def record_failure(self):
+        """Record a call that failed because of the site (timeout, network or site error)"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+
+            self._record(False)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_threshold:
+                self._open()
+
+    def _record(self, ok: bool):
+        now = self.clock()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._probe_in_flight = False
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._probe_in_flight = False
+
+_rate_limiter = None
+_breakers = {}
+_registry_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter configured from Config"""
+    global _rate_limiter
+    with _registry_lock:
+        if _rate_limiter is None:
+            store = DatabaseBucketStore() if Config.RATE_LIMIT_BACKEND == 'database' else LocalBucketStore()
+            _rate_limiter = RateLimiter(store, Config.RATE_LIMIT_PER_SECOND, Config.RATE_LIMIT_BURST)
+        return _rate_limiter
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """Return the circuit breaker for a target host"""
+    with _registry_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(
+                failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+                min_calls=Config.CIRCUIT_MIN_CALLS,
+                window_seconds=Config.CIRCUIT_WINDOW_SECONDS,
+                cooldown_seconds=Config.CIRCUIT_COOLDOWN_SECONDS
+            )
+        return _breakers[host]
@@ -0,0 +1,74 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from config import Config
+
+# Error classes reported by BookingAutomation. Anything not listed in
+# RETRY_POLICIES (bad credentials, price over budget, ...) is permanent and
+# fails immediately.
+ERROR_TIMEOUT = 'timeout'
+ERROR_NETWORK = 'network'
+ERROR_SITE = 'site_error'
+ERROR_LOGIN = 'login_failed'
+ERROR_NO_OPTIONS = 'no_options'
+ERROR_PRICE = 'price_exceeded'
+ERROR_NO_CREDENTIALS = 'no_credentials'
+ERROR_RATE_LIMITED = 'rate_limited'
+ERROR_CIRCUIT_OPEN = 'circuit_open'
+ERROR_UNKNOWN = 'unknown'
+# Anything that goes wrong once the confirm click was sent; never retried,
+# since a retry could buy the ticket a second time
+ERROR_AFTER_CONFIRM = 'after_confirm'
+
+# Failures that say something about the target site's health
+SITE_FAILURES = (ERROR_TIMEOUT, ERROR_NETWORK, ERROR_SITE)
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter for one error class"""
+    max_attempts: int
+    base_delay: float  # seconds
+    max_delay: float   # seconds
+    multiplier: float = 2.0
+    
+    def backoff(self, attempt: int, rng=random) -> float:
+        """Delay in seconds before retrying after the given (1-based) attempt"""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** (attempt - 1)))
+        # Full jitter spreads retries of bookings that failed together
+        return rng.uniform(0, ceiling)
+
+RETRY_POLICIES = {
+    ERROR_TIMEOUT: RetryPolicy(max_attempts=4, base_delay=2, max_delay=30),
+    ERROR_NETWORK: RetryPolicy(max_attempts=5, base_delay=1, max_delay=20),
+    ERROR_SITE: RetryPolicy(max_attempts=3, base_delay=5, max_delay=60),
+    ERROR_RATE_LIMITED: RetryPolicy(max_attempts=5, base_delay=2, max_delay=30),
+    ERROR_CIRCUIT_OPEN: RetryPolicy(max_attempts=5, base_delay=10, max_delay=60),
+    ERROR_UNKNOWN: RetryPolicy(max_attempts=2, base_delay=5, max_delay=30),
+}
+
+def retry_deadline(booking):
+    """Latest time a retry may start for this booking"""
+    return booking.scheduled_time + timedelta(seconds=Config.RETRY_WINDOW_SECONDS)
+
+def next_attempt_time(booking, error_class: str, now: datetime = None, rng=random):
+    """
+    Return when the booking should be retried, or None if it should not be.
+    
+    Retries stop when the error class is permanent, the policy's attempt
+    budget is spent, or the next attempt would fall outside the retry window.
+    """
+    policy = RETRY_POLICIES.get(error_class)
+    if policy is None:
+        return None
+    
+    attempts = booking.attempt_count or 0
+    if attempts >= policy.max_attempts:
+        return None
+    
+    now = now or datetime.utcnow()
+    run_at = now + timedelta(seconds=policy.backoff(attempts, rng))
+    
+    if run_at > retry_deadline(booking):
+        return None
+    
+    return run_at
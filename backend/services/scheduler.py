@@ -1,47 +1,218 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
 import pytz
-from models import db, BookingRequest, BookingStatus
-from services.booking_automation import BookingAutomation
+import time
+from models import db, BookingRequest, BookingStatus, Subscription
+from services.booking_automation import BookingAutomation, BookingSnapshot
 from services.notification import NotificationService
+from services.retry import next_attempt_time, ERROR_UNKNOWN, ERROR_AFTER_CONFIRM
+from services.executor import init_executor, get_executor
+from services.events import status_event
+from services.status_writer import get_status_writer
+from services.stripe_events import process_pending_events
+from services.entitlements import reconcile_subscriptions
+from services.clock_sync import get_clock_sync
+from services.archive import archive_bookings
+from utils.metrics import SCHEDULER_TICK_SECONDS, SCHEDULER_DUE_BOOKINGS, BOOKING_START_LAG_SECONDS, BOOKING_OUTCOMES
+from config import Config
 
 scheduler = BackgroundScheduler()
 
+# Wall-clock time of the last scheduler tick, read by the readiness check
+last_heartbeat = None
+
+FINAL_STATUSES = (BookingStatus.SUCCESS, BookingStatus.FAILED, BookingStatus.DEAD_LETTER)
+
+def claim_booking(booking):
+    """Atomically move a pending booking to processing; returns False if another worker got it"""
+    claimed = BookingRequest.query.filter_by(
+        id=booking.id,
+        status=BookingStatus.PENDING
+    ).update({
+        'status': BookingStatus.PROCESSING,
+        'attempt_count': BookingRequest.attempt_count + 1,
+        'next_attempt_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    if not claimed:
+        return False
+    
+    db.session.refresh(booking)
+    return True
+
+def schedule_retry(app, booking):
+    """Schedule a one-off run at the booking's next attempt time"""
+    scheduler.add_job(
+        func=enqueue_booking_by_id,
+        trigger=DateTrigger(run_date=booking.next_attempt_at, timezone=pytz.utc),
+        args=[app, booking.id],
+        id=f'booking_retry_{booking.id}',
+        name=f'Retry booking {booking.id}',
+        replace_existing=True
+    )
+
+def execute_booking(app, booking):
+    """Run one attempt of a booking and handle its outcome"""
+    due_at = booking.next_attempt_at or booking.scheduled_time
+    is_retry = booking.next_attempt_at is not None
+    if not claim_booking(booking):
+        return
+    
+    BOOKING_START_LAG_SECONDS.observe(
+        max((datetime.utcnow() - due_at).total_seconds(), 0),
+        attempt='retry' if is_retry else 'first'
+    )
+    
+    # The automation works from a snapshot in its own app context and writes
+    # results in short transactions of its own. Close this session so the
+    # claim's refresh does not hold a connection for the whole browser run
+    snapshot = BookingSnapshot.from_booking(booking)
+    db.session.close()
+    
+    automation = None
+    try:
+        # Execute booking automation
+        automation = BookingAutomation(snapshot, app.app_context())
+        success = automation.execute()
+        booking = db.session.get(BookingRequest, snapshot.id)
+    
+    except Exception as e:
+        print(f"Error executing booking {snapshot.id}: {e}")
+        if automation and automation.outcome is not None:
+            # The outcome is already written or queued; never queue anything behind it
+            return
+        values = {'last_error_class': ERROR_UNKNOWN, 'result_message': f"Execution error: {str(e)}"}
+        run_at = next_attempt_time(snapshot, ERROR_UNKNOWN)
+        if automation and automation.confirm_sent:
+            # The site may have taken the booking; never run it again
+            values.update(status=BookingStatus.NEEDS_REVIEW, last_error_class=ERROR_AFTER_CONFIRM)
+        elif run_at:
+            values.update(status=BookingStatus.PENDING, next_attempt_at=run_at)
+        else:
+            values['status'] = BookingStatus.DEAD_LETTER
+        get_status_writer().submit(
+            snapshot.id, values, event=status_event(snapshot, values)
+        ).wait(Config.STATUS_WRITER_WAIT_SECONDS)
+        booking = db.session.get(BookingRequest, snapshot.id)
+        success = False
+    
+    BOOKING_OUTCOMES.inc(status=booking.status.value)
+    if booking.status == BookingStatus.PENDING and booking.next_attempt_at:
+        schedule_retry(app, booking)
+    elif booking.status in FINAL_STATUSES:
+        # Send notification
+        notification_service = NotificationService(app)
+        notification_service.send_booking_result(booking, success)
+
+def execute_booking_by_id(app, booking_id):
+    """Entry point for executor workers"""
+    with app.app_context():
+        try:
+            booking = BookingRequest.query.get(booking_id)
+            if booking and booking.status == BookingStatus.PENDING:
+                execute_booking(app, booking)
+        except Exception as e:
+            print(f"Error executing booking {booking_id}: {e}")
+
+def due_bookings_query():
+    """Pending bookings with their owner's subscription tier"""
+    return db.session.query(BookingRequest, Subscription.tier).outerjoin(
+        Subscription, Subscription.user_id == BookingRequest.user_id
+    ).filter(BookingRequest.status == BookingStatus.PENDING)
+
+def enqueue_booking_by_id(app, booking_id):
+    """Entry point for retry jobs: hand the booking to the executor"""
+    with app.app_context():
+        try:
+            row = due_bookings_query().filter(BookingRequest.id == booking_id).first()
+            if row:
+                booking, tier = row
+                get_executor().submit(booking.id, tier, booking.scheduled_time, booking.created_at)
+        except Exception as e:
+            print(f"Error queueing retry for booking {booking_id}: {e}")
+
 def check_and_execute_bookings(app):
     """Check for pending bookings and execute them if it's time"""
-    with app.app_context():
+    global last_heartbeat
+    last_heartbeat = time.time()
+    with app.app_context(), SCHEDULER_TICK_SECONDS.time():
         try:
             now = datetime.utcnow()
             
-            # Find all pending bookings scheduled for execution within the next minute
-            pending_bookings = BookingRequest.query.filter(
-                BookingRequest.status == BookingStatus.PENDING,
-                BookingRequest.scheduled_time <= now + timedelta(minutes=1),
-                BookingRequest.scheduled_time > now - timedelta(minutes=5)
+            # Find first attempts scheduled within the next minute, plus any
+            # retries whose backoff has elapsed (e.g. missed across a restart)
+            due = due_bookings_query().filter(
+                or_(
+                    and_(
+                        BookingRequest.next_attempt_at.is_(None),
+                        BookingRequest.scheduled_time <= now + timedelta(minutes=1),
+                        BookingRequest.scheduled_time > now - timedelta(minutes=5)
+                    ),
+                    BookingRequest.next_attempt_at <= now
+                )
             ).all()
+            SCHEDULER_DUE_BOOKINGS.set(len(due))
             
-            for booking in pending_bookings:
-                try:
-                    # Execute booking automation
-                    automation = BookingAutomation(booking, app.app_context())
-                    success = automation.execute()
-                    
-                    # Send notification
-                    notification_service = NotificationService(app)
-                    notification_service.send_booking_result(booking, success)
-                    
-                except Exception as e:
-                    print(f"Error executing booking {booking.id}: {e}")
-                    booking.status = BookingStatus.FAILED
-                    booking.result_message = f"Execution error: {str(e)}"
-                    db.session.commit()
-                    
+            # The executor orders them by tier and runs them as slots free up
+            executor = get_executor()
+            for booking, tier in due:
+                executor.submit(booking.id, tier, booking.scheduled_time, booking.created_at)
+        
         except Exception as e:
             print(f"Error in booking scheduler: {e}")
 
+def process_stripe_events(app):
+    """Drain the Stripe webhook event queue"""
+    with app.app_context():
+        try:
+            while process_pending_events():
+                pass
+        except Exception as e:
+            print(f"Error processing Stripe events: {e}")
+
+def reconcile_stripe_subscriptions(app):
+    """Nightly bulk sync of local subscriptions against Stripe"""
+    with app.app_context():
+        try:
+            result = reconcile_subscriptions()
+            print(f"Reconciled subscriptions with Stripe: {result}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error reconciling subscriptions: {e}")
+
+def archive_finished_bookings(app):
+    """Nightly move of old finished bookings to the archive table"""
+    with app.app_context():
+        try:
+            archived = archive_bookings()
+            print(f"Archived {archived} finished bookings")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error archiving bookings: {e}")
+
+def sync_site_clock():
+    """Re-measure the target site's clock offset and RTT"""
+    try:
+        estimate = get_clock_sync().sync(Config.TARGET_TRAVEL_SITE_URL)
+        print(f"Target site clock offset {estimate['offset']:+.3f}s, RTT {estimate['rtt'] * 1000:.0f}ms")
+    except Exception as e:
+        print(f"Error syncing target site clock: {e}")
+
+def wake_event_processor():
+    """Run the Stripe event job now instead of waiting for its next interval"""
+    job = scheduler.get_job('stripe_event_processor')
+    if job:
+        job.modify(next_run_time=datetime.now(pytz.utc))
+
 def start_scheduler(app):
     """Start the APScheduler for booking automation"""
+    global last_heartbeat
+    init_executor(lambda booking_id: execute_booking_by_id(app, booking_id))
+    
     # Run check every minute
     scheduler.add_job(
         func=lambda: check_and_execute_bookings(app),
@@ -51,10 +222,64 @@ def start_scheduler(app):
         replace_existing=True
     )
     
-    scheduler.start()
-    print("Booking scheduler started")
+    # Stripe webhook events are queued by the webhook route and handled here
+    scheduler.add_job(
+        func=lambda: process_stripe_events(app),
+        trigger='interval',
+        seconds=5,
+        id='stripe_event_processor',
+        name='Process queued Stripe webhook events',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    if Config.STRIPE_SECRET_KEY:
+        # Off-peak, well clear of the midnight booking windows
+        scheduler.add_job(
+            func=lambda: reconcile_stripe_subscriptions(app),
+            trigger=CronTrigger(hour=Config.SUBSCRIPTION_RECONCILE_HOUR, minute=30),
+            id='subscription_reconciler',
+            name='Reconcile subscriptions with Stripe',
+            replace_existing=True
+        )
+    
+    if Config.ARCHIVE_ENABLED:
+        scheduler.add_job(
+            func=lambda: archive_finished_bookings(app),
+            trigger=CronTrigger(hour=Config.ARCHIVE_HOUR, minute=45),
+            id='booking_archiver',
+            name='Archive finished bookings',
+            max_instances=1,
+            replace_existing=True
+        )
+    
+    if Config.CLOCK_SYNC_ENABLED and Config.TARGET_TRAVEL_SITE_URL:
+        # First sync right away, then keep the offset fresh for the next midnight
+        scheduler.add_job(
+            func=sync_site_clock,
+            trigger='interval',
+            seconds=Config.CLOCK_SYNC_INTERVAL_SECONDS,
+            next_run_time=datetime.now(pytz.utc),
+            id='site_clock_sync',
+            name='Sync target site clock offset',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+    
+    if not scheduler.running:
+        last_heartbeat = time.time()
+        scheduler.start()
+        print("Booking scheduler started")
 
 def stop_scheduler():
     """Stop the scheduler"""
     scheduler.shutdown()
+    executor = get_executor()
+    if executor:
+        executor.shutdown()
+    if Config.AUTOMATION_BACKEND == 'async':
+        from services.async_automation import shutdown_async_backend
+        shutdown_async_backend()
     print("Booking scheduler stopped")
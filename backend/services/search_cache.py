@@ -0,0 +1,165 @@
+"""
+Short-lived cache and single-flight coalescing of fare searches.
+
+Bookings for a popular route all run the same search on the target site in
+the same second. The first booking with a given (site, origin, destination,
+dates, passengers) key leads: it searches and publishes what it found, the
+lowest-price option's price and booking URL. Identical searches that start
+while it runs wait for that result instead of searching themselves, and
+later ones within SEARCH_CACHE_TTL_SECONDS read it from the cache. Either
+way they go straight from login to the option's booking page.
+
+Every booking still logs in with its own account; only the search result
+is shared. The cache is per process.
+"""
+import asyncio
+import threading
+import time
+from config import Config
+
+def search_key(site_host: str, booking) -> tuple:
+    """Identify a search: bookings with equal keys would see the same results"""
+    return (
+        site_host,
+        booking.origin.strip().lower(),
+        booking.destination.strip().lower(),
+        booking.departure_date.isoformat(),
+        booking.return_date.isoformat() if booking.return_date else None,
+        booking.passengers
+    )
+
+class SearchFlight:
+    """A search in progress that other bookings can wait on"""
+    
+    def __init__(self):
+        self.results = None
+        self._done = threading.Event()
+    
+    def finish(self, results):
+        self.results = results
+        self._done.set()
+    
+    def wait(self, timeout: float):
+        """The leader's results, or None if it failed or took longer than timeout"""
+        self._done.wait(timeout)
+        return self.results
+    
+    async def wait_async(self, timeout: float, poll: float = 0.05):
+        """wait() for the event loop; polls rather than tying up a thread per waiting booking"""
+        deadline = time.monotonic() + timeout
+        while not self._done.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+        return self.results
+
+class SearchResultCache:
+    """
+    key -> list of result options, each {'price': str or None, 'url': str or None};
+    an empty list means the search found nothing.
+    """
+    
+    def __init__(self, ttl_seconds: float, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.coalesced = 0
+        self.searches = 0
+        self._entries = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+    
+    def join(self, key):
+        """
+        (results, None) when fresh results are cached; (None, flight) when an
+        identical search is already running; (None, None) when the caller
+        leads and must call publish() or abandon() for the key.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self.hits += 1
+                return entry[0], None
+            
+            flight = self._flights.get(key)
+            if flight:
+                self.coalesced += 1
+                return None, flight
+            
+            self._flights[key] = SearchFlight()
+            self.searches += 1
+            return None, None
+    
+    def publish(self, key, results: list):
+        with self._lock:
+            self._entries[key] = (results, self.clock() + self.ttl_seconds)
+            flight = self._flights.pop(key, None)
+            # Drop expired entries while we hold the lock
+            now = self.clock()
+            for stale in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+                del self._entries[stale]
+        if flight:
+            flight.finish(results)
+    
+    def abandon(self, key):
+        """The leader failed before it had results; waiting bookings search for themselves"""
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight:
+            flight.finish(None)
+    
+    def metrics(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'in_flight': len(self._flights),
+            'searches': self.searches,
+            'hits': self.hits,
+            'coalesced': self.coalesced
+        }
+
+class SearchLease:
+    """One booking's part in a coalesced search"""
+    
+    def __init__(self, cache: SearchResultCache, key):
+        self.cache = cache
+        self.key = key
+        self.leading = False
+    
+    def _join(self):
+        results, flight = self.cache.join(self.key)
+        if results is None and flight is None:
+            self.leading = True
+        return results, flight
+    
+    def shared_results(self, timeout: float):
+        """
+        Results found by another booking, or None if this booking has to
+        search itself (as the leader, unless a leader it waited on failed).
+        """
+        results, flight = self._join()
+        return flight.wait(timeout) if flight else results
+    
+    async def shared_results_async(self, timeout: float):
+        results, flight = self._join()
+        return await flight.wait_async(timeout) if flight else results
+    
+    def publish(self, results: list):
+        if self.leading:
+            self.leading = False
+            self.cache.publish(self.key, results)
+    
+    def release(self):
+        """Called when the flow ends; lets waiters go if results were never published"""
+        if self.leading:
+            self.leading = False
+            self.cache.abandon(self.key)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_search_cache() -> SearchResultCache:
+    """Process-wide search result cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchResultCache(Config.SEARCH_CACHE_TTL_SECONDS)
+        return _cache
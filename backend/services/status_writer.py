@@ -0,0 +1,173 @@
+"""
+Write-behind booking status updates.
+
+Executor workers hand status transitions to one writer thread per app,
+which flushes whatever has queued up every STATUS_WRITER_FLUSH_MS in a
+single transaction: one executemany UPDATE of booking_requests by primary
+key plus any trace rows. Thousands of transitions around midnight become a
+few commits a second instead of one commit (and WAL flush) each.
+
+Transitions are applied in submission order, so a booking's row always
+ends in its latest state, and status events are published only after the
+batch holding them has committed. A caller that needs to read its own
+write waits on its transition; everyone waiting at the same time shares
+one commit. Whatever is still queued at shutdown is flushed before exit.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from flask import current_app
+from sqlalchemy import update
+from config import Config
+from models import db, BookingRequest
+from services.dashboard import get_dashboard_cache
+from services.events import publish_status
+from utils.metrics import STATUS_WRITE_BATCH_SIZE
+
+class StatusTransition:
+    """Column values to write to one booking, plus its trace row and status event"""
+    
+    __slots__ = ('booking_id', 'values', 'trace', 'event', 'error', '_done')
+    
+    def __init__(self, booking_id: int, values: dict, trace=None, event: dict = None):
+        self.booking_id = booking_id
+        self.values = values
+        self.trace = trace
+        self.event = event
+        self.error = None
+        self._done = threading.Event()
+    
+    def wait(self, timeout: float = None):
+        """Block until the transition is committed; re-raises the error if it could not be written"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Status write for booking {self.booking_id} not flushed within {timeout}s')
+        if self.error is not None:
+            raise self.error
+
+class StatusWriter:
+    def __init__(self, app, flush_interval: float, max_batch: int, enabled: bool = True):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self.flushes = 0
+        self.transitions = 0
+        self.fallback_writes = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+    
+    def submit(self, booking_id: int, values: dict, trace=None, event: dict = None) -> StatusTransition:
+        """Queue a transition; written inline when the writer is disabled or shut down"""
+        transition = StatusTransition(booking_id, values, trace, event)
+        with self._cond:
+            if self.enabled and not self._stopping:
+                self._queue.append(transition)
+                if self._thread is None:
+                    # Started on first use so constructing a writer stays free
+                    self._thread = threading.Thread(target=self._run, name='status-writer', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.shutdown)
+                self._cond.notify()
+                return transition
+        
+        self._flush([transition])
+        return transition
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+            
+            if not self._stopping:
+                # Let transitions from other workers join this batch
+                time.sleep(self.flush_interval)
+            
+            with self._cond:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            self._flush(batch)
+    
+    def _flush(self, batch: list):
+        with self.app.app_context():
+            try:
+                self._write(batch)
+            except Exception as e:
+                db.session.rollback()
+                if len(batch) == 1:
+                    batch[0].error = e
+                else:
+                    # Isolate the bad transition rather than lose the whole batch
+                    print(f"Batched status write of {len(batch)} transitions failed, retrying one by one: {e}")
+                    for transition in batch:
+                        try:
+                            self._write([transition])
+                            self.fallback_writes += 1
+                        except Exception as single_error:
+                            db.session.rollback()
+                            transition.error = single_error
+        
+        for transition in batch:
+            if transition.error is not None:
+                print(f"Could not write status for booking {transition.booking_id}: {transition.error}")
+            elif transition.event:
+                publish_status(transition.event)
+            transition._done.set()
+    
+    def _write(self, batch: list):
+        # Later transitions of the same booking overwrite earlier ones
+        rows = {}
+        for transition in batch:
+            rows.setdefault(transition.booking_id, {'id': transition.booking_id}).update(transition.values)
+        
+        # ORM bulk UPDATE by primary key: one executemany per distinct set of columns
+        db.session.execute(update(BookingRequest), list(rows.values()))
+        db.session.add_all([transition.trace for transition in batch if transition.trace is not None])
+        
+        # Bulk UPDATEs skip the session's flush events, so drop the owners'
+        # cached dashboards here; events carry the user, others are looked up
+        users = {transition.event['user_id'] for transition in batch if transition.event}
+        unknown = {transition.booking_id for transition in batch if not transition.event}
+        if unknown:
+            users.update(user_id for (user_id,) in db.session.query(BookingRequest.user_id).filter(BookingRequest.id.in_(unknown)))
+        db.session.commit()
+        
+        cache = get_dashboard_cache()
+        for user_id in users:
+            cache.invalidate(user_id)
+        
+        self.flushes += 1
+        self.transitions += len(batch)
+        STATUS_WRITE_BATCH_SIZE.observe(len(batch))
+    
+    def metrics(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'queued': len(self._queue),
+            'flushes': self.flushes,
+            'transitions': self.transitions,
+            'fallback_writes': self.fallback_writes
+        }
+    
+    def shutdown(self, timeout: float = 10):
+        """Flush everything still queued and stop the writer thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+def get_status_writer() -> StatusWriter:
+    """Return the status writer for the current app"""
+    app = current_app._get_current_object()
+    return app.extensions.setdefault('status_writer', StatusWriter(
+        app,
+        Config.STATUS_WRITER_FLUSH_MS / 1000,
+        Config.STATUS_WRITER_MAX_BATCH,
+        enabled=Config.STATUS_WRITER_ENABLED
+    ))
@@ -0,0 +1,193 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from models import db, StripeEvent, Subscription, SubscriptionStatus, SubscriptionTier
+from services.entitlements import invalidate_entitlement, stripe_api, STRIPE_STATUS_MAP
+
+MAX_EVENT_ATTEMPTS = 5
+STALE_PROCESSING_AFTER = timedelta(minutes=5)
+# A failed event waits 30s, 1m, 2m, 4m before its next attempt
+RETRY_BASE_DELAY = timedelta(seconds=30)
+
+def retry_delay(attempts: int) -> timedelta:
+    return RETRY_BASE_DELAY * 2 ** (attempts - 1)
+
+def _due(now: datetime):
+    return or_(StripeEvent.next_attempt_at.is_(None), StripeEvent.next_attempt_at <= now)
+
+def store_event(event) -> bool:
+    """Persist a verified Stripe event; returns False if it was already received"""
+    data_object = event['data']['object']
+    stripe_event = StripeEvent(
+        event_id=event['id'],
+        event_type=event['type'],
+        customer_id=data_object.get('customer'),
+        stripe_created=event.get('created') or 0,
+        payload=json.dumps(data_object)
+    )
+    db.session.add(stripe_event)
+
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Unique event_id: Stripe retried an event we already have
+        db.session.rollback()
+        return False
+
+def _claim(event, now: datetime) -> bool:
+    """
+    Mark an event as processing, but only if no earlier event for the same
+    customer is still waiting. Runs as one UPDATE so that several workers
+    processing the queue keep per-customer order.
+    """
+    earlier = aliased(StripeEvent)
+    blocked_by_earlier = exists().where(
+        earlier.customer_id == event.customer_id,
+        earlier.status.in_(['pending', 'processing']),
+        or_(
+            earlier.stripe_created < event.stripe_created,
+            and_(earlier.stripe_created == event.stripe_created, earlier.id < event.id)
+        )
+    )
+
+    query = StripeEvent.query.filter(StripeEvent.id == event.id, StripeEvent.status == 'pending', _due(now))
+    if event.customer_id:
+        query = query.filter(~blocked_by_earlier)
+
+    claimed = query.update({'status': 'processing'}, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+def process_pending_events(limit: int = 100) -> int:
+    """Process queued webhook events in order per customer; returns how many were handled"""
+    now = datetime.utcnow()
+    # Events left in processing by a worker that died are picked up again
+    StripeEvent.query.filter(
+        StripeEvent.status == 'processing',
+        StripeEvent.updated_at < now - STALE_PROCESSING_AFTER
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    # Events backing off after a failure are skipped, but still hold back
+    # later events for their customer (see _claim)
+    events = StripeEvent.query.filter(StripeEvent.status == 'pending', _due(now)).order_by(
+        StripeEvent.stripe_created, StripeEvent.id
+    ).limit(limit).all()
+
+    handled = 0
+    blocked_customers = set()
+    for event in events:
+        if event.customer_id and event.customer_id in blocked_customers:
+            continue
+
+        if not _claim(event, now):
+            blocked_customers.add(event.customer_id)
+            continue
+
+        try:
+            dispatch_event(event.event_type, json.loads(event.payload))
+            event.status = 'processed'
+            event.processed_at = datetime.utcnow()
+            event.next_attempt_at = None
+            event.error = None
+            handled += 1
+        except Exception as e:
+            db.session.rollback()
+            event.attempts = (event.attempts or 0) + 1
+            event.error = str(e)
+            event.status = 'failed' if event.attempts >= MAX_EVENT_ATTEMPTS else 'pending'
+            # Back off so a transient error does not use up every attempt within one drain
+            event.next_attempt_at = datetime.utcnow() + retry_delay(event.attempts)
+            # Later events for this customer must wait for this one
+            blocked_customers.add(event.customer_id)
+            print(f"Error processing Stripe event {event.event_id}: {e}")
+
+        db.session.commit()
+
+    return handled
+
+def dispatch_event(event_type: str, data_object: dict):
+    """Route a Stripe event payload to its handler"""
+    handler = EVENT_HANDLERS.get(event_type)
+    if handler:
+        handler(data_object)
+
+def handle_checkout_completed(session):
+    """Handle successful checkout completion"""
+    user_id = int(session['metadata']['user_id'])
+    tier = SubscriptionTier(session['metadata']['tier'])
+
+    # Get Stripe subscription
+    stripe_subscription = stripe_api().Subscription.retrieve(session['subscription'])
+    period_start = datetime.utcfromtimestamp(stripe_subscription['current_period_start'])
+    period_end = datetime.utcfromtimestamp(stripe_subscription['current_period_end'])
+
+    # Create or update subscription in database
+    subscription = Subscription.query.filter_by(user_id=user_id).first()
+
+    if subscription:
+        subscription.tier = tier
+        subscription.status = SubscriptionStatus.ACTIVE
+        subscription.stripe_customer_id = session['customer']
+        subscription.stripe_subscription_id = session['subscription']
+        subscription.current_period_start = period_start
+        subscription.current_period_end = period_end
+    else:
+        subscription = Subscription(
+            user_id=user_id,
+            tier=tier,
+            status=SubscriptionStatus.ACTIVE,
+            stripe_customer_id=session['customer'],
+            stripe_subscription_id=session['subscription'],
+            current_period_start=period_start,
+            current_period_end=period_end
+        )
+        db.session.add(subscription)
+
+    db.session.commit()
+    invalidate_entitlement(user_id)
+
+def handle_subscription_updated(subscription_data):
+    """Handle subscription update"""
+    subscription = Subscription.query.filter_by(
+        stripe_subscription_id=subscription_data['id']
+    ).first()
+
+    if subscription:
+        subscription.status = STRIPE_STATUS_MAP.get(subscription_data['status'], SubscriptionStatus.INACTIVE)
+        subscription.current_period_start = datetime.utcfromtimestamp(subscription_data['current_period_start'])
+        subscription.current_period_end = datetime.utcfromtimestamp(subscription_data['current_period_end'])
+        db.session.commit()
+        invalidate_entitlement(subscription.user_id)
+
+def handle_subscription_deleted(subscription_data):
+    """Handle subscription cancellation"""
+    subscription = Subscription.query.filter_by(
+        stripe_subscription_id=subscription_data['id']
+    ).first()
+
+    if subscription:
+        subscription.status = SubscriptionStatus.CANCELED
+        db.session.commit()
+        invalidate_entitlement(subscription.user_id)
+
+def handle_payment_failed(invoice):
+    """Handle failed payment"""
+    subscription = Subscription.query.filter_by(
+        stripe_customer_id=invoice['customer']
+    ).first()
+
+    if subscription:
+        subscription.status = SubscriptionStatus.PAST_DUE
+        db.session.commit()
+        invalidate_entitlement(subscription.user_id)
+
+EVENT_HANDLERS = {
+    'checkout.session.completed': handle_checkout_completed,
+    'customer.subscription.updated': handle_subscription_updated,
+    'customer.subscription.deleted': handle_subscription_deleted,
+    'invoice.payment_failed': handle_payment_failed,
+}
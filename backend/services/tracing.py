@@ -0,0 +1,137 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from config import Config
+from models import BookingTrace
+from utils.metrics import PLAYWRIGHT_STEP_SECONDS
+
+def _elapsed_ms(since: float) -> int:
+    return int(round(1000 * (time.perf_counter() - since)))
+
+def prune_artifacts(directory: str, max_bytes: int):
+    """Delete the oldest artifacts until the directory fits in max_bytes"""
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    
+    files = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries)
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+class BookingTracer:
+    """
+    Records the steps of one automation attempt: start offset and duration
+    of each step, time spent waiting on selectors and load states, the error
+    that ended a step, and optionally a screenshot or Playwright trace of a
+    failed attempt.
+    """
+    
+    def __init__(self, booking_id: int, attempt: int, artifact_mode: str = None,
+                 artifact_dir: str = None, artifact_max_bytes: int = None):
+        self.booking_id = booking_id
+        self.attempt = attempt
+        self.artifact_mode = artifact_mode or Config.TRACE_ARTIFACTS
+        self.artifact_dir = artifact_dir or Config.TRACE_ARTIFACT_DIR
+        self.artifact_max_bytes = artifact_max_bytes or int(Config.TRACE_ARTIFACT_MAX_MB * 1024 * 1024)
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.steps = []
+        self.artifact_path = None
+        self._waits = None
+    
+    @contextmanager
+    def step(self, name: str):
+        """Time a step; an exception escaping the step is recorded on it and re-raised"""
+        start_ms = _elapsed_ms(self.started)
+        started = time.perf_counter()
+        self._waits = waits = []
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'[:300]
+            raise
+        finally:
+            self._waits = None
+            duration = time.perf_counter() - started
+            PLAYWRIGHT_STEP_SECONDS.observe(duration, step=name)
+            self.steps.append([name, start_ms, int(round(1000 * duration)), waits, error])
+    
+    async def wait_async(self, label: str, awaitable):
+        """Await a Playwright wait and record how long it blocked"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            if self._waits is not None:
+                self._waits.append([label, _elapsed_ms(started)])
+    
+    def wait(self, label: str, fn, *args, **kwargs):
+        """Call a Playwright wait and record how long it blocked"""
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if self._waits is not None:
+                self._waits.append([label, _elapsed_ms(started)])
+    
+    def start_browser_trace(self, context):
+        """Start Playwright tracing on the context when full traces are enabled"""
+        if self.artifact_mode == 'playwright':
+            context.tracing.start(screenshots=True, snapshots=True)
+    
+    def finish_browser_trace(self, context, page, failed: bool):
+        """Keep a screenshot or Playwright trace of a failed attempt, within the size cap"""
+        path = self.artifact_path_for(failed)
+        try:
+            if path and path.endswith('.zip'):
+                context.tracing.stop(path=path)
+            elif path:
+                page.screenshot(path=path, full_page=True)
+            elif self.artifact_mode == 'playwright':
+                context.tracing.stop()
+        except Exception as e:
+            print(f"Could not save trace artifact for booking {self.booking_id}: {e}")
+            return
+        
+        self.record_artifact(path)
+    
+    def artifact_path_for(self, failed: bool):
+        """Where to save this attempt's artifact, or None if none is kept"""
+        if not failed or self.artifact_mode not in ('screenshot', 'playwright'):
+            return None
+        
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        stem = os.path.join(self.artifact_dir, f'booking-{self.booking_id}-attempt-{self.attempt}-{int(time.time())}')
+        return f'{stem}.zip' if self.artifact_mode == 'playwright' else f'{stem}.png'
+    
+    def record_artifact(self, path):
+        """Attach a saved artifact and prune the directory back under its cap"""
+        if path:
+            self.artifact_path = path
+            prune_artifacts(self.artifact_dir, self.artifact_max_bytes)
+    
+    def summary(self) -> dict:
+        """Total duration and expanded steps, for callers that do not store the trace"""
+        return {'duration_ms': _elapsed_ms(self.started), 'steps': BookingTrace.expand_steps(self.steps)}
+    
+    def to_model(self, outcome: str) -> BookingTrace:
+        return BookingTrace(
+            booking_id=self.booking_id,
+            attempt=self.attempt,
+            started_at=self.started_at,
+            duration_ms=_elapsed_ms(self.started),
+            outcome=outcome,
+            steps=json.dumps(self.steps, separators=(',', ':')),
+            artifact_path=self.artifact_path
+        )
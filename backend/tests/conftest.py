@@ -0,0 +1,70 @@
+import json
+import os
+import pytest
+
+# Point the app at an in-memory database before config.py is imported, so the
+# test suite never touches the local development database
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+class FakeListObject:
+    def __init__(self, items):
+        self.items = items
+    
+    def auto_paging_iter(self):
+        return iter(self.items)
+
+class FakeStripe:
+    """Offline stand-in for the parts of the Stripe API the app calls"""
+    
+    def __init__(self):
+        self.subscriptions = {}
+        self.retrieve_calls = 0
+    
+    def construct_event(self, payload, sig_header, secret):
+        return json.loads(payload)
+    
+    def retrieve_subscription(self, subscription_id):
+        self.retrieve_calls += 1
+        return self.subscriptions[subscription_id]
+    
+    def list_subscriptions(self, **params):
+        return FakeListObject(list(self.subscriptions.values()))
+    
+    def event(self, event_id, event_type, data_object, created=1700000000):
+        return {
+            'id': event_id,
+            'type': event_type,
+            'created': created,
+            'data': {'object': data_object}
+        }
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    """Route Stripe webhook verification and API reads to an in-memory fake"""
+    import stripe
+    fake = FakeStripe()
+    monkeypatch.setattr(stripe.Webhook, 'construct_event', fake.construct_event)
+    monkeypatch.setattr(stripe.Subscription, 'retrieve', fake.retrieve_subscription)
+    monkeypatch.setattr(stripe.Subscription, 'list', fake.list_subscriptions)
+    return fake
@@ -1,26 +1,12 @@
 import pytest
-from app import create_app
-from models import db, User
+from datetime import date, datetime, timedelta
+from config import Config
+from models import db, User, BookingRequest, BookingStatus, Subscription, SubscriptionStatus, SubscriptionTier, StripeEvent
+from services.booking_automation import BookingAutomation
+from services.stripe_events import process_pending_events
+from services.entitlements import get_entitlements, reconcile_subscriptions
 from utils.security import hash_password
 
-@pytest.fixture
-def app():
-    """Create application for testing"""
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.session.remove()
-        db.drop_all()
-
-@pytest.fixture
-def client(app):
-    """Create test client"""
-    return app.test_client()
-
 @pytest.fixture
 def auth_headers(client):
     """Create authenticated user and return headers"""
@@ -43,6 +29,39 @@ def auth_headers(client):
     token = response.json['access_token']
     return {'Authorization': f'Bearer {token}'}
 
+@pytest.fixture
+def admin_headers(client):
+    """Create admin user and return headers"""
+    admin = User(
+        email='admin@example.com',
+        password_hash=hash_password('password123'),
+        first_name='Admin',
+        last_name='User',
+        is_admin=True
+    )
+    db.session.add(admin)
+    db.session.commit()
+    
+    response = client.post('/api/auth/login', json={
+        'email': 'admin@example.com',
+        'password': 'password123'
+    })
+    
+    token = response.json['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def subscribed_headers(auth_headers):
+    """Give the authenticated test user an active subscription"""
+    user = User.query.filter_by(email='test@example.com').first()
+    db.session.add(Subscription(
+        user_id=user.id,
+        tier=SubscriptionTier.PREMIUM,
+        status=SubscriptionStatus.ACTIVE
+    ))
+    db.session.commit()
+    return auth_headers
+
 def test_health_check(client):
     """Test health endpoint"""
     response = client.get('/health')
@@ -110,3 +129,632 @@ def test_unauthorized_access(client):
     """Test accessing protected endpoint without auth"""
     response = client.get('/api/users/profile')
     assert response.status_code == 401
+
+def test_dead_letter_requeue(client, admin_headers):
+    """Test listing and requeueing dead-lettered bookings"""
+    admin = User.query.filter_by(email='admin@example.com').first()
+    booking = BookingRequest(
+        user_id=admin.id,
+        origin='New York',
+        destination='Tokyo',
+        departure_date=date(2025, 12, 25),
+        scheduled_time=datetime(2025, 12, 25, 5, 0, 0),
+        status=BookingStatus.DEAD_LETTER,
+        attempt_count=4,
+        last_error_class='timeout'
+    )
+    db.session.add(booking)
+    db.session.commit()
+    
+    response = client.get('/api/admin/dead-letter', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json['total'] == 1
+    
+    response = client.post(f'/api/admin/dead-letter/{booking.id}/requeue', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json['booking']['status'] == 'pending'
+    assert response.json['booking']['attempt_count'] == 0
+
+def test_executor_metrics(client, admin_headers):
+    """Test per-tier executor metrics are exposed to admins"""
+    response = client.get('/api/admin/executor', headers=admin_headers)
+    
+    assert response.status_code == 200
+    assert set(response.json['executor']['tiers']) == {'basic', 'standard', 'premium'}
+
+def test_capacity_admission_and_forecast(client, subscribed_headers, admin_headers, monkeypatch):
+    """Test bookings beyond slot capacity are rejected and show up in the forecast"""
+    # One worker, 60 second window, 30 seconds per booking: two bookings per slot
+    monkeypatch.setattr(Config, 'EXECUTOR_MAX_WORKERS', 1)
+    monkeypatch.setattr(Config, 'CAPACITY_START_WINDOW_SECONDS', 60)
+    monkeypatch.setattr(Config, 'CAPACITY_DEFAULT_BOOKING_SECONDS', 30)
+    monkeypatch.setattr(Config, 'CAPACITY_ADMISSION_MODE', 'reject')
+    monkeypatch.setattr('services.capacity.get_executor', lambda: None)
+    
+    departure_date = (date.today() + timedelta(days=30)).isoformat()
+    booking = {'origin': 'New York', 'destination': 'Tokyo', 'departure_date': departure_date}
+    assert client.post('/api/bookings', headers=subscribed_headers, json=booking).status_code == 201
+    assert client.post('/api/bookings', headers=subscribed_headers, json=booking).status_code == 201
+    
+    response = client.post('/api/bookings', headers=subscribed_headers, json=booking)
+    assert response.status_code == 409
+    assert response.json['capacity']['scheduled'] == 2
+    
+    response = client.get('/api/admin/capacity/forecast?days=60', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json['slots'][0]['scheduled'] == 2
+    
+    # A cancellation made through another worker never touches this process's index
+    BookingRequest.query.first().status = BookingStatus.CANCELED
+    db.session.commit()
+    assert client.post('/api/bookings', headers=subscribed_headers, json=booking).status_code == 201
+
+def test_moving_a_booking_is_admitted_against_the_new_slot(client, subscribed_headers, monkeypatch):
+    """Test changing departure_date into a full slot is rejected like a new booking"""
+    monkeypatch.setattr(Config, 'EXECUTOR_MAX_WORKERS', 1)
+    monkeypatch.setattr(Config, 'CAPACITY_START_WINDOW_SECONDS', 60)
+    monkeypatch.setattr(Config, 'CAPACITY_DEFAULT_BOOKING_SECONDS', 30)
+    monkeypatch.setattr(Config, 'CAPACITY_ADMISSION_MODE', 'reject')
+    monkeypatch.setattr('services.capacity.get_executor', lambda: None)
+    
+    full_date, other_date, free_date = ((date.today() + timedelta(days=days)).isoformat() for days in (30, 31, 32))
+    booking = {'origin': 'New York', 'destination': 'Tokyo', 'departure_date': full_date}
+    first_id = client.post('/api/bookings', headers=subscribed_headers, json=booking).json['booking']['id']
+    assert client.post('/api/bookings', headers=subscribed_headers, json=booking).status_code == 201
+    other_id = client.post('/api/bookings', headers=subscribed_headers, json={**booking, 'departure_date': other_date}).json['booking']['id']
+    
+    response = client.put(f'/api/bookings/{other_id}', headers=subscribed_headers, json={'departure_date': full_date, 'passengers': 2})
+    assert response.status_code == 409
+    assert response.json['capacity']['scheduled'] == 2
+    moved = client.get(f'/api/bookings/{other_id}', headers=subscribed_headers).json['booking']
+    assert moved['departure_date'] == other_date and moved['passengers'] == 1
+    
+    # The booking itself does not count against its own slot
+    assert client.put(f'/api/bookings/{first_id}', headers=subscribed_headers, json={'departure_date': full_date}).status_code == 200
+    
+    assert client.put(f'/api/bookings/{first_id}', headers=subscribed_headers, json={'departure_date': free_date}).status_code == 200
+    assert client.put(f'/api/bookings/{other_id}', headers=subscribed_headers, json={'departure_date': full_date}).status_code == 200
+
+def test_stripe_webhook_is_queued_and_deduplicated(client, auth_headers, fake_stripe, monkeypatch):
+    """Test webhook events are stored once, acknowledged, and processed in order"""
+    # Keep the background processor away so the queue is drained explicitly below
+    monkeypatch.setattr('services.scheduler.process_pending_events', lambda: 0)
+    user = User.query.filter_by(email='test@example.com').first()
+    fake_stripe.subscriptions['sub_1'] = {
+        'current_period_start': 1700000000,
+        'current_period_end': 1702592000
+    }
+    checkout = fake_stripe.event('evt_1', 'checkout.session.completed', {
+        'customer': 'cus_1',
+        'subscription': 'sub_1',
+        'metadata': {'user_id': str(user.id), 'tier': 'premium'}
+    }, created=1700000000)
+    payment_failed = fake_stripe.event('evt_2', 'invoice.payment_failed', {
+        'customer': 'cus_1'
+    }, created=1700000100)
+    
+    # Deliver out of order and with a Stripe retry of the first event
+    for event in (payment_failed, checkout, checkout):
+        response = client.post('/api/subscriptions/webhook', json=event,
+                               headers={'Stripe-Signature': 'test'})
+        assert response.status_code == 200
+    
+    assert response.json['status'] == 'duplicate'
+    assert StripeEvent.query.count() == 2
+    assert fake_stripe.retrieve_calls == 0
+    
+    process_pending_events()
+    
+    subscription = Subscription.query.filter_by(user_id=user.id).first()
+    assert subscription.tier == SubscriptionTier.PREMIUM
+    assert subscription.status == SubscriptionStatus.PAST_DUE
+    assert StripeEvent.query.filter_by(status='processed').count() == 2
+
+def test_failed_stripe_event_backs_off_and_holds_later_events(app, monkeypatch):
+    """Test a failing event is retried after a backoff, not again within the same drain"""
+    import services.stripe_events as stripe_events
+    from services.stripe_events import store_event
+    
+    handled = []
+    
+    def dispatch(event_type, data_object):
+        if data_object.get('fail'):
+            raise ConnectionError('Stripe unavailable')
+        handled.append(event_type)
+    monkeypatch.setattr(stripe_events, 'dispatch_event', dispatch)
+    
+    for event_id, created, data in (('evt_1', 100, {'customer': 'cus_1', 'fail': True}), ('evt_2', 200, {'customer': 'cus_1'})):
+        store_event({'id': event_id, 'type': 'invoice.payment_failed', 'created': created, 'data': {'object': data}})
+    
+    # The drain loop stops: the failed event is not due and blocks the later one
+    while process_pending_events():
+        pass
+    failed = StripeEvent.query.filter_by(event_id='evt_1').first()
+    assert failed.attempts == 1 and failed.status == 'pending'
+    assert failed.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+    assert handled == []
+    
+    # Once due it is retried, and the customer's later event follows
+    failed.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    failed.payload = '{"customer": "cus_1"}'
+    db.session.commit()
+    assert process_pending_events() == 2
+    assert handled == ['invoice.payment_failed'] * 2
+    assert StripeEvent.query.filter_by(status='processed').count() == 2
+
+def test_entitlement_cache_and_period_end(client, subscribed_headers):
+    """Test entitlements are served from cache and expire with the billing period"""
+    user = User.query.filter_by(email='test@example.com').first()
+    cache = get_entitlements()
+    assert cache.get(user.id).is_active()
+    
+    # Changes made behind the cache's back are not seen until invalidated
+    subscription = Subscription.query.filter_by(user_id=user.id).first()
+    subscription.current_period_end = datetime(2020, 1, 1)
+    db.session.commit()
+    assert cache.get(user.id).is_active()
+    
+    cache.invalidate(user.id)
+    assert not cache.get(user.id).is_active()
+    
+    response = client.post('/api/bookings', headers=subscribed_headers, json={
+        'origin': 'New York', 'destination': 'Tokyo', 'departure_date': '2030-01-15'
+    })
+    assert response.status_code == 403
+
+def test_reconcile_subscriptions(client, subscribed_headers, fake_stripe):
+    """Test bulk reconciliation updates drifted subscriptions from Stripe list pages"""
+    user = User.query.filter_by(email='test@example.com').first()
+    subscription = Subscription.query.filter_by(user_id=user.id).first()
+    subscription.stripe_subscription_id = 'sub_1'
+    db.session.commit()
+    assert get_entitlements().get(user.id).is_active()
+    
+    fake_stripe.subscriptions['sub_1'] = {
+        'id': 'sub_1',
+        'status': 'canceled',
+        'current_period_start': 1700000000,
+        'current_period_end': 1702592000
+    }
+    fake_stripe.subscriptions['sub_unknown'] = dict(fake_stripe.subscriptions['sub_1'], id='sub_unknown')
+    
+    result = reconcile_subscriptions()
+    
+    assert result == {'local': 1, 'matched': 1, 'updated': 1}
+    assert fake_stripe.retrieve_calls == 0
+    assert not get_entitlements().get(user.id).is_active()
+
+def test_read_replica_routing(tmp_path, monkeypatch):
+    """Test read-only endpoints use a replica, writes pin to the primary and lag falls back"""
+    from flask import g
+    from app import create_app, init_db
+    from utils import db_routing
+    
+    monkeypatch.setattr(Config, 'DATABASE_REPLICA_URLS', f"sqlite:///{tmp_path / 'replica.db'}")
+    db_routing.replica_health.clear()
+    app = create_app()
+    init_db(app)
+    client = app.test_client()
+    
+    with app.app_context():
+        replica = db.engines['replica_0']
+        db.metadata.create_all(replica)
+        user = User(
+            email='replica@example.com', password_hash=hash_password('password123'),
+            first_name='Replica', last_name='User'
+        )
+        db.session.add(user)
+        db.session.commit()
+        
+        # A row only the replica has shows which database served the read
+        with replica.begin() as connection:
+            connection.execute(BookingRequest.__table__.insert(), {
+                'user_id': user.id, 'origin': 'New York', 'destination': 'Tokyo',
+                'departure_date': date(2030, 1, 15), 'scheduled_time': datetime(2030, 1, 15),
+                'status': BookingStatus.PENDING
+            })
+        
+        token = client.post('/api/auth/login', json={
+            'email': 'replica@example.com', 'password': 'password123'
+        }).json['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        
+        assert len(client.get('/api/bookings', headers=headers).json['bookings']) == 1
+        
+        with app.test_request_context():
+            g.db_read_replica = True
+            assert db.session.get_bind(mapper=User) is replica
+            db.session.add(User(email='pinned@example.com', password_hash='x', first_name='Pinned', last_name='User'))
+            db.session.flush()
+            assert db.session.get_bind(mapper=User) is db.engine
+            db.session.rollback()
+        
+        monkeypatch.setattr(db_routing, 'measure_lag', lambda engine: 60.0)
+        db_routing.replica_health.clear()
+        assert client.get('/api/bookings', headers=headers).json['bookings'] == []
+        
+        db.session.remove()
+        replica.dispose()
+    
+    # The bind's metadata is registered on the shared db object; later apps
+    # in this session are created without replicas
+    db.metadatas.pop('replica_0', None)
+
+def test_metrics_endpoint_reports_route_latency(client, auth_headers):
+    """Test request latency and query counts are exposed per blueprint and route"""
+    client.get('/api/bookings', headers=auth_headers)
+    
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{blueprint="bookings",route="/api/bookings/",method="GET",status="200"}' in text
+    assert 'db_queries_per_request_count{blueprint="auth",route="/api/auth/login"}' in text
+
+def test_readiness_reports_checks_and_is_cached(client, monkeypatch):
+    """Test liveness, structured readiness checks and cached readiness results"""
+    from services import health
+    
+    assert client.get('/health/live').json == {'status': 'alive'}
+    
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+    assert set(response.json['checks']) == {'database', 'scheduler', 'executor', 'queue_depth', 'due_bookings'}
+    
+    # A stale scheduler heartbeat is reported but does not take the worker out of rotation
+    monkeypatch.setattr('services.scheduler.last_heartbeat', 0)
+    health.get_readiness()._expires = 0
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json['checks']['scheduler']['ok'] is False
+    
+    # A missing executor shows up once the cached report expires
+    monkeypatch.setattr(health, 'get_executor', lambda: None)
+    assert client.get('/health/ready').status_code == 200
+    health.get_readiness()._expires = 0
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.json['checks']['executor']['ok'] is False
+
+def test_booking_trace_endpoint(client, admin_headers):
+    """Test an attempt's step timings, waits and errors are stored and served"""
+    from services.tracing import BookingTracer
+    
+    admin = User.query.filter_by(email='admin@example.com').first()
+    booking = BookingRequest(
+        user_id=admin.id, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=datetime(2030, 1, 15, 5, 0, 0),
+        status=BookingStatus.FAILED, attempt_count=1
+    )
+    db.session.add(booking)
+    db.session.commit()
+    
+    tracer = BookingTracer(booking.id, 1, artifact_mode='off')
+    with tracer.step('login'):
+        tracer.wait('networkidle', lambda: None)
+    with pytest.raises(TimeoutError):
+        with tracer.step('results'):
+            tracer.wait('.booking-results', lambda: None)
+            raise TimeoutError('results did not load')
+    db.session.add(tracer.to_model('timeout'))
+    db.session.commit()
+    
+    response = client.get(f'/api/admin/bookings/{booking.id}/trace', headers=admin_headers)
+    assert response.status_code == 200
+    trace = response.json['traces'][0]
+    assert trace['outcome'] == 'timeout'
+    assert [step['name'] for step in trace['steps']] == ['login', 'results']
+    assert trace['steps'][0]['waits'][0]['selector'] == 'networkidle'
+    assert trace['steps'][1]['error'] == 'TimeoutError: results did not load'
+    
+    response = client.get(f"/api/admin/bookings/{booking.id}/trace/{trace['id']}/artifact", headers=admin_headers)
+    assert response.status_code == 404
+
+def test_dashboard_summary_is_invalidated_on_booking_change(client, subscribed_headers):
+    """Test the dashboard summary is cached and refreshed when a booking is created"""
+    response = client.get('/api/users/dashboard', headers=subscribed_headers)
+    assert response.status_code == 200
+    assert response.json['counts']['total'] == 0
+    assert response.json['subscription']['status'] == 'active'
+    assert response.json['has_credentials'] is False
+    
+    departure_date = (date.today() + timedelta(days=30)).isoformat()
+    booking = {'origin': 'New York', 'destination': 'Tokyo', 'departure_date': departure_date}
+    assert client.post('/api/bookings', headers=subscribed_headers, json=booking).status_code == 201
+    
+    response = client.get('/api/users/dashboard', headers=subscribed_headers)
+    assert response.json['counts']['total'] == 1
+    assert response.json['counts']['pending'] == 1
+    assert response.json['recent_bookings'][0]['destination'] == 'Tokyo'
+
+def test_dashboard_is_invalidated_by_status_writer(client, subscribed_headers):
+    """Test status transitions written in bulk by the status writer refresh the cached dashboard"""
+    from services.events import status_event
+    from services.status_writer import get_status_writer
+    
+    departure_date = (date.today() + timedelta(days=30)).isoformat()
+    booking = {'origin': 'New York', 'destination': 'Tokyo', 'departure_date': departure_date}
+    booking_id = client.post('/api/bookings', headers=subscribed_headers, json=booking).json['booking']['id']
+    assert client.get('/api/users/dashboard', headers=subscribed_headers).json['counts']['pending'] == 1
+    
+    stored = db.session.get(BookingRequest, booking_id)
+    values = {'status': BookingStatus.SUCCESS, 'booking_reference': 'ABC123'}
+    get_status_writer().submit(booking_id, values, event=status_event(stored, values)).wait(5)
+    
+    counts = client.get('/api/users/dashboard', headers=subscribed_headers).json['counts']
+    assert counts['pending'] == 0
+    assert counts['success'] == 1
+
+def test_booking_status_stream(app, client, auth_headers):
+    """Test a status change made by the automation is pushed to the owner's event stream"""
+    user = User.query.filter_by(email='test@example.com').first()
+    booking = BookingRequest(
+        user_id=user.id,
+        origin='New York',
+        destination='Tokyo',
+        departure_date=date(2025, 12, 25),
+        scheduled_time=datetime(2025, 12, 25, 5, 0, 0),
+        status=BookingStatus.PROCESSING
+    )
+    db.session.add(booking)
+    db.session.commit()
+    
+    token = auth_headers['Authorization'].split()[1]
+    response = client.get(f'/api/bookings/events?token={token}', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+    assert b': connected' in next(stream)
+    
+    BookingAutomation(booking, app.app_context())._update_booking_status(BookingStatus.SUCCESS, 'Booked', 'ABC123')
+    
+    chunk = next(stream).decode()
+    assert chunk.startswith('event: status')
+    assert '"booking_reference": "ABC123"' in chunk and '"status": "success"' in chunk
+    response.close()
+    
+    assert client.get('/api/bookings/events').status_code == 401
+
+def test_booking_status_stream_cap_and_catch_up(app, client, auth_headers, monkeypatch):
+    """Test streams over the cap get a 503 and a reconnect replays only what it missed"""
+    from services.events import get_event_bus
+    
+    user = User.query.filter_by(email='test@example.com').first()
+    booking = BookingRequest(
+        user_id=user.id,
+        origin='New York',
+        destination='Tokyo',
+        departure_date=date(2025, 12, 25),
+        scheduled_time=datetime(2025, 12, 25, 5, 0, 0),
+        status=BookingStatus.PROCESSING
+    )
+    db.session.add(booking)
+    db.session.commit()
+    monkeypatch.setattr(get_event_bus(), 'max_streams', 1)
+    
+    token = auth_headers['Authorization'].split()[1]
+    response = client.get(f'/api/bookings/events?token={token}', buffered=False)
+    opening = next(iter(response.response)).decode()
+    assert 'event: resync' not in opening
+    last_event_id = opening.split('event: ready\nid: ')[1].split('\n')[0]
+    
+    refused = client.get(f'/api/bookings/events?token={token}')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After']
+    response.close()
+    
+    # Published while disconnected: replayed on reconnect, no refetch needed
+    BookingAutomation(booking, app.app_context())._update_booking_status(BookingStatus.SUCCESS, 'Booked', 'ABC123')
+    response = client.get(f'/api/bookings/events?token={token}&last_event_id={last_event_id}', buffered=False)
+    opening = next(iter(response.response)).decode()
+    assert 'event: resync' not in opening
+    assert 'event: status' in opening and '"booking_reference": "ABC123"' in opening
+    response.close()
+    
+    # An id from before this process's history: the client has to refetch
+    response = client.get(f'/api/bookings/events?token={token}', headers={'Last-Event-ID': '1'}, buffered=False)
+    opening = next(iter(response.response)).decode()
+    assert 'event: resync' in opening and 'event: status' not in opening
+    response.close()
+
+def test_worker_startup_is_lazy():
+    """Test that a fresh worker answers its first request without importing optional subsystems"""
+    from benchmark_startup import measure_once
+    
+    # Timing budget: python benchmark_startup.py, as a separate CI step
+    result = measure_once()
+    assert result['status'] == 200
+    assert result['lazy_modules_loaded'] == []
+
+def test_finished_bookings_are_archived_in_batches_and_still_readable(client, auth_headers, admin_headers):
+    """Test old finished bookings move to the archive in batches and stay visible to their owner"""
+    from models import ArchivedBooking, BookingTrace
+    from services.archive import archive_bookings
+    
+    user = User.query.filter_by(email='test@example.com').first()
+    old = datetime.utcnow() - timedelta(days=60)
+    bookings = []
+    for status, updated_at in [
+        (BookingStatus.SUCCESS, old), (BookingStatus.FAILED, old), (BookingStatus.CANCELED, old),
+        (BookingStatus.SUCCESS, datetime.utcnow()), (BookingStatus.PENDING, old), (BookingStatus.DEAD_LETTER, old)
+    ]:
+        booking = BookingRequest(
+            user_id=user.id, origin='New York', destination='Tokyo', departure_date=date(2030, 1, 15),
+            scheduled_time=datetime(2030, 1, 15), status=status, created_at=updated_at, updated_at=updated_at
+        )
+        db.session.add(booking)
+        bookings.append(booking)
+    db.session.flush()
+    db.session.add(BookingTrace(booking_id=bookings[0].id, started_at=old))
+    db.session.commit()
+    ids = [booking.id for booking in bookings]
+    
+    assert archive_bookings(older_than_days=30, batch_size=2) == 3
+    assert sorted(row.id for row in ArchivedBooking.query) == ids[:3]
+    assert sorted(row.id for row in BookingRequest.query) == ids[3:]
+    assert BookingTrace.query.count() == 0
+    assert archive_bookings(older_than_days=30) == 0
+    
+    # History reads fall through to the archive
+    listed = client.get('/api/bookings', headers=auth_headers).json['bookings']
+    assert sorted(booking['id'] for booking in listed) == ids
+    response = client.get(f'/api/bookings/{ids[0]}', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['booking']['status'] == 'success'
+    assert 'archived_at' in response.json['booking']
+    
+    dashboard = client.get('/api/users/dashboard', headers=auth_headers).json
+    assert dashboard['counts']['total'] == 6
+    assert dashboard['counts']['success'] == 2
+    
+    stats = client.get('/api/admin/stats', headers=admin_headers).json['stats']
+    assert stats['total_bookings'] == 6
+    assert stats['archived_bookings'] == 3
+    
+    # Batches are found through the (status, updated_at) index, not a table scan
+    from sqlalchemy import text
+    from services.archive import archivable_ids
+    sql = str(archivable_ids(datetime.utcnow(), 1000).statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    assert 'ix_booking_requests_status_updated' in str(db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all())
+
+def test_archived_ids_are_never_reused(client, auth_headers):
+    """Test a booking created after the highest id was archived gets a new id, so the next archival run succeeds"""
+    from models import ArchivedBooking
+    from services.archive import archive_bookings
+    
+    user = User.query.filter_by(email='test@example.com').first()
+    old = datetime.utcnow() - timedelta(days=60)
+    
+    def add_finished_booking():
+        booking = BookingRequest(
+            user_id=user.id, origin='New York', destination='Tokyo', departure_date=date(2030, 1, 15),
+            scheduled_time=datetime(2030, 1, 15), status=BookingStatus.SUCCESS, created_at=old, updated_at=old
+        )
+        db.session.add(booking)
+        db.session.commit()
+        return booking.id
+    
+    first = add_finished_booking()
+    assert archive_bookings(older_than_days=30) == 1
+    second = add_finished_booking()
+    assert second > first
+    assert archive_bookings(older_than_days=30) == 1
+    assert sorted(row.id for row in ArchivedBooking.query) == [first, second]
+
+def test_booking_options_are_validated_json_and_filterable(client, subscribed_headers, admin_headers):
+    """Test options are validated, stored as JSON, parsed once per value and filterable through the expression indexes"""
+    from sqlalchemy import text
+    from services.booking_automation import BookingSnapshot
+    
+    departure_date = (date.today() + timedelta(days=30)).isoformat()
+    booking = {
+        'origin': 'Los Angeles', 'destination': 'Tokyo', 'departure_date': departure_date,
+        'primary_option': {'airline': ' ua ', 'cabin_class': 'Premium Economy', 'max_stops': 0},
+        'backup_option': {'airline': 'NH'}
+    }
+    response = client.post('/api/bookings', headers=subscribed_headers, json=booking)
+    assert response.status_code == 201
+    assert response.json['booking']['primary_option'] == {'airline': 'UA', 'cabin_class': 'premium_economy', 'max_stops': 0}
+    booking_id = response.json['booking']['id']
+    
+    bad = dict(booking, primary_option={'cabin_class': 'steerage'})
+    assert client.post('/api/bookings', headers=subscribed_headers, json=bad).status_code == 400
+    bad = dict(booking, backup_option={'seat': 'aisle'})
+    assert client.post('/api/bookings', headers=subscribed_headers, json=bad).status_code == 400
+    
+    response = client.put(f'/api/bookings/{booking_id}', headers=subscribed_headers, json={'backup_option': {'cabin_class': 'first'}})
+    assert response.json['booking']['backup_option'] == {'cabin_class': 'first'}
+    
+    db.session.expire_all()
+    stored = db.session.get(BookingRequest, booking_id)
+    assert stored.primary_preferences is stored.primary_preferences
+    assert stored.primary_preferences.cabin_class == 'premium_economy'
+    snapshot = BookingSnapshot.from_booking(stored)
+    assert snapshot.primary_option.airline == 'UA'
+    assert snapshot.backup_option.cabin_class == 'first'
+    
+    response = client.get('/api/admin/bookings?airline=ua&cabin_class=premium_economy', headers=admin_headers)
+    assert [b['id'] for b in response.json['bookings']] == [booking_id]
+    assert client.get('/api/admin/bookings?airline=NH', headers=admin_headers).json['bookings'] == []
+    assert client.get('/api/admin/bookings?cabin_class=steerage', headers=admin_headers).status_code == 400
+    
+    query = BookingRequest.query.filter(BookingRequest.option_value('airline') == 'UA')
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    assert 'ix_booking_requests_primary_airline' in str(plan)
+
+def test_admin_booking_search_filters_and_pages(client, auth_headers, admin_headers):
+    """Test admin search filters by route text, status, dates and email and pages with a keyset cursor"""
+    from sqlalchemy import text
+    
+    user = User.query.filter_by(email='test@example.com').first()
+    admin = User.query.filter_by(email='admin@example.com').first()
+    rows = [
+        (user, 'Los Angeles (LAX)', 'Tokyo', BookingStatus.FAILED, 1, 'Login failed: captcha'),
+        (user, 'Los Angeles (LAX)', 'Tokyo Haneda', BookingStatus.FAILED, 2, 'Search results timed out'),
+        (user, 'Los Angeles (LAX)', 'Osaka', BookingStatus.FAILED, 3, None),
+        (admin, 'Lagos', 'Tokyo', BookingStatus.SUCCESS, 4, 'Booked'),
+        (user, 'Seattle', 'Tokyo', BookingStatus.FAILED, 5, None),
+    ]
+    for owner, origin, destination, status, day, message in rows:
+        db.session.add(BookingRequest(
+            user_id=owner.id, origin=origin, destination=destination, status=status,
+            departure_date=date(2030, 1, day), scheduled_time=datetime(2030, 1, day, 5, 0, 0),
+            result_message=message
+        ))
+    db.session.commit()
+    
+    def search(query):
+        response = client.get(f'/api/admin/bookings/search?{query}', headers=admin_headers)
+        assert response.status_code == 200, response.json
+        return response.json
+    
+    result = search('origin=los&destination=tokyo&status=failed')
+    assert [(b['destination'], b['user_email']) for b in result['bookings']] == [
+        ('Tokyo Haneda', 'test@example.com'), ('Tokyo', 'test@example.com')
+    ]
+    assert [b['origin'] for b in search('origin=LAX&match=contains')['bookings']] == ['Los Angeles (LAX)'] * 3
+    assert search('origin=LAX')['bookings'] == []
+    assert [b['destination'] for b in search('result_message=timed')['bookings']] == ['Tokyo Haneda']
+    assert [b['origin'] for b in search('email=admin@example.com')['bookings']] == ['Lagos']
+    assert len(search('departure_from=2030-01-02&departure_to=2030-01-04')['bookings']) == 3
+    assert len(search('scheduled_from=2030-01-04&scheduled_to=2030-01-05')['bookings']) == 2
+    
+    # Renamed rows are found under their new text only (FTS5 triggers on SQLite)
+    renamed = BookingRequest.query.filter_by(origin='Seattle').first()
+    renamed.origin = 'Portland'
+    db.session.commit()
+    assert search('origin=seattle')['bookings'] == []
+    assert len(search('origin=portland')['bookings']) == 1
+    
+    page = search('status=failed&limit=3')
+    assert len(page['bookings']) == 3 and page['next_cursor']
+    rest = search(f"status=failed&limit=3&cursor={page['next_cursor']}")
+    assert len(rest['bookings']) == 1 and rest['next_cursor'] is None
+    assert rest['bookings'][0]['id'] not in {b['id'] for b in page['bookings']}
+    
+    for query in ('status=lost', 'match=fuzzy', 'departure_from=soon', 'cursor=nope', 'limit=0'):
+        assert client.get(f'/api/admin/bookings/search?{query}', headers=admin_headers).status_code == 400
+    
+    plan = str(db.session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT rowid FROM booking_search WHERE origin LIKE 'los%'"
+    )).all())
+    assert 'VIRTUAL TABLE INDEX' in plan
+
+def test_admin_search_plans_use_indexes_on_generated_load(app, admin_headers, client):
+    """Test every benchmark search, first and deep pages, avoids scanning booking_requests"""
+    import random
+    from benchmark_search import check_plans, full_scans, measure
+    from generate_load_data import generate_bookings, generate_users
+    
+    rng = random.Random(3)
+    user_ids, timezones = generate_users(rng, 20, chunk_size=10)
+    generate_bookings(rng, user_ids, timezones, 500, days=10, chunk_size=200)
+    
+    assert check_plans() == {}
+    assert full_scans('SCAN booking_requests') == ['SCAN booking_requests']
+    assert measure({'status': 'success'}, runs=1, pages=3)['page'] == 3
+    
+    # The listing endpoint validates status instead of passing the raw string to the filter
+    assert client.get('/api/admin/bookings?status=Failed', headers=admin_headers).status_code == 200
+    assert client.get('/api/admin/bookings?status=lost', headers=admin_headers).status_code == 400
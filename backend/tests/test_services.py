@@ -0,0 +1,880 @@
+import random
+import pytest
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from models import SubscriptionTier
+from services.executor import TierQueue, parse_tier_shares
+from services.rate_limit import (
+    CircuitBreaker, DatabaseBucketStore, LocalBucketStore, RateLimiter, RateLimitTimeout
+)
+from utils.booking_options import EMPTY_OPTION
+from utils.timezone import batch_midnight_utc, local_midnight_utc, to_utc
+from services.retry import (
+    RETRY_POLICIES, next_attempt_time, ERROR_TIMEOUT, ERROR_LOGIN, ERROR_NETWORK
+)
+
+def make_booking(attempt_count=1, scheduled_time=None):
+    return SimpleNamespace(
+        attempt_count=attempt_count,
+        scheduled_time=scheduled_time or datetime(2025, 12, 25, 5, 0, 0)
+    )
+
+def test_retry_backoff_is_capped_and_jittered():
+    """Test backoff grows exponentially but never exceeds the policy cap"""
+    policy = RETRY_POLICIES[ERROR_TIMEOUT]
+    rng = random.Random(42)
+    delays = [policy.backoff(10, rng) for _ in range(100)]
+    
+    assert all(0 <= d <= policy.max_delay for d in delays)
+    assert len(set(delays)) > 1
+
+def test_permanent_errors_are_not_retried():
+    """Test that permanent error classes fail immediately"""
+    booking = make_booking()
+    assert next_attempt_time(booking, ERROR_LOGIN, now=booking.scheduled_time) is None
+
+def test_retry_stops_at_attempt_budget_and_window():
+    """Test retries respect max attempts and the fare window"""
+    booking = make_booking()
+    now = booking.scheduled_time
+    
+    assert next_attempt_time(booking, ERROR_NETWORK, now=now) is not None
+    
+    booking.attempt_count = RETRY_POLICIES[ERROR_NETWORK].max_attempts
+    assert next_attempt_time(booking, ERROR_NETWORK, now=now) is None
+    
+    booking.attempt_count = 1
+    assert next_attempt_time(booking, ERROR_NETWORK, now=now + timedelta(hours=1)) is None
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_token_bucket_limits_burst_then_refills():
+    """Test the local token bucket allows a burst and then paces requests"""
+    clock = FakeClock()
+    limiter = RateLimiter(LocalBucketStore(), rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    
+    for _ in range(3):
+        limiter.acquire('site.test')
+    assert clock.now == 1000.0
+    
+    limiter.acquire('site.test')
+    assert clock.now == pytest.approx(1000.5)
+    
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('site.test', timeout=0.1)
+
+def test_database_bucket_store_is_shared(app):
+    """Test the database token bucket spends tokens from one shared row"""
+    store = DatabaseBucketStore()
+    
+    assert store.take('site.test', capacity=2, rate=1, now=1000.0) == 0
+    assert store.take('site.test', capacity=2, rate=1, now=1000.0) == 0
+    assert store.take('site.test', capacity=2, rate=1, now=1000.0) == pytest.approx(1.0)
+    assert store.take('site.test', capacity=2, rate=1, now=1001.0) == 0
+
+def test_circuit_breaker_opens_and_probes():
+    """Test the breaker opens on errors and closes after a successful probe"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=0.5, min_calls=4, window_seconds=60,
+                             cooldown_seconds=30, clock=clock)
+    
+    for _ in range(4):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()  # Only a single probe while half-open
+    breaker.record_success()
+    
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_breaker_probe_is_released_when_automation_raises(monkeypatch):
+    """Test an exception during the half-open probe counts as a failure instead of leaving the probe in flight"""
+    import services.booking_automation as booking_automation
+    
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=0.5, min_calls=1, window_seconds=60,
+                             cooldown_seconds=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    monkeypatch.setattr(booking_automation, 'get_circuit_breaker', lambda host: breaker)
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    automation = booking_automation.BookingAutomation(booking, None, site_url='https://site.test')
+    
+    def launch_fails():
+        raise RuntimeError('browser failed to launch')
+    automation._book_on_site = launch_fails
+    
+    result = automation._run_browser_automation()
+    assert not result['success']
+    assert 'browser failed to launch' in result['message']
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    # The next cooldown lets a new probe through
+    clock.now += 30
+    assert breaker.allow()
+
+def test_open_breaker_turns_bookings_away_without_spending_a_token(monkeypatch):
+    """Test the breaker is checked before the rate limiter, which is only used for the search"""
+    import services.booking_automation as booking_automation
+    
+    breaker = CircuitBreaker(failure_threshold=0.5, min_calls=1, window_seconds=60, cooldown_seconds=30, clock=FakeClock())
+    breaker.record_failure()
+    monkeypatch.setattr(booking_automation, 'get_circuit_breaker', lambda host: breaker)
+    clock = FakeClock()
+    limiter = RateLimiter(LocalBucketStore(), rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+    monkeypatch.setattr(booking_automation, 'get_rate_limiter', lambda: limiter)
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    automation = booking_automation.BookingAutomation(booking, None, site_url='https://site.test')
+    automation._book_on_site = lambda: pytest.fail('dispatched through an open breaker')
+    
+    result = automation._run_browser_automation()
+    assert result['error_class'] == 'circuit_open'
+    # The bucket's only token is still there
+    limiter.acquire('site.test', timeout=0)
+
+def test_tier_queue_orders_by_tier_then_time():
+    """Test due bookings start by tier, then scheduled time, then creation time"""
+    clock = FakeClock()
+    queue = TierQueue(capacity=1, shares={}, aging_seconds=0, clock=clock)
+    midnight = datetime(2025, 12, 25, 5, 0, 0)
+    
+    queue.push(1, SubscriptionTier.BASIC, midnight, midnight)
+    queue.push(2, SubscriptionTier.PREMIUM, midnight + timedelta(seconds=1), midnight)
+    queue.push(3, SubscriptionTier.PREMIUM, midnight, midnight + timedelta(seconds=5))
+    queue.push(4, SubscriptionTier.PREMIUM, midnight, midnight)
+    
+    order = [queue.pop_next({}).booking_id for _ in range(4)]
+    assert order == [4, 3, 2, 1]
+
+def test_tier_queue_guarantees_slots_and_ages_waiting_bookings():
+    """Test guaranteed slots are reserved and long waits are promoted"""
+    clock = FakeClock()
+    shares = parse_tier_shares('premium=0.5,standard=0.25,basic=0.25')
+    queue = TierQueue(capacity=4, shares=shares, aging_seconds=30, clock=clock)
+    midnight = datetime(2025, 12, 25, 5, 0, 0)
+    
+    for booking_id in range(10):
+        queue.push(booking_id, SubscriptionTier.PREMIUM, midnight, midnight)
+    queue.push(100, SubscriptionTier.BASIC, midnight, midnight)
+    
+    # Premium may borrow free slots, but not the one guaranteed to basic
+    running = {SubscriptionTier.PREMIUM: 3}
+    assert queue.pop_next(running).booking_id == 100
+    
+    queue.push(101, SubscriptionTier.BASIC, midnight, midnight)
+    running = {SubscriptionTier.PREMIUM: 2, SubscriptionTier.BASIC: 1}
+    assert queue.pop_next(running).tier == SubscriptionTier.PREMIUM
+    
+    # After waiting two aging periods basic competes as premium, and wins on age
+    clock.now += 60
+    queue.push(11, SubscriptionTier.PREMIUM, midnight, midnight + timedelta(minutes=1))
+    running = {SubscriptionTier.PREMIUM: 2, SubscriptionTier.BASIC: 1}
+    popped = [queue.pop_next(running).booking_id for _ in range(len(queue))]
+    assert popped.index(101) < popped.index(11)
+
+def test_local_midnight_utc_handles_dst_edges():
+    """Test midnight conversion, including zones whose DST switch is at midnight"""
+    assert local_midnight_utc(date(2025, 1, 15), 'America/New_York') == datetime(2025, 1, 15, 5, 0)
+    assert local_midnight_utc(date(2025, 7, 15), 'America/New_York') == datetime(2025, 7, 15, 4, 0)
+    
+    # Santiago springs forward at midnight: 00:00 does not exist and moves forward
+    assert local_midnight_utc(date(2024, 9, 8), 'America/Santiago') == datetime(2024, 9, 8, 4, 0)
+    # ...and falls back to 23:00: 23:30 happens twice, the first (DST) one wins
+    assert to_utc(datetime(2024, 4, 6, 23, 30), 'America/Santiago') == datetime(2024, 4, 7, 2, 30)
+
+def test_batch_midnight_utc_preserves_order():
+    """Test the batch path matches the single conversion for every pair"""
+    pairs = [(date(2025, 3, day % 28 + 1), tz) for day in range(200)
+             for tz in ('UTC', 'Asia/Kolkata', 'America/Los_Angeles')]
+    
+    assert batch_midnight_utc(pairs) == [local_midnight_utc(d, tz) for d, tz in pairs]
+
+def test_load_data_generator_is_reproducible(app):
+    """Test the bulk generator writes chunked rows deterministically for a seed"""
+    from generate_load_data import generate_bookings, generate_users
+    from models import BookingRequest, db
+    
+    user_ids, timezones = generate_users(random.Random(7), 25, chunk_size=10)
+    generate_bookings(random.Random(7), user_ids, timezones, 120, days=10, chunk_size=50)
+    
+    rows = db.session.query(BookingRequest.user_id, BookingRequest.scheduled_time).order_by(BookingRequest.id).all()
+    assert len(rows) == 120
+    
+    generate_bookings(random.Random(7), user_ids, timezones, 120, days=10, chunk_size=50)
+    again = db.session.query(BookingRequest.user_id, BookingRequest.scheduled_time).order_by(BookingRequest.id).all()
+    assert again[120:] == rows
+
+def test_instrumented_pool_records_waits_overflow_and_timeouts(tmp_path):
+    """Test pool checkout instrumentation and Config-driven engine options"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+    from sqlalchemy.pool import NullPool
+    from utils.db_pool import InstrumentedQueuePool, build_engine_options, pool_metrics, pool_status
+    
+    config = SimpleNamespace(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/pool.db', DB_PGBOUNCER_MODE=False,
+        DB_POOL_SIZE=1, DB_MAX_OVERFLOW=1, DB_POOL_TIMEOUT=0.05, DB_POOL_RECYCLE=1800,
+        DB_POOL_PRE_PING=False, DB_STATEMENT_TIMEOUT_MS=0
+    )
+    options = build_engine_options(config)
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert build_engine_options(SimpleNamespace(**dict(vars(config), DB_PGBOUNCER_MODE=True)))['poolclass'] is NullPool
+    
+    engine = create_engine(config.SQLALCHEMY_DATABASE_URI, **options)
+    before = pool_metrics.to_dict()
+    first, second = engine.connect(), engine.connect()
+    
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    
+    after = pool_status(engine)
+    assert after['checked_out'] == 2
+    assert after['overflow_events'] == before['overflow_events'] + 1
+    assert after['timeouts'] == before['timeouts'] + 1
+    first.close()
+    second.close()
+    engine.dispose()
+
+def test_schema_upgrade_adds_defaulted_columns_and_fails_loudly(tmp_path):
+    """Test NOT NULL columns with a server_default are added in place and others stop the upgrade"""
+    from sqlalchemy import Column, Integer, MetaData, Table, create_engine, text
+    from models import db
+    from utils.schema import SchemaUpgradeError, add_missing_columns, upgrade_schema
+    
+    # booking_requests as it was before retry tracking
+    engine = create_engine(f'sqlite:///{tmp_path}/old.db')
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE booking_requests (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, status VARCHAR(10) NOT NULL, "
+            "origin VARCHAR(100) NOT NULL, destination VARCHAR(100) NOT NULL, departure_date DATE NOT NULL, "
+            "scheduled_time DATETIME NOT NULL, result_message TEXT, created_at DATETIME, updated_at DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO booking_requests (user_id, status, origin, destination, departure_date, scheduled_time) "
+            "VALUES (1, 'PENDING', 'New York', 'Tokyo', '2030-01-15', '2030-01-15 05:00:00')"
+        ))
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Archived before the upgrade, above every live id
+        connection.execute(text(
+            "INSERT INTO booking_requests_archive (id, user_id, status, origin, destination, departure_date, "
+            "scheduled_time, attempt_count, archived_at) "
+            "VALUES (5, 1, 'SUCCESS', 'New York', 'Tokyo', '2030-01-15', '2030-01-15 05:00:00', 1, '2030-02-01')"
+        ))
+    upgrade_schema(engine, db.metadata)
+    
+    with engine.begin() as connection:
+        assert connection.execute(text('SELECT attempt_count FROM booking_requests')).scalar() == 0
+        # Rebuilt with AUTOINCREMENT, numbering past the archived ids
+        connection.execute(text(
+            "INSERT INTO booking_requests (user_id, status, origin, destination, departure_date, scheduled_time) "
+            "VALUES (1, 'PENDING', 'New York', 'Osaka', '2030-01-15', '2030-01-15 05:00:00')"
+        ))
+        assert connection.execute(text("SELECT id FROM booking_requests WHERE destination = 'Osaka'")).scalar() == 6
+        assert connection.execute(text("SELECT rowid FROM booking_search WHERE booking_search MATCH 'Osaka'")).scalar() == 6
+    
+    metadata = MetaData()
+    Table('booking_requests', metadata, Column('id', Integer, primary_key=True), Column('shard', Integer, nullable=False))
+    with pytest.raises(SchemaUpgradeError, match='booking_requests.shard'):
+        add_missing_columns(engine, metadata)
+    engine.dispose()
+
+def test_metrics_histogram_rendering_and_disabled_registry():
+    """Test histogram buckets render cumulatively and a disabled registry records nothing"""
+    from utils.metrics import Registry, Histogram, Counter
+    
+    registry = Registry(enabled=True)
+    latency = Histogram('test_latency_seconds', 'Test latency', ['step'], buckets=(0.1, 1), registry=registry)
+    latency.observe(0.05, step='login')
+    latency.observe(0.5, step='login')
+    latency.observe(5, step='login')
+    
+    text = registry.render()
+    assert '# TYPE test_latency_seconds histogram' in text
+    assert 'test_latency_seconds_bucket{step="login",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{step="login",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{step="login",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{step="login"} 3' in text
+    
+    disabled = Registry(enabled=False)
+    counter = Counter('test_total', 'Test counter', registry=disabled)
+    counter.inc()
+    with Histogram('test_seconds', 'Test', registry=disabled).time():
+        pass
+    assert counter.samples() == []
+
+def test_trace_artifacts_are_pruned_oldest_first(tmp_path):
+    """Test the artifact directory is kept under its size cap"""
+    import os
+    from services.tracing import prune_artifacts
+    
+    for i in range(4):
+        path = tmp_path / f'artifact-{i}.png'
+        path.write_bytes(b'x' * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+    
+    prune_artifacts(str(tmp_path), 250)
+    
+    assert sorted(os.listdir(tmp_path)) == ['artifact-2.png', 'artifact-3.png']
+
+class FakeElement:
+    def __init__(self, page, selector, text=''):
+        self.page = page
+        self.selector = selector
+        self.text = text
+    
+    def query_selector(self, selector):
+        return FakeElement(self.page, selector, '$250')
+    
+    def inner_text(self):
+        return self.text
+    
+    def get_attribute(self, name):
+        return '/book/option-1' if name == 'href' else None
+    
+    def click(self):
+        self.page.clicks.append(self.selector)
+
+class FakePage:
+    """Records the clicks a booking flow makes against a site that always has results"""
+    
+    def __init__(self):
+        self.url = ''
+        self.clicks = []
+        self.visited = []
+        self.filled = []
+    
+    def goto(self, url):
+        self.url = url
+        self.visited.append(url)
+    
+    def fill(self, selector, value):
+        self.filled.append(selector)
+    
+    def click(self, selector):
+        self.clicks.append(selector)
+        self.url = 'https://site.test/dashboard'
+    
+    def wait_for_load_state(self, state):
+        pass
+    
+    def wait_for_selector(self, selector, timeout=None):
+        return FakeElement(self, selector)
+    
+    def query_selector(self, selector):
+        return FakeElement(self, selector, 'REF123')
+
+def test_dry_run_stops_before_confirming():
+    """Test dry-run walks every step but never clicks the confirm button"""
+    from services.booking_automation import BookingAutomation
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    automation = BookingAutomation(booking, None, dry_run=True, site_url='https://site.test')
+    automation.login_override = ('user', 'secret')
+    page = FakePage()
+    
+    result = automation._run_steps(page)
+    
+    assert result['success'] and result['dry_run']
+    assert '.book-button' in page.clicks
+    assert 'button.confirm-booking' not in page.clicks
+    assert [step[0] for step in automation.tracer.steps] == ['login', 'rate_limit', 'search', 'results', 'confirm']
+    
+    automation.dry_run = False
+    result = automation._run_steps(FakePage())
+    assert result['booking_reference'] == 'REF123'
+
+class AsyncFake:
+    """Async view of a FakePage or FakeElement, for the async backend's flow"""
+    
+    def __init__(self, target):
+        self.target = target
+    
+    def __getattr__(self, name):
+        attribute = getattr(self.target, name)
+        if not callable(attribute):
+            return attribute
+        
+        async def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return AsyncFake(result) if isinstance(result, FakeElement) else result
+        return call
+
+def test_rate_limit_token_is_taken_after_the_fire_wait():
+    """Test both flows log in and wait for the site's midnight before taking the token, so it paces the search itself"""
+    import asyncio
+    from services.async_automation import AsyncBookingFlow
+    from services.booking_automation import BookingAutomation
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    
+    def automation():
+        automation = BookingAutomation(booking, None, dry_run=True, site_url='https://site.test')
+        automation.login_override = ('user', 'secret')
+        automation._fire_delay = lambda: 0.01
+        return automation
+    
+    expected = ['login', 'fire_wait', 'rate_limit', 'search', 'results', 'confirm']
+    sync_automation = automation()
+    assert sync_automation._run_steps(FakePage())['success']
+    assert [step[0] for step in sync_automation.tracer.steps] == expected
+    
+    async_automation = automation()
+    assert asyncio.run(AsyncBookingFlow(async_automation)._run_steps(AsyncFake(FakePage())))['success']
+    assert [step[0] for step in async_automation.tracer.steps] == expected
+
+def test_async_backend_runs_flows_concurrently_within_semaphore():
+    """Test many bookings share the loop and browser, capped by the semaphore"""
+    import asyncio
+    import threading
+    from services.async_automation import AsyncAutomationBackend
+    
+    backend = AsyncAutomationBackend(concurrency=5)
+    browser = object()
+    
+    async def fake_browser():
+        return browser
+    backend._get_browser = fake_browser
+    
+    peak = []
+    
+    async def flow(shared_browser):
+        assert shared_browser is browser
+        peak.append(backend.in_flight)
+        await asyncio.sleep(0.05)
+        return 'done'
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(backend.run(flow, timeout=5))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == ['done'] * 20
+    assert max(peak) == 5
+    assert backend.metrics()['completed'] == 20
+    backend.shutdown()
+
+def test_async_backend_errors_are_classified(monkeypatch):
+    """Test an exception from the event loop thread becomes a classified result, not an unhandled error"""
+    from playwright.async_api import Error as PlaywrightError
+    import services.async_automation as async_automation
+    from services.booking_automation import BookingAutomation
+    
+    class FailingBackend:
+        def run(self, flow, timeout):
+            raise PlaywrightError('net::ERR_CONNECTION_REFUSED')
+    monkeypatch.setattr(async_automation, 'get_async_backend', lambda: FailingBackend())
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    result = async_automation.run_async_booking(BookingAutomation(booking, None, site_url='https://site.test'))
+    assert not result['success']
+    assert result['error_class'] == ERROR_NETWORK
+
+class AsyncConfirmPage:
+    def __init__(self):
+        self.clicks = []
+    
+    async def click(self, selector):
+        self.clicks.append(selector)
+    
+    async def wait_for_load_state(self, state):
+        pass
+    
+    async def query_selector(self, selector):
+        return None
+
+def test_async_timeout_after_confirm_is_left_for_review(monkeypatch):
+    """Test a timeout once the async flow sent the confirm click is not retryable, and an abandoned flow never clicks"""
+    import asyncio
+    from concurrent.futures import TimeoutError as FutureTimeout
+    import services.async_automation as async_automation
+    from services.booking_automation import BookingAutomation
+    from services.retry import ERROR_AFTER_CONFIRM
+    
+    class TimeoutBackend:
+        def __init__(self, confirm_first):
+            self.confirm_first = confirm_first
+            self.flow = None
+        
+        def run(self, flow, timeout):
+            self.flow = flow
+            if self.confirm_first:
+                asyncio.run(flow._confirm_booking(AsyncConfirmPage()))
+            raise FutureTimeout()
+    
+    booking = SimpleNamespace(
+        id=None, user_id=None, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+        max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+    )
+    backend = TimeoutBackend(confirm_first=True)
+    monkeypatch.setattr(async_automation, 'get_async_backend', lambda: backend)
+    result = async_automation.run_async_booking(BookingAutomation(booking, None, site_url='https://site.test'))
+    assert result['error_class'] == ERROR_AFTER_CONFIRM
+    
+    # Timed out before confirming: retryable, and the still-running flow may not click afterwards
+    backend = TimeoutBackend(confirm_first=False)
+    monkeypatch.setattr(async_automation, 'get_async_backend', lambda: backend)
+    result = async_automation.run_async_booking(BookingAutomation(booking, None, site_url='https://site.test'))
+    assert result['error_class'] == ERROR_TIMEOUT
+    page = AsyncConfirmPage()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(backend.flow._confirm_booking(page))
+    assert page.clicks == []
+
+def test_automation_holds_no_transaction_during_browser_phase(app, monkeypatch):
+    """Test the browser phase runs from a snapshot with no open transaction, and results are written back"""
+    from cryptography.fernet import Fernet
+    from config import Config
+    from models import db, User, TravelCredential, BookingRequest, BookingStatus
+    from services import scheduler
+    from services.booking_automation import BookingAutomation
+    from utils.security import encrypt_data
+    
+    monkeypatch.setattr(Config, 'ENCRYPTION_KEY', Fernet.generate_key().decode())
+    user = User(email='snapshot@example.com', password_hash='x', first_name='Snap', last_name='Shot')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(TravelCredential(
+        user_id=user.id,
+        travel_site_username=encrypt_data('traveller'),
+        travel_site_password=encrypt_data('secret')
+    ))
+    booking = BookingRequest(
+        user_id=user.id, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=datetime.utcnow(),
+        status=BookingStatus.PENDING
+    )
+    db.session.add(booking)
+    db.session.commit()
+    booking_id = booking.id
+    outer_session = db.session()
+    seen = {}
+    
+    def fake_browser_phase(automation):
+        seen['outer_in_transaction'] = outer_session.in_transaction()
+        seen['inner_in_transaction'] = db.session().in_transaction()
+        seen['credentials'] = automation._login_credentials()
+        seen['attempt'] = automation.booking.attempt_count
+        return {'success': True, 'message': 'Booked', 'booking_reference': 'SNAP1'}
+    monkeypatch.setattr(BookingAutomation, '_run_browser_automation', fake_browser_phase)
+    
+    scheduler.execute_booking(app, booking)
+    
+    assert seen == {
+        'outer_in_transaction': False,
+        'inner_in_transaction': False,
+        'credentials': ('traveller', 'secret'),
+        'attempt': 1
+    }
+    booking = db.session.get(BookingRequest, booking_id)
+    assert booking.status == BookingStatus.SUCCESS
+    assert booking.booking_reference == 'SNAP1'
+
+def make_pending_booking(monkeypatch, email):
+    """A due booking whose owner has saved travel credentials"""
+    from cryptography.fernet import Fernet
+    from config import Config
+    from models import db, User, TravelCredential, BookingRequest, BookingStatus
+    from utils.security import encrypt_data
+    
+    monkeypatch.setattr(Config, 'ENCRYPTION_KEY', Fernet.generate_key().decode())
+    user = User(email=email, password_hash='x', first_name='Test', last_name='User')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(TravelCredential(
+        user_id=user.id,
+        travel_site_username=encrypt_data('traveller'),
+        travel_site_password=encrypt_data('secret')
+    ))
+    booking = BookingRequest(
+        user_id=user.id, origin='New York', destination='Tokyo',
+        departure_date=date(2030, 1, 15), scheduled_time=datetime.utcnow(),
+        status=BookingStatus.PENDING
+    )
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+class ConfirmTimeoutPage(FakePage):
+    """A site that takes the confirm click and then never finishes loading"""
+    
+    def wait_for_load_state(self, state):
+        if 'button.confirm-booking' in self.clicks:
+            from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+            raise PlaywrightTimeoutError('Timeout 30000ms exceeded')
+
+def test_failures_after_the_confirm_click_are_never_retried(app, monkeypatch):
+    """Test a timeout after the confirm click, or an error saving the success, leaves the booking for review"""
+    from config import Config
+    from models import db, BookingRequest, BookingStatus
+    from services import scheduler
+    from services.booking_automation import BookingAutomation
+    from services.retry import ERROR_AFTER_CONFIRM
+    
+    monkeypatch.setattr(Config, 'CLOCK_SYNC_ENABLED', False)
+    monkeypatch.setattr(Config, 'SEARCH_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'TARGET_TRAVEL_SITE_URL', 'https://site.test')
+    monkeypatch.setattr(BookingAutomation, '_book_on_site', lambda automation: automation._run_steps(ConfirmTimeoutPage()))
+    booking = make_pending_booking(monkeypatch, 'confirm@example.com')
+    booking_id = booking.id
+    
+    scheduler.execute_booking(app, booking)
+    
+    booking = db.session.get(BookingRequest, booking_id)
+    assert booking.status == BookingStatus.NEEDS_REVIEW
+    assert booking.last_error_class == ERROR_AFTER_CONFIRM
+    assert booking.next_attempt_at is None
+    assert booking.attempt_count == 1
+    assert scheduler.scheduler.get_job(f'booking_retry_{booking_id}') is None
+    
+    # The site booked the ticket, but recording the success fails
+    booking.status = BookingStatus.PENDING
+    db.session.commit()
+    monkeypatch.setattr(BookingAutomation, '_book_on_site', lambda automation: automation._run_steps(FakePage()))
+    save = BookingAutomation._update_booking_status
+    
+    def success_not_saved(automation, status, *args, **kwargs):
+        if status == BookingStatus.SUCCESS:
+            raise RuntimeError('database is locked')
+        return save(automation, status, *args, **kwargs)
+    monkeypatch.setattr(BookingAutomation, '_update_booking_status', success_not_saved)
+    
+    scheduler.execute_booking(app, booking)
+    
+    booking = db.session.get(BookingRequest, booking_id)
+    assert booking.status == BookingStatus.NEEDS_REVIEW
+    assert booking.next_attempt_at is None
+    assert booking.attempt_count == 2
+
+def test_slow_success_write_is_not_turned_into_a_retry(app, monkeypatch):
+    """Test a status write that outlives its wait is left to the writer instead of queueing a retry behind it"""
+    from config import Config
+    from models import db, BookingRequest, BookingStatus
+    from services import scheduler
+    from services.booking_automation import BookingAutomation
+    from services.status_writer import StatusTransition
+    
+    monkeypatch.setattr(Config, 'CLOCK_SYNC_ENABLED', False)
+    monkeypatch.setattr(Config, 'SEARCH_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'TARGET_TRAVEL_SITE_URL', 'https://site.test')
+    monkeypatch.setattr(BookingAutomation, '_book_on_site', lambda automation: automation._run_steps(FakePage()))
+    submitted = []
+    submit = scheduler.get_status_writer().submit
+    
+    def record_submit(booking_id, values, **kwargs):
+        submitted.append(values['status'])
+        return submit(booking_id, values, **kwargs)
+    monkeypatch.setattr(scheduler.get_status_writer(), 'submit', record_submit)
+    
+    def slow_wait(transition, timeout=None):
+        transition._done.wait()
+        raise TimeoutError(f'Status write for booking {transition.booking_id} not flushed within {timeout}s')
+    monkeypatch.setattr(StatusTransition, 'wait', slow_wait)
+    
+    booking = make_pending_booking(monkeypatch, 'slow@example.com')
+    booking_id = booking.id
+    scheduler.execute_booking(app, booking)
+    
+    assert submitted == [BookingStatus.PROCESSING, BookingStatus.SUCCESS]
+    booking = db.session.get(BookingRequest, booking_id)
+    assert booking.status == BookingStatus.SUCCESS
+    assert booking.next_attempt_at is None
+
+def test_status_writer_batches_in_order_and_flushes_on_shutdown(app):
+    """Test queued transitions are written in batches, keep per-booking order and survive shutdown"""
+    from models import db, User, BookingRequest, BookingStatus
+    from services.status_writer import StatusWriter
+    
+    user = User(email='writer@example.com', password_hash='x', first_name='Write', last_name='Behind')
+    db.session.add(user)
+    db.session.flush()
+    bookings = [
+        BookingRequest(
+            user_id=user.id, origin='New York', destination=f'City {i}',
+            departure_date=date(2030, 1, 15), scheduled_time=datetime(2030, 1, 15, 5, 0, 0),
+            status=BookingStatus.PENDING
+        )
+        for i in range(3)
+    ]
+    db.session.add_all(bookings)
+    db.session.commit()
+    ids = [booking.id for booking in bookings]
+    
+    writer = StatusWriter(app, flush_interval=0.05, max_batch=100)
+    for booking_id in ids:
+        writer.submit(booking_id, {'status': BookingStatus.PROCESSING, 'result_message': 'Starting'})
+    for booking_id in ids:
+        writer.submit(booking_id, {'status': BookingStatus.SUCCESS, 'booking_reference': f'REF{booking_id}'})
+    writer.shutdown()
+    
+    assert writer.transitions == 6
+    assert writer.flushes < 6
+    db.session.expire_all()
+    for booking_id in ids:
+        booking = db.session.get(BookingRequest, booking_id)
+        assert booking.status == BookingStatus.SUCCESS
+        assert booking.result_message == 'Starting'
+        assert booking.booking_reference == f'REF{booking_id}'
+    
+    # After shutdown transitions are written inline rather than dropped
+    writer.submit(ids[0], {'status': BookingStatus.FAILED}).wait(1)
+    db.session.expire_all()
+    assert db.session.get(BookingRequest, ids[0]).status == BookingStatus.FAILED
+
+def test_identical_searches_are_coalesced(monkeypatch):
+    """Test one booking searches and an identical booking goes straight to the option it found"""
+    import threading
+    from services.booking_automation import BookingAutomation
+    from services.search_cache import SearchResultCache
+    
+    cache = SearchResultCache(ttl_seconds=5)
+    monkeypatch.setattr('services.booking_automation.get_search_cache', lambda: cache)
+    
+    def automation_for(booking_id):
+        booking = SimpleNamespace(
+            id=booking_id, user_id=None, origin='New York', destination='Tokyo',
+            departure_date=date(2030, 1, 15), scheduled_time=None, return_date=None, passengers=1,
+            max_price=None, attempt_count=1, primary_preferences=EMPTY_OPTION, backup_preferences=EMPTY_OPTION
+        )
+        automation = BookingAutomation(booking, None, site_url='https://site.test')
+        automation.login_override = ('user', 'secret')
+        return automation
+    
+    leader, leader_page = automation_for(1), FakePage()
+    assert leader._run_steps(leader_page)['booking_reference'] == 'REF123'
+    assert 'input[name="origin"]' in leader_page.filled
+    
+    follower, follower_page = automation_for(2), FakePage()
+    assert follower._run_steps(follower_page)['booking_reference'] == 'REF123'
+    assert 'input[name="origin"]' not in follower_page.filled
+    assert 'https://site.test/book/option-1' in follower_page.visited
+    assert [step[0] for step in follower.tracer.steps] == ['login', 'coalesce', 'confirm']
+    assert cache.metrics()['searches'] == 1 and cache.metrics()['hits'] == 1
+    
+    # Searches starting while the leader runs wait for its result
+    assert cache.join('route') == (None, None)
+    flights = [cache.join('route')[1] for _ in range(3)]
+    assert all(flight is flights[0] for flight in flights)
+    waited = []
+    waiters = [threading.Thread(target=lambda flight=flight: waited.append(flight.wait(5))) for flight in flights]
+    for waiter in waiters:
+        waiter.start()
+    cache.publish('route', [{'price': '$250', 'url': 'https://site.test/book/option-1'}])
+    for waiter in waiters:
+        waiter.join()
+    assert len(waited) == 3 and all(results[0]['price'] == '$250' for results in waited)
+
+def test_clock_sync_measures_skewed_site_clock():
+    """Test offset estimates against a local server whose clock runs 2.3 seconds ahead"""
+    import json
+    import threading
+    import time
+    from datetime import datetime
+    from email.utils import formatdate
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from services.clock_sync import ClockSync
+    
+    skew = 2.3
+    
+    class SkewedHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Send headers and body in one segment so delayed ACKs do not inflate the RTT
+        wbufsize = 65536
+        disable_nagle_algorithm = True
+        
+        def date_time_string(self, timestamp=None):
+            return formatdate(time.time() + skew, usegmt=True)
+        
+        def _respond(self, body=b''):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            return body
+        
+        def do_HEAD(self):
+            self._respond()
+        
+        def do_GET(self):
+            self.wfile.write(self._respond(json.dumps({'time': time.time() + skew}).encode()))
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SkewedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        from_dates = ClockSync(samples=12, timeout=2, max_age=60).sync(site_url)
+        assert from_dates['source'] == 'date_header'
+        assert abs(from_dates['offset'] - skew) < 0.15
+        
+        clock_sync = ClockSync(samples=9, timeout=2, max_age=60, time_url=f'{site_url}/time')
+        from_endpoint = clock_sync.sync(site_url)
+        assert abs(from_endpoint['offset'] - skew) < 0.05
+        
+        # Send when the site's clock reads the target, minus half the RTT
+        target = datetime.utcfromtimestamp(time.time() + skew + 10)
+        delay = clock_sync.fire_delay(f'127.0.0.1:{server.server_port}', target)
+        assert abs(delay - (10 - from_endpoint['rtt'] / 2)) < 0.05
+    finally:
+        server.shutdown()
+
+def test_local_event_broker_warns_under_several_workers(monkeypatch, capsys):
+    """Test the in-process broker is flagged when gunicorn runs more than one worker"""
+    import sys
+    from config import Config
+    from services.events import check_broker, server_workers
+    
+    monkeypatch.delenv('GUNICORN_CMD_ARGS', raising=False)
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    monkeypatch.setattr(Config, 'EVENT_BROKER', 'local')
+    assert server_workers() == 1
+    
+    monkeypatch.setattr(sys, 'argv', ['/usr/bin/gunicorn', '--bind', '0.0.0.0:5000', '--workers', '4', 'app:create_app()'])
+    assert server_workers() == 4
+    assert not check_broker()
+    assert 'EVENT_BROKER=local' in capsys.readouterr().out
+    
+    monkeypatch.setattr(sys, 'argv', ['/usr/bin/gunicorn', 'app:create_app()'])
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    assert server_workers() == 2
+    monkeypatch.setattr(Config, 'EVENT_BROKER', 'postgres')
+    assert check_broker()
@@ -0,0 +1,103 @@
+"""
+Typed schema for a booking's primary_option and backup_option.
+
+Options are stored as native JSON (JSONB on PostgreSQL) in the normalized
+form produced by BookingOption.to_dict(), so SQL can filter on fields such
+as airline or cabin class without decoding text per row.
+"""
+import re
+from dataclasses import dataclass, fields
+from sqlalchemy import String, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+CABIN_CLASSES = ('economy', 'premium_economy', 'business', 'first')
+
+# Option fields with expression indexes on booking_requests.primary_option
+INDEXED_OPTION_FIELDS = ('airline', 'cabin_class')
+
+_TIME_OF_DAY = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+class OptionValidationError(ValueError):
+    """A booking option that does not match the schema"""
+
+@dataclass(frozen=True, slots=True)
+class BookingOption:
+    """Flight preferences for one booking option; every field is optional"""
+    airline: str = None
+    cabin_class: str = None
+    flight_number: str = None
+    departure_after: str = None   # HH:MM, local to the origin
+    departure_before: str = None
+    max_stops: int = None
+    refundable: bool = None
+    
+    @classmethod
+    def parse(cls, data, name: str = 'option') -> 'BookingOption':
+        """Validate a JSON object (or None) into an option; raises OptionValidationError"""
+        if data is None:
+            return EMPTY_OPTION
+        if not isinstance(data, dict):
+            raise OptionValidationError(f'{name} must be an object')
+        
+        unknown = set(data) - {f.name for f in fields(cls)}
+        if unknown:
+            raise OptionValidationError(f"{name} has unknown fields: {', '.join(sorted(unknown))}")
+        
+        values = {key: value for key, value in data.items() if value is not None and value != ''}
+        for key in ('airline', 'flight_number'):
+            if key in values:
+                if not isinstance(values[key], str):
+                    raise OptionValidationError(f'{name}.{key} must be a string')
+                values[key] = values[key].strip().upper()
+        if 'cabin_class' in values:
+            cabin_class = str(values['cabin_class']).strip().lower().replace(' ', '_')
+            if cabin_class not in CABIN_CLASSES:
+                raise OptionValidationError(f"{name}.cabin_class must be one of {', '.join(CABIN_CLASSES)}")
+            values['cabin_class'] = cabin_class
+        for key in ('departure_after', 'departure_before'):
+            if key in values and not (isinstance(values[key], str) and _TIME_OF_DAY.match(values[key])):
+                raise OptionValidationError(f'{name}.{key} must be a time of day as HH:MM')
+        if 'max_stops' in values:
+            stops = values['max_stops']
+            if isinstance(stops, bool) or not isinstance(stops, int) or stops < 0:
+                raise OptionValidationError(f'{name}.max_stops must be a non-negative integer')
+        if 'refundable' in values and not isinstance(values['refundable'], bool):
+            raise OptionValidationError(f'{name}.refundable must be true or false')
+        
+        return cls(**values)
+    
+    def to_dict(self) -> dict:
+        """JSON form as stored, without unset fields"""
+        return {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) is not None}
+    
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) is not None for f in fields(self))
+
+EMPTY_OPTION = BookingOption()
+
+class option_field(FunctionElement):
+    """
+    Text value of one option field in a JSON column. The field name is
+    rendered literally (SQLAlchemy's JSON indexing binds it as a
+    parameter), so index DDL and queries compile to the same expression and
+    SQLite and PostgreSQL can use the expression indexes.
+    """
+    type = String()
+    name = 'option_field'
+    inherit_cache = True
+    
+    def __init__(self, column, field: str):
+        if field not in {f.name for f in fields(BookingOption)}:
+            raise ValueError(f'Unknown option field: {field}')
+        super().__init__(column, literal_column(field))
+
+@compiles(option_field)
+def _option_field_sqlite(element, compiler, **kw):
+    column, field = element.clauses
+    return f"json_extract({compiler.process(column, **kw)}, '$.{field.name}')"
+
+@compiles(option_field, 'postgresql')
+def _option_field_postgresql(element, compiler, **kw):
+    column, field = element.clauses
+    return f"({compiler.process(column, **kw)} ->> '{field.name}')"
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+class PoolMetrics:
+    """Connection pool wait times, overflow and timeout counts for this process"""
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self._recent_waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait: float, overflowed: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent_waits.append(wait)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def to_dict(self):
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            return {
+                'checkouts': self.checkouts,
+                'avg_checkout_wait_ms': 1000 * self.total_wait / self.checkouts if self.checkouts else 0.0,
+                'max_checkout_wait_ms': 1000 * self.max_wait,
+                'p95_checkout_wait_ms': 1000 * waits[min(int(0.95 * len(waits)), len(waits) - 1)] if waits else 0.0,
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts
+            }
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        overflow_before = self.overflow()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        overflowed = self.overflow() > overflow_before and self.overflow() > 0
+        pool_metrics.record_checkout(time.perf_counter() - started, overflowed)
+        return connection
+
+def build_engine_options(config, url=None) -> dict:
+    """SQLAlchemy engine options from Config pool settings (for the primary unless url is given)"""
+    url = make_url(url or config.SQLALCHEMY_DATABASE_URI)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite uses a single static connection; nothing to tune
+        return {}
+
+    if config.DB_PGBOUNCER_MODE:
+        # PgBouncer in transaction mode does the pooling; holding our own pool
+        # on top of it only pins server connections
+        return {'poolclass': NullPool, 'pool_pre_ping': config.DB_POOL_PRE_PING}
+
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+        'pool_recycle': config.DB_POOL_RECYCLE,
+        'pool_pre_ping': config.DB_POOL_PRE_PING
+    }
+    if url.get_backend_name() == 'postgresql' and config.DB_STATEMENT_TIMEOUT_MS:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(config.DB_STATEMENT_TIMEOUT_MS)}'}
+    return options
+
+def install_transaction_statement_timeout(engine, timeout_ms: int):
+    """
+    Apply statement_timeout per transaction with SET LOCAL.
+
+    PgBouncer transaction mode rejects startup options and would leak a
+    session-level SET to other clients, so the timeout is set inside each
+    transaction instead.
+    """
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(conn):
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+
+def pool_status(engine) -> dict:
+    """Current pool occupancy plus the process's checkout metrics"""
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    status.update(pool_metrics.to_dict())
+    return status
@@ -0,0 +1,155 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from config import Config
+from utils.db_pool import build_engine_options
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Seconds the replica is behind the primary; 0 when it has replayed
+# everything it received, so an idle primary does not look like lag
+POSTGRES_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def replica_binds(config) -> dict:
+    """SQLALCHEMY_BINDS entries (replica_0, replica_1, ...) for the configured replica URLs"""
+    urls = [url.strip() for url in (config.DATABASE_REPLICA_URLS or '').split(',') if url.strip()]
+    return {
+        f'{REPLICA_BIND_PREFIX}{i}': {'url': url, **build_engine_options(config, url)}
+        for i, url in enumerate(urls)
+    }
+
+def measure_lag(engine) -> float:
+    """Replication lag of a replica in seconds; backends without a lag signal report 0"""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as connection:
+        return float(connection.execute(POSTGRES_LAG_QUERY).scalar() or 0)
+
+class ReplicaHealth:
+    """
+    Cached lag checks per replica engine.
+    
+    Lag is measured at most once per check interval so routing a read costs
+    nothing extra; a replica that cannot be reached counts as unusable until
+    the next check.
+    """
+    
+    def __init__(self, max_lag_seconds: float, check_interval: float, clock=time.monotonic):
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.clock = clock
+        self._checks = {}
+        self._lock = threading.Lock()
+    
+    def is_usable(self, engine) -> bool:
+        lag = self.lag(engine)
+        return lag is not None and lag <= self.max_lag_seconds
+    
+    def lag(self, engine):
+        """Last measured lag in seconds, or None if the replica is unreachable"""
+        now = self.clock()
+        with self._lock:
+            check = self._checks.get(engine)
+            if check and now - check[1] < self.check_interval:
+                return check[0]
+        
+        try:
+            lag = measure_lag(engine)
+        except Exception as e:
+            print(f"Replica {engine.url.render_as_string(hide_password=True)} unavailable: {e}")
+            lag = None
+        
+        with self._lock:
+            self._checks[engine] = (lag, now)
+        return lag
+    
+    def clear(self):
+        with self._lock:
+            self._checks.clear()
+
+replica_health = ReplicaHealth(Config.REPLICA_MAX_LAG_SECONDS, Config.REPLICA_LAG_CHECK_SECONDS)
+
+_round_robin = itertools.count()
+
+def replica_engines(engines) -> list:
+    """Replica engines among an app's bound engines, in bind key order"""
+    return [
+        engines[key] for key in sorted(
+            key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)
+        )
+    ]
+
+def choose_replica(engines):
+    """Next usable replica engine in round-robin order, or None to use the primary"""
+    candidates = replica_engines(engines)
+    if not candidates:
+        return None
+    
+    start = next(_round_robin)
+    for i in range(len(candidates)):
+        engine = candidates[(start + i) % len(candidates)]
+        if replica_health.is_usable(engine):
+            return engine
+    return None
+
+def pin_to_primary():
+    """Send every remaining query in this request to the primary"""
+    if has_request_context():
+        g.db_pinned_primary = True
+
+def _replica_allowed() -> bool:
+    return has_request_context() and g.get('db_read_replica', False) and not g.get('db_pinned_primary', False)
+
+class RoutingSession(Session):
+    """
+    Session that sends reads from read-only endpoints to a replica.
+    
+    Anything outside a request (the scheduler, CLI scripts), any flush or DML
+    statement, and every query after a write in the same request use the
+    primary so a request always reads its own writes.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _replica_allowed():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                pin_to_primary()
+            else:
+                replica = choose_replica(self._db.engines)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_after_flush(session, flush_context):
+    pin_to_primary()
+
+def read_replica(fn):
+    """Route-level decorator: reads in this endpoint may be served by a replica"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = True
+        return fn(*args, **kwargs)
+    
+    return wrapper
+
+def replica_status(engines) -> list:
+    """Lag and usability of each configured replica"""
+    status = []
+    for engine in replica_engines(engines):
+        lag = replica_health.lag(engine)
+        status.append({
+            'url': engine.url.render_as_string(hide_password=True),
+            'lag_seconds': lag,
+            'usable': lag is not None and lag <= replica_health.max_lag_seconds
+        })
+    return status
@@ -0,0 +1,212 @@
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+the text exposition format at /metrics.
+
+Metrics live in process memory, so each gunicorn worker reports its own
+values. With METRICS_ENABLED off every update returns immediately and no
+request or database hooks are installed.
+"""
+import bisect
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Registry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = []
+    
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry(enabled=Config.METRICS_ENABLED)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+    
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items]
+
+class Gauge(Counter):
+    kind = 'gauge'
+    
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class _Timer:
+    """Context manager observing elapsed wall time into a histogram"""
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+_null_timer = _NullTimer()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+    
+    def time(self, **labels):
+        """Time a block: `with HISTOGRAM.time(step='login'): ...`"""
+        if not self.registry.enabled:
+            return _null_timer
+        return _Timer(self, labels)
+    
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        
+        lines = []
+        for key, (counts, total, value_sum) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", _format_value(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", "+Inf")])} {total}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(value_sum)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {total}')
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency',
+    ['blueprint', 'route', 'method', 'status']
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'Database statements executed per HTTP request',
+    ['blueprint', 'route'], buckets=(1, 2, 5, 10, 20, 50, 100, 250)
+)
+SCHEDULER_TICK_SECONDS = Histogram('scheduler_tick_duration_seconds', 'Duration of one booking scheduler tick')
+SCHEDULER_DUE_BOOKINGS = Gauge('scheduler_due_bookings', 'Bookings found due on the last scheduler tick')
+BOOKING_START_LAG_SECONDS = Histogram(
+    'booking_start_lag_seconds', 'Delay between a booking being due and its attempt starting',
+    ['attempt'], buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+)
+BOOKING_OUTCOMES = Counter('booking_attempts_total', 'Booking attempts by resulting status', ['status'])
+PLAYWRIGHT_STEP_SECONDS = Histogram('playwright_step_duration_seconds', 'Browser automation step duration', ['step'])
+EMAIL_SEND_SECONDS = Histogram('email_send_duration_seconds', 'SendGrid send latency', ['kind', 'outcome'])
+STATUS_WRITE_BATCH_SIZE = Histogram(
+    'status_write_batch_size', 'Booking status transitions per write-behind flush',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+SSE_CONNECTIONS = Gauge('sse_connections', 'Open booking status event streams')
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.metrics_queries = g.get('metrics_queries', 0) + 1
+
+def _route_labels():
+    rule = request.url_rule
+    return request.blueprint or 'app', rule.rule if rule else 'unmatched'
+
+def init_metrics(app):
+    """Install request/database hooks and the /metrics endpoint when metrics are enabled"""
+    if not registry.enabled:
+        return
+    
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+    
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+    
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            blueprint, route = _route_labels()
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                blueprint=blueprint, route=route, method=request.method, status=response.status_code
+            )
+            DB_QUERIES_PER_REQUEST.observe(g.get('metrics_queries', 0), blueprint=blueprint, route=route)
+        return response
+    
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,216 @@
+"""
+Schema pieces create_all cannot express, and in-place upgrades run by
+init_db after create_all.
+
+create_all only creates missing tables; columns and indexes added to
+existing tables, new enum values, column type changes and the booking
+search index are applied here. Every
+step checks the live schema first, so running it again is a no-op.
+"""
+from sqlalchemy import Enum, String, inspect, text
+from sqlalchemy.schema import CreateTable
+
+# Columns that held JSON as text before they became native JSON
+JSON_COLUMNS = {
+    'booking_requests': ('primary_option', 'backup_option'),
+    'booking_requests_archive': ('primary_option', 'backup_option'),
+}
+
+# Live table -> archive holding rows moved out with their ids (services/archive.py)
+ARCHIVE_TABLES = {'booking_requests': 'booking_requests_archive'}
+
+# SQLite: external-content FTS5 table over the admin search text columns.
+# The trigram tokenizer serves LIKE prefix and substring patterns from the
+# index; triggers keep it in step with booking_requests.
+SQLITE_SEARCH_TABLE = 'booking_search'
+SQLITE_SEARCH_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_SEARCH_TABLE} USING fts5(
+        origin, destination, result_message,
+        content='booking_requests', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS booking_search_insert AFTER INSERT ON booking_requests BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, origin, destination, result_message)
+        VALUES (new.id, new.origin, new.destination, new.result_message);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS booking_search_delete AFTER DELETE ON booking_requests BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE} ({SQLITE_SEARCH_TABLE}, rowid, origin, destination, result_message)
+        VALUES ('delete', old.id, old.origin, old.destination, old.result_message);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS booking_search_update
+    AFTER UPDATE OF origin, destination, result_message ON booking_requests BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE} ({SQLITE_SEARCH_TABLE}, rowid, origin, destination, result_message)
+        VALUES ('delete', old.id, old.origin, old.destination, old.result_message);
+        INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, origin, destination, result_message)
+        VALUES (new.id, new.origin, new.destination, new.result_message);
+    END""",
+)
+
+def create_search_index(target, connection, **kw):
+    """after_create hook for booking_requests: the SQLite FTS5 search table (PostgreSQL uses trigram indexes)"""
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {SQLITE_SEARCH_TABLE}')
+
+def create_trigram_extension(target, connection, **kw):
+    """before_create hook: pg_trgm backs the trigram GIN indexes on PostgreSQL"""
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+def convert_json_columns(engine):
+    """TEXT -> JSONB on PostgreSQL; SQLite's JSON type already reads the stored text"""
+    if engine.dialect.name != 'postgresql':
+        return
+    
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in JSON_COLUMNS.items():
+            types = {column['name']: column['type'] for column in inspector.get_columns(table)}
+            for column in columns:
+                if isinstance(types.get(column), String):
+                    print(f"Converting {table}.{column} to jsonb")
+                    connection.execute(text(
+                        f'ALTER TABLE {table} ALTER COLUMN {column} TYPE jsonb USING NULLIF({column}, \'\')::jsonb'
+                    ))
+
+class SchemaUpgradeError(Exception):
+    """The live schema could not be brought up to date in place"""
+
+def add_missing_columns(engine, metadata):
+    """ALTER TABLE ... ADD COLUMN for new columns of existing tables; NOT NULL columns need a server_default"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    ddl = engine.dialect.ddl_compiler(engine.dialect, None)
+    skipped = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    skipped.append(f'{table.name}.{column.name}')
+                    continue
+                print(f"Adding column {table.name}.{column.name}")
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl.get_column_specification(column)}'))
+    
+    if skipped:
+        raise SchemaUpgradeError(
+            f"Cannot add NOT NULL columns without a server_default in place: {', '.join(skipped)}; migrate them by hand"
+        )
+
+def add_missing_enum_values(engine, metadata):
+    """ALTER TYPE ... ADD VALUE for members added to a native PostgreSQL enum (e.g. a new BookingStatus)"""
+    if engine.dialect.name != 'postgresql':
+        return
+    
+    enums = {}
+    for table in metadata.sorted_tables:
+        for column in table.columns:
+            if isinstance(column.type, Enum) and column.type.native_enum:
+                enums[column.type.name] = column.type.enums
+    
+    with engine.begin() as connection:
+        for name, labels in enums.items():
+            existing = {row[0] for row in connection.execute(text(
+                'SELECT e.enumlabel FROM pg_enum e JOIN pg_type t ON t.oid = e.enumtypid WHERE t.typname = :name'
+            ), {'name': name})}
+            for label in labels:
+                # No labels at all: the type does not exist yet and create_all makes it whole
+                if existing and label not in existing:
+                    print(f"Adding value {label} to enum {name}")
+                    connection.execute(text(f"ALTER TYPE {name} ADD VALUE '{label}'"))
+
+def enable_sqlite_autoincrement(engine, metadata, archives: dict = None):
+    """
+    Rebuild SQLite tables declared with sqlite_autoincrement that were created
+    without it; SQLite cannot add AUTOINCREMENT in place. archives maps a
+    table to another one holding ids it gave out before (e.g. its archive),
+    so the sequence starts past those too. Indexes are recreated by
+    create_missing_indexes; the table's own after_create hooks run again.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    archives = archives or {}
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not table.dialect_options['sqlite']['autoincrement']:
+                continue
+            row = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+            ).first()
+            if row is None or 'AUTOINCREMENT' in row[0].upper():
+                continue
+            
+            print(f"Rebuilding {table.name} with AUTOINCREMENT")
+            rebuilt = f'{table.name}_rebuild'
+            columns = ', '.join(column.name for column in table.columns)
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            connection.exec_driver_sql(ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {rebuilt} ', 1))
+            connection.exec_driver_sql(f'INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}')
+            connection.exec_driver_sql(f'DROP TABLE {table.name}')
+            connection.exec_driver_sql(f'ALTER TABLE {rebuilt} RENAME TO {table.name}')
+            table.dispatch.after_create(table, connection)
+            
+            archive = archives.get(table.name)
+            if archive is not None:
+                connection.exec_driver_sql(f"DELETE FROM sqlite_sequence WHERE name = '{table.name}'")
+                connection.exec_driver_sql(
+                    f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table.name}', max("
+                    f"(SELECT coalesce(max(id), 0) FROM {table.name}), (SELECT coalesce(max(id), 0) FROM {archive}))"
+                )
+
+def index_names(connection) -> set:
+    """Names of existing indexes; reflection would skip expression indexes on SQLite"""
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")
+    elif connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql('SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()')
+    else:
+        inspector = inspect(connection)
+        return {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    return {row[0] for row in rows}
+
+def create_missing_indexes(engine, metadata):
+    with engine.begin() as connection:
+        create_trigram_extension(metadata, connection)
+        existing = index_names(connection)
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                # Skip indexes limited to another dialect with ddl_if
+                ddl_if = index._ddl_if
+                if ddl_if is not None and ddl_if.dialect not in (None, connection.dialect.name):
+                    continue
+                if index.name not in existing:
+                    print(f"Creating index {index.name}")
+                    index.create(connection)
+
+def create_missing_search_index(engine):
+    """Build the SQLite search table for a database created before it existed"""
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    with engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SQLITE_SEARCH_TABLE,)
+        ).first()
+        if not exists:
+            print(f"Creating and filling {SQLITE_SEARCH_TABLE}")
+            create_search_index(None, connection)
+            connection.exec_driver_sql(f"INSERT INTO {SQLITE_SEARCH_TABLE} ({SQLITE_SEARCH_TABLE}) VALUES ('rebuild')")
+
+def upgrade_schema(engine, metadata):
+    add_missing_columns(engine, metadata)
+    add_missing_enum_values(engine, metadata)
+    convert_json_columns(engine)
+    create_missing_search_index(engine)
+    # After the search table is filled (the rebuild keeps ids, so its rowids
+    # stay valid) and before indexes, which the rebuild drops
+    enable_sqlite_autoincrement(engine, metadata, ARCHIVE_TABLES)
+    create_missing_indexes(engine, metadata)
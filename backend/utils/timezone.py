@@ -0,0 +1,38 @@
+from datetime import date, datetime, time, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# DST policy, shared by every path that turns a local wall time into UTC:
+# - ambiguous times (clocks fall back) resolve to the first occurrence, i.e.
+#   daylight time
+# - non-existent times (clocks spring forward) are read with the offset in
+#   force before the gap, which moves them forward by the gap's length
+# Both are what zoneinfo does with fold=0, so the policy lives in one place.
+DST_FOLD = 0
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    """Return a cached ZoneInfo; raises ZoneInfoNotFoundError for unknown names"""
+    return ZoneInfo(name or 'UTC')
+
+def to_utc(local: datetime, tz_name: str) -> datetime:
+    """Convert a naive local wall time in tz_name to naive UTC"""
+    aware = local.replace(tzinfo=get_zone(tz_name), fold=DST_FOLD)
+    return aware.astimezone(timezone.utc).replace(tzinfo=None)
+
+@lru_cache(maxsize=65536)
+def local_midnight_utc(day: date, tz_name: str) -> datetime:
+    """Midnight at the start of `day` in tz_name, as naive UTC"""
+    return to_utc(datetime.combine(day, time(0, 0, 0)), tz_name)
+
+def batch_midnight_utc(pairs) -> list:
+    """
+    Compute local_midnight_utc for many (date, tz_name) pairs at once.
+
+    Bulk paths repeat the same few zones and dates many times over, so each
+    distinct pair is converted once and the results are fanned back out in
+    input order.
+    """
+    pairs = list(pairs)
+    resolved = {pair: local_midnight_utc(*pair) for pair in set(pairs)}
+    return [resolved[pair] for pair in pairs]
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import Navbar from '../components/Navbar';
-import { bookingAPI } from '../utils/api';
+import { bookingAPI, subscribeToBookingStatus } from '../utils/api';
 import { Plus, X } from 'lucide-react';
 
 const Bookings = () => {
@@ -18,8 +18,24 @@ const Bookings = () => {
 
   useEffect(() => {
     loadBookings();
+    return subscribeToBookingStatus(applyStatusEvent, loadBookings);
   }, []);
 
+  const applyStatusEvent = (event) => {
+    setBookings((current) => current.map((booking) => (
+      booking.id === event.booking_id
+        ? {
+            ...booking,
+            status: event.status,
+            result_message: event.message,
+            booking_reference: event.booking_reference || booking.booking_reference,
+            attempt_count: event.attempt_count,
+            executed_at: event.executed_at
+          }
+        : booking
+    )));
+  };
+
   const loadBookings = async () => {
     try {
       const response = await bookingAPI.getAll();
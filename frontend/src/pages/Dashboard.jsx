@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import Navbar from '../components/Navbar';
 import { useAuth } from '../context/AuthContext';
-import { bookingAPI, subscriptionAPI, userAPI } from '../utils/api';
+import { userAPI } from '../utils/api';
 import { Calendar, Clock, AlertCircle, CheckCircle, Plane } from 'lucide-react';
 
 const Dashboard = () => {
@@ -23,21 +23,15 @@ const Dashboard = () => {
 
   const loadDashboardData = async () => {
     try {
-      const [bookingsRes, subscriptionRes, credentialsRes] = await Promise.all([
-        bookingAPI.getAll(),
-        subscriptionAPI.getCurrent(),
-        userAPI.checkCredentials()
-      ]);
-
-      const bookings = bookingsRes.data.bookings;
-      setRecentBookings(bookings.slice(0, 5));
+      const { data } = await userAPI.getDashboard();
+      setRecentBookings(data.recent_bookings);
 
       setStats({
-        totalBookings: bookings.length,
-        pendingBookings: bookings.filter(b => b.status === 'pending').length,
-        successfulBookings: bookings.filter(b => b.status === 'success').length,
-        hasSubscription: subscriptionRes.data.subscription?.status === 'active',
-        hasCredentials: credentialsRes.data.has_credentials
+        totalBookings: data.counts.total,
+        pendingBookings: data.counts.pending,
+        successfulBookings: data.counts.success,
+        hasSubscription: data.subscription?.status === 'active',
+        hasCredentials: data.has_credentials
       });
     } catch (error) {
       console.error('Error loading dashboard:', error);
@@ -62,6 +62,7 @@ export const authAPI = {
 // User endpoints
 export const userAPI = {
   getProfile: () => api.get('/users/profile'),
+  getDashboard: () => api.get('/users/dashboard'),
   updateProfile: (data) => api.put('/users/profile', data),
   saveCredentials: (data) => api.post('/users/credentials', data),
   checkCredentials: () => api.get('/users/credentials'),
@@ -77,6 +78,63 @@ export const bookingAPI = {
   cancel: (id) => api.delete(`/bookings/${id}`),
 };
 
+// Live booking status over Server-Sent Events. EventSource cannot send an
+// Authorization header, so the access token goes in the query string.
+// Returns a function that closes the stream.
+export const subscribeToBookingStatus = (onStatus, onResync) => {
+  let source;
+  let retryTimer;
+  let closed = false;
+  let lastEventId = null;
+  let failures = 0;
+
+  // Event ids are publish times; replayed and live events can arrive out of
+  // order, so keep the newest
+  const track = (e) => {
+    if (e.lastEventId && (lastEventId === null || Number(e.lastEventId) > Number(lastEventId))) {
+      lastEventId = e.lastEventId;
+    }
+  };
+
+  const connect = () => {
+    const token = localStorage.getItem('access_token');
+    let url = `${API_URL}/bookings/events?token=${encodeURIComponent(token)}`;
+    // The server replays what was missed since this id, or sends resync
+    // when it no longer holds all of it
+    if (lastEventId !== null) {
+      url += `&last_event_id=${encodeURIComponent(lastEventId)}`;
+    }
+    source = new EventSource(url);
+    source.onopen = () => {
+      failures = 0;
+    };
+    source.addEventListener('ready', track);
+    source.addEventListener('status', (e) => {
+      track(e);
+      onStatus(JSON.parse(e.data));
+    });
+    source.addEventListener('resync', onResync);
+    source.onerror = () => {
+      // Reconnect by hand so a refreshed access token is used. Back off with
+      // jitter so clients dropped together (a deploy, a full server) do not
+      // all come back at once
+      source.close();
+      if (!closed) {
+        const delay = Math.min(3000 * 2 ** failures, 60000);
+        failures += 1;
+        retryTimer = setTimeout(connect, delay / 2 + Math.random() * (delay / 2));
+      }
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    source.close();
+  };
+};
+
 // Subscription endpoints
 export const subscriptionAPI = {
   getCurrent: () => api.get('/subscriptions'),